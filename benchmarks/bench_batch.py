@@ -0,0 +1,116 @@
+"""Compare running a Program once per record with running it as a batch.
+
+Runs the grade ladder of examples/string_interpolation.txt and a loop whose
+trip count differs per record (Collatz steps) over generated records, once
+with Program.run() per record and once with src.batch.run_batch() over all
+of them, and reports records per second. The per-record runs cover the first
+PER_RECORD_ROWS records, whose output and final variables must match the
+batch. Run from the repository root:
+
+    python -m benchmarks.bench_batch
+"""
+import io
+import random
+import time
+
+import numpy as np
+
+from src import compile
+from src.batch import run_batch
+
+ROWS = [10_000, 100_000, 1_000_000]
+PER_RECORD_ROWS = 10_000
+
+GRADES = """
+var grade = "F";
+if (score >= 90) {
+    grade = "A";
+} else {
+    if (score >= 80) {
+        grade = "B";
+    } else {
+        if (score >= 70) {
+            grade = "C";
+        }
+    }
+}
+var suffix = "";
+if (count != 1) {
+    suffix = "s";
+}
+print "I have ${count} ${item}${suffix}, grade ${grade}";
+"""
+
+COLLATZ = """
+var steps = 0;
+var n = start;
+while (n != 1) {
+    if ((n - (n / 2) * 2) == 0) { n = n / 2; } else { n = 3 * n + 1; }
+    steps = steps + 1;
+}
+"""
+
+
+def grade_inputs(rows, rng):
+    return {'score': np.array([rng.randrange(101) for _ in range(rows)]),
+            'count': np.array([rng.randrange(4) for _ in range(rows)]),
+            'item': [rng.choice(["apple", "pear", "plum"]) for _ in range(rows)]}
+
+
+def collatz_inputs(rows, rng):
+    return {'start': np.array([rng.randrange(1, 10_000) for _ in range(rows)])}
+
+
+CASES = [
+    ("grades", GRADES, ('score', 'count', 'item'), grade_inputs),
+    ("collatz", COLLATZ, ('start',), collatz_inputs),
+]
+
+
+def per_record(program, inputs, rows):
+    """Run the first rows records one at a time; return seconds, outputs, variables."""
+    records = [{name: column[row] for name, column in inputs.items()} for row in range(rows)]
+    records = [{name: value.item() if isinstance(value, np.generic) else value
+                for name, value in record.items()} for record in records]
+    outputs = []
+    variables = []
+    start = time.perf_counter()
+    for record in records:
+        output = io.StringIO()
+        variables.append(program.run(record, output))
+        outputs.append(output.getvalue())
+    return time.perf_counter() - start, outputs, variables
+
+
+def check(result, outputs, variables):
+    for row, (output, values) in enumerate(zip(outputs, variables)):
+        assert result['output'][row] == output, (row, result['output'][row], output)
+        for name, value in values.items():
+            batch_value = result['variables'][name][row]
+            if isinstance(batch_value, np.generic):
+                batch_value = batch_value.item()
+            assert type(batch_value) is type(value) and batch_value == value, (row, name)
+
+
+def main():
+    rng = random.Random(42)
+    print(f"{'case':<8} {'records':>9} {'per record rec/s':>17} {'batch rec/s':>12} "
+          f"{'speedup':>8} {'rows on VM':>11}")
+    for label, source, names, make_inputs in CASES:
+        program = compile(source, names)
+        for rows in ROWS:
+            inputs = make_inputs(rows, rng)
+            sampled = min(rows, PER_RECORD_ROWS)
+            elapsed, outputs, variables = per_record(program, inputs, sampled)
+            single_rate = sampled / elapsed
+
+            start = time.perf_counter()
+            result = run_batch(program, inputs)
+            batch_rate = rows / (time.perf_counter() - start)
+            check(result, outputs, variables)
+            print(f"{label:<8} {rows:>9} {single_rate:>17,.0f} {batch_rate:>12,.0f} "
+                  f"{batch_rate / single_rate:>7.1f}x {result['rows_on_vm']:>11}")
+
+
+if __name__ == "__main__":
+    main()
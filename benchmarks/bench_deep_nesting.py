@@ -0,0 +1,105 @@
+"""Stress the parser, compiler and interpreter with deeply nested and very
+wide programs.
+
+Each case is generated at several sizes and run through every stage: parsing,
+type inference and bytecode compilation, the VM and the AST interpreter. The
+time per node should stay flat as the size grows, and none of the stages may
+hit the recursion limit. The --optimize passes still recurse over the tree
+and are not covered. Run from the repository root:
+
+    python -m benchmarks.bench_deep_nesting
+"""
+import contextlib
+import io
+import sys
+import time
+
+from src.lexer import Lexer
+from src.parser import Parser
+from src.interpreter import Interpreter
+from src.bytecode import BytecodeCompiler, VirtualMachine
+from src.typeinfer import TypeInferencer
+
+SIZES = [1000, 10000, 100000]
+
+
+def nested_ifs(size):
+    return "var x = 1;\n" + "if (x > 0) {\n" * size + "print x;\n" + "}\n" * size
+
+
+def else_if_chain(size):
+    branches = " else ".join(f"if (x == {n}) print {n};" for n in range(size))
+    return f"var x = {size - 1};\n{branches}\n"
+
+
+def nested_whiles(size):
+    return "var x = 1;\n" + "while (x > 0) {\n" * size + "x = x - 1;\n" + "}\n" * size + "print x;\n"
+
+
+def nested_parens(size):
+    return "print " + "(" * size + "1" + " + 1)" * size + ";\n"
+
+
+def long_expression(size):
+    return "var x = 1;\nprint " + " + ".join(["x"] * size) + ";\n"
+
+
+def wide_program(size):
+    return "var x = 0;\n" + "x = x + 1;\n" * size + "print x;\n"
+
+
+CASES = [
+    ("nested ifs", nested_ifs),
+    ("else-if chain", else_if_chain),
+    ("nested whiles", nested_whiles),
+    ("nested parens", nested_parens),
+    ("long expression", long_expression),
+    ("wide program", wide_program),
+]
+
+
+def timed(run, *args):
+    start = time.perf_counter()
+    result = run(*args)
+    return result, time.perf_counter() - start
+
+
+def run_vm(bytecode):
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        VirtualMachine(bytecode).run()
+    return output.getvalue()
+
+
+def run_interpreter(tree):
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        Interpreter().interpret(tree)
+    return output.getvalue()
+
+
+def compile_tree(tree):
+    types = TypeInferencer().infer(tree)
+    return BytecodeCompiler(types=types).compile_ast(tree)
+
+
+def main():
+    print(f"recursion limit {sys.getrecursionlimit()}")
+    print(f"{'case':<16} {'size':>7} {'parse us/n':>11} {'compile us/n':>13} "
+          f"{'vm us/n':>9} {'interp us/n':>12}")
+    for label, make_program in CASES:
+        for size in SIZES:
+            source = make_program(size)
+            tree, parse_time = timed(lambda: Parser(Lexer(source)).parse())
+            bytecode, compile_time = timed(compile_tree, tree)
+            compiled, vm_time = timed(run_vm, bytecode)
+            interpreted, interpret_time = timed(run_interpreter, tree)
+            assert compiled == interpreted, label
+            per_node = [seconds / size * 1e6
+                        for seconds in (parse_time, compile_time, vm_time, interpret_time)]
+            print(f"{label:<16} {size:>7} {per_node[0]:>11.2f} {per_node[1]:>13.2f} "
+                  f"{per_node[2]:>9.2f} {per_node[3]:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Measure the cost of running a compiled Program many times.
+
+Compares compiling the source on every run with compiling it once and
+calling Program.run() repeatedly, for a short and a loop-heavy program, and
+then runs one Program from several threads at once with different inputs,
+checking that every run printed its own result. Run from the repository
+root:
+
+    python -m benchmarks.bench_embedding
+"""
+import io
+import threading
+import time
+
+from src import compile
+
+RUNS = 2000
+THREADS = 8
+
+CASES = [
+    ("short", 'var total = price * quantity; if (total > 100) { total = total - 10; } '
+              'print "total ${total}";'),
+    ("loop", 'var total = 0; var i = 0; while (i < quantity) { total = total + price; i = i + 1; } '
+             'print "total ${total}";'),
+]
+
+INPUTS = ('price', 'quantity')
+
+
+def recompile_each_run(source, runs):
+    output = io.StringIO()
+    start = time.perf_counter()
+    for run in range(runs):
+        compile(source, INPUTS).run({'price': run, 'quantity': 20}, output)
+    return time.perf_counter() - start
+
+
+def compile_once(source, runs):
+    output = io.StringIO()
+    start = time.perf_counter()
+    program = compile(source, INPUTS)
+    for run in range(runs):
+        program.run({'price': run, 'quantity': 20}, output)
+    return time.perf_counter() - start
+
+
+def run_threads(source):
+    program = compile(source, INPUTS)
+    outputs = [io.StringIO() for _ in range(THREADS)]
+
+    def worker(index):
+        for _ in range(RUNS // THREADS):
+            program.run({'price': index, 'quantity': 20}, outputs[index])
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(THREADS)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    # Every run must have printed the result for its own inputs
+    for index, output in enumerate(outputs):
+        expected = compile(source, INPUTS).run({'price': index, 'quantity': 20}, io.StringIO())
+        lines = set(output.getvalue().splitlines())
+        assert lines == {f"total {expected['total']}"}, (index, lines)
+    return elapsed
+
+
+def main():
+    print(f"{'case':<8} {'recompile us/run':>17} {'compile once us/run':>20} "
+          f"{'speedup':>8} {f'{THREADS} threads us/run':>18}")
+    for label, source in CASES:
+        recompile = recompile_each_run(source, RUNS) / RUNS * 1e6
+        once = compile_once(source, RUNS) / RUNS * 1e6
+        threaded = run_threads(source) / RUNS * 1e6
+        print(f"{label:<8} {recompile:>17.1f} {once:>20.1f} {recompile / once:>7.1f}x "
+              f"{threaded:>18.1f}")
+
+
+if __name__ == "__main__":
+    main()
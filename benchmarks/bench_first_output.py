@@ -0,0 +1,75 @@
+"""Measure the time to first output when a large program is piped in.
+
+Runs src/main.py on generated programs (see bench_streaming) in three ways:
+bytecode mode on the file, which parses and compiles everything before
+running; --stream on the file; and --stream reading the program from a pipe
+on stdin. Reports how long each takes to print the program's first line and
+to finish. Output is unbuffered in all three, so the first line is seen as
+soon as it is printed. Run from the repository root:
+
+    python -m benchmarks.bench_first_output
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.bench_streaming import make_source
+
+SIZES_MB = [1, 10]
+
+# Bytes written to the pipe at a time
+PIPE_CHUNK = 65536
+
+RUNS = [
+    ("bytecode", ['{path}'], False),
+    ("stream file", ['{path}', '--stream'], False),
+    ("stream stdin", ['-', '--stream'], True),
+]
+
+
+def feed(pipe, source):
+    data = source.encode()
+    for start in range(0, len(data), PIPE_CHUNK):
+        pipe.write(data[start:start + PIPE_CHUNK])
+    pipe.close()
+
+
+def measure(args, source, piped):
+    """Return (seconds to the first line of program output, total seconds)."""
+    env = dict(os.environ, PYTHONUNBUFFERED='1')
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, '-m', 'src.main'] + args, env=env,
+                               stdin=subprocess.PIPE if piped else subprocess.DEVNULL,
+                               stdout=subprocess.PIPE)
+    if piped:
+        threading.Thread(target=feed, args=(process.stdin, source), daemon=True).start()
+    first = None
+    for line in process.stdout:
+        if first is None and not line.startswith(b"Running"):
+            first = time.perf_counter() - start
+    process.wait()
+    if process.returncode != 0:
+        raise Exception(f"{args} exited with {process.returncode}")
+    return first, time.perf_counter() - start
+
+
+def main():
+    print(f"{'source MB':>9} {'run':<13} {'first output s':>15} {'total s':>9}")
+    for size in SIZES_MB:
+        source = make_source(size * 1024 * 1024)
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as f:
+            f.write(source)
+        try:
+            for label, args, piped in RUNS:
+                args = [arg.format(path=f.name) for arg in args]
+                first, total = measure(args, source, piped)
+                print(f"{size:>9} {label:<13} {first:>15.3f} {total:>9.2f}")
+        finally:
+            os.unlink(f.name)
+
+
+if __name__ == "__main__":
+    main()
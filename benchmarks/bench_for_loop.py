@@ -0,0 +1,96 @@
+"""Compare the loop overhead of while loops and for loops.
+
+The same sum is computed with a while loop that steps its counter by hand
+and with a for loop. The instructions the VM dispatches per iteration are
+counted with hooks, as the difference between two runs of different
+lengths, and then each loop is timed on the VM, on the VM with quickening
+and on the AST interpreter. Run from the repository root:
+
+    python -m benchmarks.bench_for_loop
+"""
+import contextlib
+import io
+import time
+
+from src.lexer import Lexer
+from src.parser import Parser
+from src.bytecode import BytecodeCompiler, VirtualMachine
+from src.interpreter import Interpreter
+from src.hooks import Hooks, Counters
+
+ITERATIONS = 200_000
+REPEATS = 3
+
+WHILE_LOOP = """
+var total = 0;
+var i = 1;
+while (i <= {n}) {{
+    total = total + i;
+    i = i + 1;
+}}
+print total;
+"""
+
+FOR_LOOP = """
+var total = 0;
+for (i in 1..{n}) {{
+    total = total + i;
+}}
+print total;
+"""
+
+
+def parse(source, n):
+    return Parser(Lexer(source.format(n=n))).parse()
+
+
+def dispatches_per_iteration(source):
+    counts = []
+    for n in (1000, 2000):
+        hooks = Hooks()
+        counters = Counters(hooks)
+        VirtualMachine(BytecodeCompiler().compile_ast(parse(source, n)),
+                       output=io.StringIO(), hooks=hooks).run()
+        counts.append(sum(counters.instructions.values()))
+    return (counts[1] - counts[0]) / 1000
+
+
+def run_vm(tree, quicken=False):
+    vm = VirtualMachine(BytecodeCompiler().compile_ast(tree), quicken=quicken, output=io.StringIO())
+    vm.run()
+    return vm.output.getvalue()
+
+
+def run_interpreter(tree):
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        Interpreter().interpret(tree)
+    return output.getvalue()
+
+
+def best_time(run, tree):
+    best = None
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        output = run(tree)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, output
+
+
+def main():
+    print(f"VM instructions per iteration: while {dispatches_per_iteration(WHILE_LOOP):.0f}, "
+          f"for {dispatches_per_iteration(FOR_LOOP):.0f}\n")
+    engines = (("vm", run_vm), ("vm quickened", lambda tree: run_vm(tree, quicken=True)),
+               ("interpreter", run_interpreter))
+    print(f"{'engine':<14} {'while ns/iter':>14} {'for ns/iter':>12} {'speedup':>8}")
+    for label, run in engines:
+        while_time, while_output = best_time(run, parse(WHILE_LOOP, ITERATIONS))
+        for_time, for_output = best_time(run, parse(FOR_LOOP, ITERATIONS))
+        assert while_output == for_output
+        print(f"{label:<14} {while_time / ITERATIONS * 1e9:>14.0f} "
+              f"{for_time / ITERATIONS * 1e9:>12.0f} {while_time / for_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Measure what instrumentation hooks cost.
+
+Runs a counting loop on the VM and on the AST interpreter without hooks,
+with a Hooks that has no callbacks, and with the Counters and Latencies
+collectors attached. Without hooks the usual run loops are used, so that
+column is the speed of an uninstrumented run. Run from the repository root:
+
+    python -m benchmarks.bench_hooks
+"""
+import contextlib
+import io
+import time
+
+from src.lexer import Lexer
+from src.parser import Parser
+from src.bytecode import BytecodeCompiler, VirtualMachine
+from src.interpreter import Interpreter
+from src.hooks import Hooks, Counters, Latencies
+
+REPEATS = 5
+
+SOURCE = """
+var i = 0;
+var total = 0;
+while (i < 20000) {
+    if (i < 10000) {
+        total = total + i;
+    } else {
+        total = total - 1;
+    }
+    i = i + 1;
+}
+print total;
+"""
+
+
+def run_vm(tree, hooks):
+    vm = VirtualMachine(BytecodeCompiler().compile_ast(tree), output=io.StringIO(), hooks=hooks)
+    vm.run()
+    return vm.output.getvalue()
+
+
+def run_interpreter(tree, hooks):
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        Interpreter(hooks).interpret(tree)
+    return output.getvalue()
+
+
+def collected():
+    hooks = Hooks()
+    Counters(hooks)
+    Latencies(hooks)
+    return hooks
+
+
+def best_time(run, tree, make_hooks):
+    best = None
+    for _ in range(REPEATS):
+        hooks = make_hooks()
+        start = time.perf_counter()
+        output = run(tree, hooks)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, output
+
+
+def main():
+    tree = Parser(Lexer(SOURCE)).parse()
+    print(f"{'engine':<12} {'no hooks ms':>12} {'empty hooks ms':>15} {'collectors ms':>14} {'overhead':>9}")
+    for label, run in (("vm", run_vm), ("interpreter", run_interpreter)):
+        plain, output = best_time(run, tree, lambda: None)
+        empty, empty_output = best_time(run, tree, Hooks)
+        full, full_output = best_time(run, tree, collected)
+        assert output == empty_output == full_output
+        print(f"{label:<12} {plain * 1e3:>12.1f} {empty * 1e3:>15.1f} {full * 1e3:>14.1f} "
+              f"{full / plain:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
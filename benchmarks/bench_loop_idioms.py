@@ -0,0 +1,70 @@
+"""Benchmark closed-form execution of recognized counting loops.
+
+Times each synthetic loop on the VM with and without the optimizer. The
+unoptimized loop is only run up to MAX_MEASURED iterations; beyond that its
+time is extrapolated from the per-iteration cost (marked with ~). Run from
+the repository root:
+
+    python -m benchmarks.bench_loop_idioms
+"""
+import time
+
+from src.lexer import Lexer
+from src.parser import Parser
+from src.bytecode import BytecodeCompiler, VirtualMachine
+from src.optimizer import optimize
+
+MAX_MEASURED = 10 ** 5
+
+# (label, program template, iteration counts)
+CASES = [
+    ("sum of i", """
+        var n = {n}; var i = 1; var sum = 0;
+        while (i <= n) {{ sum = sum + i; i = i + 1; }}
+        """, (10 ** 3, 10 ** 5, 10 ** 6, 10 ** 8)),
+    ("strided count", """
+        var n = {n} * 3; var i = 0; var count = 0; var total = 7;
+        while (i < n) {{ count = count + 1; total = total - 2; i = i + 3; }}
+        """, (10 ** 3, 10 ** 5, 10 ** 6, 10 ** 8)),
+    ("countdown sum", """
+        var i = {n}; var sum = 0;
+        while (i > 0) {{ sum = sum + i; i = i - 1; }}
+        """, (10 ** 3, 10 ** 5, 10 ** 6, 10 ** 8)),
+    ("factorial", """
+        var n = {n}; var i = 1; var factorial = 1;
+        while (i <= n) {{ factorial = factorial * i; i = i + 1; }}
+        """, (10 ** 2, 10 ** 3, 10 ** 4)),
+]
+
+
+def run(source, optimized):
+    tree = Parser(Lexer(source)).parse()
+    if optimized:
+        tree = optimize(tree)
+    vm = VirtualMachine(BytecodeCompiler().compile_ast(tree))
+    start = time.perf_counter()
+    vm.run()
+    return time.perf_counter() - start, vm.variables
+
+
+def main():
+    print(f"{'case':<16} {'iterations':>12} {'loop s':>12} {'closed form s':>14} {'speedup':>12}")
+    for label, template, sizes in CASES:
+        per_iteration = None
+        for n in sizes:
+            source = template.format(n=n)
+            optimized_time, optimized_vars = run(source, optimized=True)
+            if n <= MAX_MEASURED:
+                loop_time, loop_vars = run(source, optimized=False)
+                assert loop_vars == optimized_vars, label
+                per_iteration = loop_time / n
+                loop_label = f"{loop_time:.6f}"
+            else:
+                loop_time = per_iteration * n
+                loop_label = f"~{loop_time:.2f}"
+            print(f"{label:<16} {n:>12} {loop_label:>12} {optimized_time:>14.6f} "
+                  f"{loop_time / optimized_time:>11.0f}x")
+
+
+if __name__ == "__main__":
+    main()
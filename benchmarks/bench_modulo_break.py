@@ -0,0 +1,137 @@
+"""Measure what % and break/continue save in the example programs.
+
+examples/fizzbuzz.txt and examples/primes.txt used to test divisibility
+with (num / divisor) * divisor == num, and primes.txt left its inner loop
+by setting the divisor past the bound. Both old programs are kept here and
+compared with the rewritten examples, which use %, break and for loops.
+First the instructions the VM executes are counted with hooks at the
+examples' own limits (checking the output is the same), then both versions
+are timed at larger limits on the VM, on the VM with quickening and on the
+AST interpreter. Run from the repository root:
+
+    python -m benchmarks.bench_modulo_break
+"""
+import contextlib
+import io
+import time
+
+from src.lexer import Lexer
+from src.parser import Parser
+from src.bytecode import BytecodeCompiler, VirtualMachine
+from src.interpreter import Interpreter
+from src.hooks import Hooks, Counters
+
+REPEATS = 3
+
+OLD_FIZZBUZZ = """
+var i = 1;
+while (i <= {limit}) {{
+    var div3 = (i / 3) * 3 == i;
+    var div5 = (i / 5) * 5 == i;
+    if (div3 == 1) {{
+        if (div5 == 1) {{
+            print "FizzBuzz";
+        }} else {{
+            print "Fizz";
+        }}
+    }} else {{
+        if (div5 == 1) {{
+            print "Buzz";
+        }} else {{
+            print i;
+        }}
+    }}
+    i = i + 1;
+}}
+"""
+
+OLD_PRIMES = """
+print "Prime numbers up to {limit}:";
+var num = 2;
+while (num <= {limit}) {{
+    var isPrime = 1;
+    var divisor = 2;
+    while (divisor < num) {{
+        if ((num / divisor) * divisor == num) {{
+            isPrime = 0;
+            divisor = num;
+        }}
+        divisor = divisor + 1;
+    }}
+    if (isPrime == 1) {{
+        print num;
+    }}
+    num = num + 1;
+}}
+"""
+
+# (name, old program, example file, the example's limit, limit to time at)
+PROGRAMS = [
+    ("fizzbuzz", OLD_FIZZBUZZ, "examples/fizzbuzz.txt", 20, 50_000),
+    ("primes", OLD_PRIMES, "examples/primes.txt", 50, 1_500),
+]
+
+
+def scaled(path, limit, example_limit):
+    """The example program with its limit replaced."""
+    with open(path) as f:
+        return f.read().replace(str(example_limit), str(limit))
+
+
+def compile_source(source):
+    return BytecodeCompiler().compile_ast(Parser(Lexer(source)).parse())
+
+
+def executed_instructions(source):
+    hooks = Hooks()
+    counters = Counters(hooks)
+    vm = VirtualMachine(compile_source(source), output=io.StringIO(), hooks=hooks)
+    vm.run()
+    return sum(counters.instructions.values()), vm.output.getvalue()
+
+
+def run_vm(source, quicken=False):
+    vm = VirtualMachine(compile_source(source), quicken=quicken, output=io.StringIO())
+    vm.run()
+    return vm.output.getvalue()
+
+
+def run_interpreter(source):
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        Interpreter().interpret(Parser(Lexer(source)).parse())
+    return output.getvalue()
+
+
+def best_time(run, source):
+    best = None
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        output = run(source)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, output
+
+
+def main():
+    print(f"{'program':<10} {'old instructions':>17} {'new instructions':>17} {'reduction':>10}")
+    for name, old, path, example_limit, _ in PROGRAMS:
+        old_count, old_output = executed_instructions(old.format(limit=example_limit))
+        new_count, new_output = executed_instructions(scaled(path, example_limit, example_limit))
+        assert old_output == new_output
+        print(f"{name:<10} {old_count:>17} {new_count:>17} {1 - new_count / old_count:>9.0%}")
+
+    engines = (("vm", run_vm), ("vm quickened", lambda source: run_vm(source, quicken=True)),
+               ("interpreter", run_interpreter))
+    print(f"\n{'program':<10} {'limit':>7} {'engine':<14} {'old s':>8} {'new s':>8} {'speedup':>8}")
+    for name, old, path, example_limit, limit in PROGRAMS:
+        for label, run in engines:
+            old_time, old_output = best_time(run, old.format(limit=limit))
+            new_time, new_output = best_time(run, scaled(path, limit, example_limit))
+            assert old_output == new_output
+            print(f"{name:<10} {limit:>7} {label:<14} {old_time:>8.3f} {new_time:>8.3f} "
+                  f"{old_time / new_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
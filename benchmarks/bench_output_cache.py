@@ -0,0 +1,49 @@
+"""Compare running each example program with replaying its cached output.
+
+Every program in examples/ is run once to fill an OutputCache and then served
+REPEATS times from it, in memory and from a directory on disk. The replayed
+output must equal the output of the run. Run from the repository root:
+
+    python -m benchmarks.bench_output_cache
+"""
+import os
+import tempfile
+import time
+
+from src.output_cache import OutputCache
+
+REPEATS = 100
+
+
+def measure(cache, source):
+    start = time.perf_counter()
+    output, status, hit = cache.run(source)
+    run_time = time.perf_counter() - start
+    assert not hit
+
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        replayed, replayed_status, hit = cache.run(source)
+        assert hit and (replayed, replayed_status) == (output, status)
+    return run_time, (time.perf_counter() - start) / REPEATS
+
+
+def main():
+    print(f"{'example':<26} {'run ms':>9} {'memory hit ms':>14} {'disk hit ms':>12} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as directory:
+        memory = OutputCache()
+        disk = OutputCache(directory)
+        for name in sorted(os.listdir('examples')):
+            with open(os.path.join('examples', name)) as f:
+                source = f.read()
+            run_time, memory_hit = measure(memory, source)
+            _, disk_hit = measure(disk, source)
+            print(f"{name:<26} {run_time * 1e3:>9.2f} {memory_hit * 1e3:>14.3f} "
+                  f"{disk_hit * 1e3:>12.3f} {run_time / disk_hit:>7.0f}x")
+        report = disk.report()
+        print(f"\ndisk cache: {report['hits']} hits, {report['misses']} misses, "
+              f"{report['entries']} entries, {report['bytes']} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Benchmark quickening (type-specialized instructions) per opcode.
+
+Each case runs a loop that executes one binary operation per iteration,
+with and without quickening, and reports the time per loop iteration. The
+loop's own counter compare and increment are quickened as well. Run from
+the repository root:
+
+    python -m benchmarks.bench_quickening
+"""
+import time
+
+from src.lexer import Lexer
+from src.parser import Parser
+from src.bytecode import BytecodeCompiler, VirtualMachine
+
+ITERATIONS = 100000
+
+# (label, left literal, operator, right literal)
+CASES = [
+    ("ADD int", "7", "+", "3"),
+    ("ADD float", "7.5", "+", "3.25"),
+    ("ADD string", '"ab"', "+", '"cd"'),
+    ("SUBTRACT int", "7", "-", "3"),
+    ("MULTIPLY int", "7", "*", "3"),
+    ("MULTIPLY float", "7.5", "*", "3.25"),
+    ("DIVIDE int/int", "7", "/", "3"),
+    ("DIVIDE float", "7.5", "/", "3.25"),
+    ("EQUALS int", "7", "==", "3"),
+    ("LESS_THAN int", "7", "<", "3"),
+    ("GREATER_EQUAL int", "7", ">=", "3"),
+]
+
+
+def make_program(expression):
+    return f"""
+    var a = {expression[0]};
+    var b = {expression[1]};
+    var r = a;
+    var i = 0;
+    while (i < {ITERATIONS}) {{
+        r = {expression[2]};
+        i = i + 1;
+    }}
+    """
+
+
+def timed_run(source, quicken, repeat=3):
+    best = None
+    vm = None
+    for _ in range(repeat):
+        bytecode = BytecodeCompiler().compile_ast(Parser(Lexer(source)).parse())
+        vm = VirtualMachine(bytecode, quicken=quicken)
+        start = time.perf_counter()
+        vm.run()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, vm
+
+
+def main():
+    print(f"{'case':<20} {'generic ns/iter':>16} {'quickened ns/iter':>18} {'speedup':>8}")
+    report = {}
+    for label, left, op, right in CASES:
+        source = make_program((left, right, f"a {op} b"))
+        generic, _ = timed_run(source, quicken=False)
+        quickened, vm = timed_run(source, quicken=True)
+        generic_ns = generic / ITERATIONS * 1e9
+        quickened_ns = quickened / ITERATIONS * 1e9
+        print(f"{label:<20} {generic_ns:>16.1f} {quickened_ns:>18.1f} {generic / quickened:>7.2f}x")
+        for name, stats in vm.specialization_report().items():
+            totals = report.setdefault(name, {'specialized': 0, 'failed': 0, 'deoptimized': 0})
+            for key in totals:
+                totals[key] += stats[key]
+
+    print()
+    print(f"{'opcode':<16} {'specialized':>12} {'failed':>8} {'deoptimized':>12}")
+    for name, stats in sorted(report.items()):
+        print(f"{name:<16} {stats['specialized']:>12} {stats['failed']:>8} {stats['deoptimized']:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Measure building long strings by repeated appending.
+
+Runs a loop doing `s = s + "..."` until the string reaches each size, on the
+VM and on the AST interpreter, with ropes (src/rope.py) and with plain string
+copies (ROPE_MIN_LENGTH raised above every size). Copying is quadratic, so it
+is only timed up to COPY_MAX_SIZE. Each run compares the finished string
+with a copy that has one more character and prints the number of pieces, so
+the string is joined once at the end. Run from the repository root:
+
+    python -m benchmarks.bench_ropes
+"""
+import contextlib
+import io
+import time
+
+from src import bytecode, interpreter
+from src.lexer import Lexer
+from src.parser import Parser
+from src.bytecode import BytecodeCompiler, VirtualMachine
+from src.interpreter import Interpreter
+
+SIZES = [256 * 1024, 1024 * 1024, 4 * 1024 * 1024, 16 * 1024 * 1024]
+COPY_MAX_SIZE = 1024 * 1024
+
+PIECE = "0123456789abcdef"
+
+SOURCE = """
+var report = "";
+var i = 0;
+while (i < {count}) {{
+    report = report + "{piece}";
+    i = i + 1;
+}}
+var done = report + "!";
+if (done != report) {{
+    print "${{i}} pieces";
+}}
+"""
+
+
+def run_vm(source):
+    tree = Parser(Lexer(source)).parse()
+    vm = VirtualMachine(BytecodeCompiler().compile_ast(tree), output=io.StringIO())
+    vm.run()
+    return vm.output.getvalue()
+
+
+def run_interpreter(source):
+    tree = Parser(Lexer(source)).parse()
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        Interpreter().interpret(tree)
+    return output.getvalue()
+
+
+def timed(run, source, ropes):
+    limit = bytecode.ROPE_MIN_LENGTH
+    if not ropes:
+        bytecode.ROPE_MIN_LENGTH = interpreter.ROPE_MIN_LENGTH = float('inf')
+    try:
+        start = time.perf_counter()
+        output = run(source)
+        return time.perf_counter() - start, output
+    finally:
+        bytecode.ROPE_MIN_LENGTH = interpreter.ROPE_MIN_LENGTH = limit
+
+
+def main():
+    print(f"{'size KB':>8} {'engine':<12} {'copying s':>10} {'ropes s':>8} {'speedup':>8}")
+    for size in SIZES:
+        source = SOURCE.format(count=size // len(PIECE), piece=PIECE)
+        for label, run in (("vm", run_vm), ("interpreter", run_interpreter)):
+            rope_time, output = timed(run, source, True)
+            assert output == f"{size // len(PIECE)} pieces\n", output
+            if size <= COPY_MAX_SIZE:
+                copy_time, copy_output = timed(run, source, False)
+                assert copy_output == output
+                print(f"{size // 1024:>8} {label:<12} {copy_time:>10.2f} {rope_time:>8.2f} "
+                      f"{copy_time / rope_time:>7.1f}x")
+            else:
+                print(f"{size // 1024:>8} {label:<12} {'-':>10} {rope_time:>8.2f} {'-':>8}")
+
+
+if __name__ == "__main__":
+    main()
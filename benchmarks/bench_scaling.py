@@ -0,0 +1,117 @@
+"""Report how each pipeline stage scales with the size of the program.
+
+Generates programs of growing size with benchmarks/workload.py (same seed
+and settings at every size) and times each stage on them: the lexer alone,
+the parser (which lexes as it goes), type inference, bytecode compilation
+and the VM run. For every stage the growth exponent between successive
+sizes is printed, with the exponent of a log-log fit over the whole sweep:
+1 is linear, and a stage whose fitted exponent is above SUPER_LINEAR is
+flagged. Run from the repository root:
+
+    python -m benchmarks.bench_scaling
+    python -m benchmarks.bench_scaling --sizes 1000 10000 100000 --depth 2
+    python -m benchmarks.bench_scaling --mb --sizes 0.5 1 2 4
+
+Sizes are numbers of statements, or of megabytes with --mb; the other
+options are the generator's (see python -m benchmarks.workload --help).
+"""
+import argparse
+import io
+import math
+import time
+
+from src.lexer import Lexer
+from src.parser import Parser
+from src.typeinfer import TypeInferencer
+from src.bytecode import BytecodeCompiler, VirtualMachine
+from benchmarks.workload import WorkloadGenerator, add_arguments, generator_settings
+
+DEFAULT_SIZES = [1000, 2000, 4000, 8000, 16000, 32000]
+REPEATS = 2
+
+# Fitted exponents above this are reported as super-linear; timings of the
+# smallest sizes are noisy, so exactly 1 is not expected
+SUPER_LINEAR = 1.25
+
+STAGES = ['lex', 'parse', 'types', 'compile', 'vm']
+
+
+def lex(source):
+    lexer = Lexer(source)
+    while lexer.get_next_token().type != 'EOF':
+        pass
+
+
+def best_time(function, *args):
+    best = None
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        result = function(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def measure(source):
+    """Seconds each stage takes on source."""
+    times = {}
+    times['lex'], _ = best_time(lex, source)
+    times['parse'], tree = best_time(lambda: Parser(Lexer(source)).parse())
+    times['types'], types = best_time(lambda: TypeInferencer().infer(tree))
+    times['compile'], bytecode = best_time(lambda: BytecodeCompiler(types=types).compile_ast(tree))
+    vm = VirtualMachine(bytecode, output=io.StringIO())
+    start = time.perf_counter()
+    vm.run()
+    times['vm'] = time.perf_counter() - start
+    return times
+
+
+def exponent(sizes, times):
+    """Slope of the least-squares line through (log size, log time)."""
+    xs = [math.log(size) for size in sizes]
+    ys = [math.log(max(elapsed, 1e-9)) for elapsed in times]
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    return (sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys))
+            / sum((x - mean_x) ** 2 for x in xs))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time each pipeline stage over a sweep of sizes.")
+    parser.add_argument('--sizes', type=float, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--mb', action='store_true', help="sizes are megabytes of source")
+    add_arguments(parser, size=False)
+    args = parser.parse_args()
+    settings = generator_settings(args)
+
+    results = []
+    print(f"{'statements':>10} {'KB':>8} " + " ".join(f"{stage + ' ms':>11}" for stage in STAGES))
+    for size in args.sizes:
+        if args.mb:
+            generator = WorkloadGenerator(size_mb=size, **settings)
+        else:
+            generator = WorkloadGenerator(statements=int(size), **settings)
+        source = generator.generate()
+        statements = generator.generated
+        times = measure(source)
+        results.append((statements, times))
+        print(f"{statements:>10} {len(source) / 1024:>8.0f} "
+              + " ".join(f"{times[stage] * 1e3:>11.1f}" for stage in STAGES))
+
+    if len(results) < 2:
+        return
+    print("\nGrowth exponent between successive sizes (1 is linear):")
+    for stage in STAGES:
+        steps = []
+        for (smaller, before), (larger, after) in zip(results, results[1:]):
+            steps.append(math.log(max(after[stage], 1e-9) / max(before[stage], 1e-9))
+                         / math.log(larger / smaller))
+        fitted = exponent([statements for statements, _ in results],
+                          [times[stage] for _, times in results])
+        flag = "  super-linear" if fitted > SUPER_LINEAR else ""
+        print(f"{stage:<8} " + " ".join(f"{step:>5.2f}" for step in steps)
+              + f"   fitted {fitted:.2f}{flag}")
+
+
+if __name__ == "__main__":
+    main()
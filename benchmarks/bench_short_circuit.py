@@ -0,0 +1,104 @@
+"""Benchmark short-circuit evaluation of && and || in condition-heavy loops.
+
+Each case runs a loop whose body tests a guarded condition. It is timed with
+the short-circuit code of both backends and with eager evaluation, where both
+operands are always evaluated (the old behaviour, kept here as a subclass of
+each backend). Run from the repository root:
+
+    python -m benchmarks.bench_short_circuit
+"""
+import contextlib
+import io
+import time
+
+from src.lexer import Lexer
+from src.parser import Parser
+from src.interpreter import Interpreter
+from src.bytecode import BytecodeCompiler, VirtualMachine, OpCode
+
+ITERATIONS = 20000
+
+# (label, condition tested on every iteration); count is 0 and odd is true
+# on every other iteration, so the guards decide the result most of the time
+CASES = [
+    ("guard false &&", "(count > 0) && ((i * i + i * 3 - 7) / 5 > i)"),
+    ("guard true ||", "(i > -1) || ((i * i + i * 3 - 7) / 5 > i)"),
+    ("alternating &&", "odd && ((i * i + i * 3 - 7) / 5 > i)"),
+    ("chained &&", "(count > 0) && (i > 2) && (i < 5) && (i != 3)"),
+    ("chained ||", "(i > -1) || (i < -5) || (i == 3) || (count > 1)"),
+]
+
+
+class EagerCompiler(BytecodeCompiler):
+    def compile_short_circuit(self, node):
+        yield node.left
+        yield node.right
+        self.emit(OpCode.AND if node.op.type == 'AND' else OpCode.OR)
+
+
+class EagerInterpreter(Interpreter):
+    def visit_BinOp(self, node):
+        if node.op.type == 'AND':
+            left = yield node.left
+            right = yield node.right
+            return left and right
+        if node.op.type == 'OR':
+            left = yield node.left
+            right = yield node.right
+            return left or right
+        return (yield from super().visit_BinOp(node))
+
+
+def make_program(condition):
+    return f"""
+    var count = 0;
+    var hits = 0;
+    var odd = false;
+    var i = 0;
+    while (i < {ITERATIONS}) {{
+        if ({condition}) {{ hits = hits + 1; }}
+        odd = !odd;
+        i = i + 1;
+    }}
+    print hits;
+    """
+
+
+def run_vm(source, compiler_class):
+    vm = VirtualMachine(compiler_class().compile_ast(Parser(Lexer(source)).parse()))
+    start = time.perf_counter()
+    vm.run()
+    return time.perf_counter() - start
+
+
+def run_interpreter(source, interpreter_class):
+    tree = Parser(Lexer(source)).parse()
+    start = time.perf_counter()
+    interpreter_class().interpret(tree)
+    return time.perf_counter() - start
+
+
+def best_of(run, *args, repeat=3):
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        best = min(run(*args) for _ in range(repeat))
+    return best, output.getvalue()
+
+
+def main():
+    print(f"{'case':<16} {'backend':<12} {'eager ns/iter':>14} {'short ns/iter':>14} {'speedup':>8}")
+    for label, condition in CASES:
+        source = make_program(condition)
+        for backend, run, eager_class, lazy_class in (
+                ("vm", run_vm, EagerCompiler, BytecodeCompiler),
+                ("interpreter", run_interpreter, EagerInterpreter, Interpreter)):
+            eager, eager_output = best_of(run, source, eager_class)
+            lazy, lazy_output = best_of(run, source, lazy_class)
+            assert eager_output == lazy_output, label
+            eager_ns = eager / ITERATIONS * 1e9
+            lazy_ns = lazy / ITERATIONS * 1e9
+            print(f"{label:<16} {backend:<12} {eager_ns:>14.1f} {lazy_ns:>14.1f} {eager / lazy:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
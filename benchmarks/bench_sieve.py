@@ -0,0 +1,119 @@
+"""Compare finding primes with and without arrays.
+
+Counts the primes up to each limit on the VM twice: by trial division, the
+approach examples/primes.txt had to take without arrays (quadratic in the
+limit), and with a sieve of Eratosthenes on an array. The sieve then runs
+alone up to larger limits. Last, sum() and fill() on a large array are
+timed against the same work written as a loop in the language, and the size
+of the typed buffer is compared with a Python list of the same numbers.
+Run from the repository root:
+
+    python -m benchmarks.bench_sieve
+"""
+import io
+import sys
+import time
+
+from src.lexer import Lexer
+from src.parser import Parser
+from src.bytecode import BytecodeCompiler, VirtualMachine
+from src.arrays import new_array
+
+COMPARED_LIMITS = [1000, 2000, 4000]
+SIEVE_LIMITS = [20_000, 200_000]
+BULK_SIZE = 200_000
+
+TRIAL_DIVISION = """
+var count = 0;
+var num = 2;
+while (num <= {limit}) {{
+    var isPrime = 1;
+    var divisor = 2;
+    while (divisor < num) {{
+        if ((num / divisor) * divisor == num) {{
+            isPrime = 0;
+            divisor = num;
+        }}
+        divisor = divisor + 1;
+    }}
+    count = count + isPrime;
+    num = num + 1;
+}}
+print count;
+"""
+
+SIEVE = """
+var isPrime = array({limit} + 1, 1);
+isPrime[0] = 0;
+isPrime[1] = 0;
+var p = 2;
+while ((p * p) <= {limit}) {{
+    if (isPrime[p] == 1) {{
+        var multiple = p * p;
+        while (multiple <= {limit}) {{
+            isPrime[multiple] = 0;
+            multiple = multiple + p;
+        }}
+    }}
+    p = p + 1;
+}}
+print sum(isPrime);
+"""
+
+BUILTIN_BULK = """
+var values = array({size}, 3);
+fill(values, 2);
+print sum(values);
+"""
+
+LOOP_BULK = """
+var values = array({size}, 3);
+var i = 0;
+while (i < {size}) {{
+    values[i] = 2;
+    i = i + 1;
+}}
+var total = 0;
+i = 0;
+while (i < {size}) {{
+    total = total + values[i];
+    i = i + 1;
+}}
+print total;
+"""
+
+
+def run(source):
+    bytecode = BytecodeCompiler().compile_ast(Parser(Lexer(source)).parse())
+    vm = VirtualMachine(bytecode, output=io.StringIO())
+    start = time.perf_counter()
+    vm.run()
+    return time.perf_counter() - start, vm.output.getvalue()
+
+
+def main():
+    print(f"{'limit':>9} {'trial division s':>17} {'sieve s':>9} {'speedup':>8}")
+    for limit in COMPARED_LIMITS:
+        trial_time, trial_output = run(TRIAL_DIVISION.format(limit=limit))
+        sieve_time, sieve_output = run(SIEVE.format(limit=limit))
+        assert trial_output == sieve_output
+        print(f"{limit:>9} {trial_time:>17.3f} {sieve_time:>9.4f} {trial_time / sieve_time:>7.0f}x")
+    for limit in SIEVE_LIMITS:
+        sieve_time, output = run(SIEVE.format(limit=limit))
+        print(f"{limit:>9} {'-':>17} {sieve_time:>9.3f} {'-':>8}   ({output.strip()} primes)")
+
+    builtin_time, builtin_output = run(BUILTIN_BULK.format(size=BULK_SIZE))
+    loop_time, loop_output = run(LOOP_BULK.format(size=BULK_SIZE))
+    assert builtin_output == loop_output
+    print(f"\nfill + sum of {BULK_SIZE} elements: builtins {builtin_time * 1e3:.1f} ms, "
+          f"loops {loop_time * 1e3:.0f} ms ({loop_time / builtin_time:.0f}x)")
+
+    values = new_array(BULK_SIZE, 1)
+    as_list = list(range(BULK_SIZE))  # Distinct ints, as a list of results would hold
+    list_bytes = sys.getsizeof(as_list) + sum(sys.getsizeof(value) for value in as_list)
+    print(f"memory for {BULK_SIZE} integers: array {sys.getsizeof(values) / 1e6:.1f} MB, "
+          f"list of ints {list_bytes / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
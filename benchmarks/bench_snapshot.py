@@ -0,0 +1,61 @@
+"""Benchmark VM snapshot and restore cost against program size.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_snapshot
+"""
+import json
+import time
+
+from src.lexer import Lexer
+from src.parser import Parser
+from src.bytecode import BytecodeCompiler, VirtualMachine
+
+
+def make_program(num_vars):
+    """A program with num_vars live variables and a long-running loop."""
+    lines = [f"var v{i} = {i};" for i in range(num_vars)]
+    lines.append("var i = 0;")
+    lines.append("while (i < 1000000) {")
+    lines.extend(f"    v{i} = v{i} + i;" for i in range(0, num_vars, max(1, num_vars // 10)))
+    lines.append("    i = i + 1;")
+    lines.append("}")
+    return "\n".join(lines)
+
+
+def compile_source(source):
+    return BytecodeCompiler().compile_ast(Parser(Lexer(source)).parse())
+
+
+def best_of(func, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    print(f"{'vars':>8} {'instrs':>8} {'bytes':>10} {'snapshot ms':>12} {'restore ms':>12}")
+    for num_vars in (10, 100, 1000, 10000, 50000):
+        bytecode = compile_source(make_program(num_vars))
+        vm = VirtualMachine(bytecode)
+        vm.run(max_steps=10000)
+
+        # The first snapshot also computes the program fingerprint
+        vm.snapshot()
+        snap_time, data = best_of(lambda: json.dumps(vm.snapshot()))
+
+        # A fresh process has to fingerprint the program once per restore
+        restore_time, restored = best_of(
+            lambda: VirtualMachine.restore(bytecode, json.loads(data)))
+        assert restored.variables == vm.variables and restored.pc == vm.pc
+
+        print(f"{num_vars:>8} {len(bytecode['instructions']):>8} {len(data):>10} "
+              f"{snap_time * 1000:>12.3f} {restore_time * 1000:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Compare peak memory and time of whole-tree and streaming compilation.
+
+The whole-tree pipeline parses the complete AST, infers its types and then
+compiles it. The streaming pipeline (BytecodeCompiler.compile_stream, which
+src/main.py uses in bytecode mode without --optimize) compiles each top-level
+statement as soon as it is parsed and drops its tree. Each pipeline runs in a
+fresh process on generated sources of growing size, so its peak RSS is not
+shared with the other. Run from the repository root:
+
+    python -m benchmarks.bench_streaming
+"""
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from src.lexer import Lexer
+from src.parser import Parser
+from src.bytecode import BytecodeCompiler
+from src.typeinfer import TypeInferencer
+
+SIZES_MB = [1, 5, 10, 20]
+
+BLOCK = """var x{n} = {n};
+if (x{n} > 10) {{ x{n} = x{n} - 1; }} else {{ print "small ${{x{n}}}"; }}
+while (x{n} < ({n} + 2)) {{ x{n} = x{n} + 1; }}
+"""
+
+
+def make_source(size):
+    """Generated program of at least size bytes, reusing 100 variable names."""
+    blocks = []
+    length = 0
+    n = 0
+    while length < size:
+        block = BLOCK.format(n=n % 100)
+        blocks.append(block)
+        length += len(block)
+        n += 1
+    return "".join(blocks)
+
+
+def compile_full(source):
+    tree = Parser(Lexer(source)).parse()
+    types = TypeInferencer().infer(tree)
+    return BytecodeCompiler(types=types).compile_ast(tree)
+
+
+def compile_streaming(source):
+    statements = Parser(Lexer(source)).statements()
+    return BytecodeCompiler().compile_stream(statements, TypeInferencer())
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB on Linux
+
+
+def child(pipeline, path):
+    """Compile one file and print: seconds, peak RSS before, peak RSS after, instructions."""
+    with open(path) as f:
+        source = f.read()
+    before = peak_rss_mb()
+    start = time.perf_counter()
+    bytecode = (compile_streaming if pipeline == 'stream' else compile_full)(source)
+    elapsed = time.perf_counter() - start
+    print(elapsed, before, peak_rss_mb(), len(bytecode['instructions']))
+
+
+def measure(pipeline, path):
+    output = subprocess.run([sys.executable, '-m', 'benchmarks.bench_streaming', '--child',
+                             pipeline, path], capture_output=True, text=True, check=True).stdout
+    elapsed, before, after, instructions = output.split()
+    return float(elapsed), float(before), float(after), int(instructions)
+
+
+def main():
+    print(f"{'source MB':>9} {'pipeline':<9} {'seconds':>8} {'peak RSS MB':>12} "
+          f"{'compile MB':>11} {'instructions':>13}")
+    for size in SIZES_MB:
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as f:
+            f.write(make_source(size * 1024 * 1024))
+        try:
+            results = {pipeline: measure(pipeline, f.name) for pipeline in ('full', 'stream')}
+        finally:
+            os.unlink(f.name)
+        assert results['full'][3] == results['stream'][3]
+        for pipeline, (elapsed, before, after, instructions) in results.items():
+            print(f"{size:>9} {pipeline:<9} {elapsed:>8.2f} {after:>12.1f} "
+                  f"{after - before:>11.1f} {instructions:>13}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == '--child':
+        child(sys.argv[2], sys.argv[3])
+    else:
+        main()
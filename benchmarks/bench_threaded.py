@@ -0,0 +1,82 @@
+"""Compare direct-threaded code with the if/elif VM loop.
+
+Runs examples/benchmark.txt, and scaled versions of it whose statements
+are repeated inside a for loop of more rounds, on VirtualMachine (the
+if/elif dispatch loop, without and with quickening) and on
+ThreadedVirtualMachine. The threaded time includes translating the
+program into closures, which is also reported on its own. Instructions
+are counted with hooks to give the time per instruction. Run from the
+repository root:
+
+    python -m benchmarks.bench_threaded
+"""
+import io
+import time
+
+from src.lexer import Lexer
+from src.parser import Parser
+from src.bytecode import BytecodeCompiler, VirtualMachine
+from src.threaded import ThreadedVirtualMachine
+from src.hooks import Hooks, Counters
+
+ROUNDS = [1, 10, 100, 1000, 5000]
+REPEATS = 5
+
+
+def scaled_source(rounds):
+    """examples/benchmark.txt with its statements run `rounds` times."""
+    with open('examples/benchmark.txt') as f:
+        source = f.read().strip()
+    body = source[source.index('{') + 1:source.rindex('}')]
+    return f"for (round in 1..{rounds}) {{{body}}}"
+
+
+def compile_source(source):
+    return BytecodeCompiler().compile_ast(Parser(Lexer(source)).parse())
+
+
+def executed_instructions(bytecode):
+    hooks = Hooks()
+    counters = Counters(hooks)
+    VirtualMachine(bytecode, output=io.StringIO(), hooks=hooks).run()
+    return sum(counters.instructions.values())
+
+
+def best_time(make_vm):
+    best = None
+    for _ in range(REPEATS):
+        vm = make_vm()
+        start = time.perf_counter()
+        vm.run()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, vm.output.getvalue()
+
+
+def translation_time(bytecode):
+    vm = ThreadedVirtualMachine(bytecode, output=io.StringIO())
+    start = time.perf_counter()
+    vm.translate()
+    return time.perf_counter() - start
+
+
+def main():
+    print(f"{'rounds':>7} {'instructions':>13} {'if/elif ns':>11} {'quickened ns':>13} "
+          f"{'threaded ns':>12} {'speedup':>8} {'translate us':>13}")
+    for rounds in ROUNDS:
+        bytecode = compile_source(scaled_source(rounds))
+        count = executed_instructions(bytecode)
+        vm_time, vm_output = best_time(lambda: VirtualMachine(bytecode, output=io.StringIO()))
+        quickened_time, quickened_output = best_time(
+            lambda: VirtualMachine(compile_source(scaled_source(rounds)), quicken=True,
+                                   output=io.StringIO()))
+        threaded_time, threaded_output = best_time(
+            lambda: ThreadedVirtualMachine(bytecode, output=io.StringIO()))
+        assert vm_output == quickened_output == threaded_output
+        print(f"{rounds:>7} {count:>13} {vm_time / count * 1e9:>11.0f} "
+              f"{quickened_time / count * 1e9:>13.0f} {threaded_time / count * 1e9:>12.0f} "
+              f"{vm_time / threaded_time:>7.2f}x {translation_time(bytecode) * 1e6:>13.0f}")
+
+
+if __name__ == "__main__":
+    main()
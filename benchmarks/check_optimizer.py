@@ -0,0 +1,82 @@
+"""Check that --optimize does not change what programs print.
+
+Runs every program in benchmarks/optimizer_corpus/ and examples/ with the
+plain AST interpreter as the reference, then optimized on the interpreter
+and on the VM (with the bytecode optimizations as well), and compares the
+output. Also reports what the optimizer
+changed and the VM time with and without it. Run from the repository root:
+
+    python -m benchmarks.check_optimizer
+"""
+import contextlib
+import glob
+import io
+import os
+import sys
+import time
+
+from src.lexer import Lexer
+from src.parser import Parser
+from src.interpreter import Interpreter
+from src.bytecode import BytecodeCompiler, VirtualMachine
+from src.typeinfer import TypeInferencer
+from src.optimizer import optimize, optimize_bytecode
+
+CORPUS = sorted(glob.glob(os.path.join(os.path.dirname(__file__), 'optimizer_corpus', '*.txt')))
+EXAMPLES = sorted(glob.glob('examples/*.txt'))
+
+
+def parse(source, optimized, log=None):
+    tree = Parser(Lexer(source)).parse()
+    return optimize(tree, log) if optimized else tree
+
+
+def run_interpreter(tree):
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        Interpreter().interpret(tree)
+    return output.getvalue(), None
+
+
+def run_vm(tree, log=None):
+    types = TypeInferencer().infer(tree)
+    bytecode = BytecodeCompiler(types=types).compile_ast(tree)
+    if log is not None:
+        bytecode = optimize_bytecode(bytecode, log)
+    vm = VirtualMachine(bytecode)
+    output = io.StringIO()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(output):
+        vm.run()
+    return output.getvalue(), time.perf_counter() - start
+
+
+def main():
+    failures = 0
+    print(f"{'program':<52} {'changes':>8} {'vm s':>10} {'optimized s':>12}")
+    for path in CORPUS + EXAMPLES:
+        with open(path) as f:
+            source = f.read()
+        name = os.path.relpath(path)
+        expected, _ = run_interpreter(parse(source, False))
+        log = []
+        optimized_tree = parse(source, True, log)
+        interpreted, _ = run_interpreter(optimized_tree)
+        _, plain_time = run_vm(parse(source, False))
+        compiled, optimized_time = run_vm(parse(source, True), log)
+
+        for backend, output in (("interpreter", interpreted), ("vm", compiled)):
+            if output != expected:
+                failures += 1
+                print(f"MISMATCH {name} ({backend})")
+        print(f"{name:<52} {len(log):>8} {plain_time:>10.4f} {optimized_time:>12.4f}")
+        for description in log:
+            print(f"    {description}")
+
+    print()
+    print("all outputs match" if not failures else f"{failures} mismatch(es)")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""Generate synthetic programs for stress and scaling tests.
+
+WorkloadGenerator emits valid programs from a seed, so the same settings
+always give the same source. Every knob can be set on its own:
+
+    statements     statements to generate, counting nested ones
+    size_mb        alternatively, generate until the source is this large
+    depth          deepest nesting of if and loop bodies
+    width          operands per expression
+    trip_count     iterations of each loop (nested loops multiply)
+    variables      distinct variables, all declared at the top (loop
+                   counters add one per nesting level)
+    literals       distinct integer literals to draw from
+    interpolation  share of prints that are interpolated strings
+    prints         share of statements that print
+
+Variables only ever hold integers below MODULUS: every assignment takes
+its expression modulo MODULUS, and % and / only have non-zero literals on
+the right, so programs cannot fail and values stay small however long they
+run. Print a program, for example to time it with run.py:
+
+    python -m benchmarks.workload --statements 5000 --depth 4 > program.txt
+"""
+import argparse
+import random
+
+# Values of variables stay below this
+MODULUS = 1000
+
+# Kinds of statement, with the weights they are chosen by; prints are
+# chosen separately, by the prints share
+STATEMENT_WEIGHTS = {'assign': 6, 'if': 2, 'for': 1, 'while': 1}
+
+
+class WorkloadGenerator:
+    def __init__(self, seed=0, statements=1000, size_mb=None, depth=3, width=4, trip_count=5,
+                 variables=20, literals=50, interpolation=0.3, prints=0.1):
+        self.random = random.Random(seed)
+        self.statements = statements
+        self.size = None if size_mb is None else int(size_mb * 1024 * 1024)
+        self.depth = depth
+        self.width = width
+        self.trip_count = trip_count
+        self.variables = [f"v{n}" for n in range(variables)]
+        # Below MODULUS, like the variables, unless more are asked for
+        self.literals = self.random.sample(range(1, max(MODULUS, 2 * literals)), literals)
+        self.interpolation = interpolation
+        self.prints = prints
+        self.generated = 0
+
+    def generate(self):
+        """Return the source of a program."""
+        lines = [f"var {name} = {self.literal() % MODULUS};\n" for name in self.variables]
+        length = sum(len(line) for line in lines)
+        self.generated = 0  # Statements, without the declarations
+        while (length < self.size) if self.size is not None else (self.generated < self.statements):
+            statement_lines = []
+            self.generated += self.statement(0, [], statement_lines)
+            lines.extend(statement_lines)
+            length += sum(len(line) for line in statement_lines)
+        return "".join(lines)
+
+    def literal(self):
+        return self.random.choice(self.literals)
+
+    def operand(self, counters):
+        """A variable (or loop counter in scope) or a literal."""
+        if self.random.random() < 0.6:
+            return self.random.choice(self.variables + counters)
+        return str(self.literal())
+
+    def expression(self, counters, width=None):
+        """width operands joined by arithmetic operators, grouped at random."""
+        terms = [self.operand(counters) for _ in range(width or self.width)]
+        while len(terms) > 1:
+            position = self.random.randrange(len(terms) - 1)
+            operator = self.random.choice(('+', '-', '*', '%', '/'))
+            right = terms[position + 1]
+            if operator in ('%', '/'):
+                right = str(self.literal())  # Never zero
+            terms[position:position + 2] = [f"({terms[position]} {operator} {right})"]
+        return terms[0]
+
+    def condition(self, counters):
+        operator = self.random.choice(('<', '>', '<=', '>=', '==', '!='))
+        return f"{self.operand(counters)} {operator} {self.literal()}"
+
+    def statement(self, level, counters, lines):
+        """Append one statement at nesting level to lines; return how many it contains."""
+        indent = "    " * level
+        if self.random.random() < self.prints:
+            lines.append(f"{indent}print {self.print_value(counters)};\n")
+            return 1
+
+        kinds = list(STATEMENT_WEIGHTS)
+        if level >= self.depth:
+            kinds = ['assign']
+        kind = self.random.choices(kinds, [STATEMENT_WEIGHTS[kind] for kind in kinds])[0]
+
+        if kind == 'assign':
+            target = self.random.choice(self.variables)
+            lines.append(f"{indent}{target} = {self.expression(counters)} % {MODULUS};\n")
+            return 1
+
+        if kind == 'if':
+            lines.append(f"{indent}if ({self.condition(counters)}) {{\n")
+            count = 1 + self.block(level + 1, counters, lines)
+            if self.random.random() < 0.5:
+                lines.append(f"{indent}}} else {{\n")
+                count += self.block(level + 1, counters, lines)
+            lines.append(f"{indent}}}\n")
+            return count
+
+        # Loops at the same depth share their counter, so the number of
+        # distinct names stays variables + depth however large the program
+        counter = f"i{level}"
+        if kind == 'for':
+            lines.append(f"{indent}for ({counter} in 1..{self.trip_count}) {{\n")
+            count = 1 + self.block(level + 1, counters + [counter], lines)
+        else:
+            lines.append(f"{indent}var {counter} = 0;\n")
+            lines.append(f"{indent}while ({counter} < {self.trip_count}) {{\n")
+            count = 1 + self.block(level + 1, counters + [counter], lines)
+            lines.append(f"{indent}    {counter} = {counter} + 1;\n")
+        lines.append(f"{indent}}}\n")
+        return count
+
+    def block(self, level, counters, lines):
+        """Append the statements of a body, one to three of them."""
+        count = 0
+        for _ in range(self.random.randint(1, 3)):
+            count += self.statement(level, counters, lines)
+        return count
+
+    def print_value(self, counters):
+        if self.random.random() >= self.interpolation:
+            return self.expression(counters, width=max(1, self.width // 2))
+        parts = []
+        for _ in range(self.random.randint(1, 3)):
+            parts.append(f"item {self.literal()} is ${{{self.expression(counters, width=2)}}}")
+        return '"' + ", ".join(parts) + '"'
+
+
+def add_arguments(parser, size=True):
+    """Add an option for each generator setting to an argparse parser.
+
+    Without size, the options that set the size of the program are left out.
+    """
+    parser.add_argument('--seed', type=int, default=0)
+    if size:
+        parser.add_argument('--statements', type=int, default=1000)
+        parser.add_argument('--size-mb', type=float, default=None)
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--width', type=int, default=4)
+    parser.add_argument('--trip-count', type=int, default=5)
+    parser.add_argument('--variables', type=int, default=20)
+    parser.add_argument('--literals', type=int, default=50)
+    parser.add_argument('--interpolation', type=float, default=0.3)
+    parser.add_argument('--prints', type=float, default=0.1)
+
+
+def generator_settings(args):
+    """The WorkloadGenerator keyword arguments from parsed options."""
+    return {name: getattr(args, name) for name in (
+        'seed', 'statements', 'size_mb', 'depth', 'width', 'trip_count', 'variables',
+        'literals', 'interpolation', 'prints') if hasattr(args, name)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print a generated program.")
+    add_arguments(parser)
+    print(WorkloadGenerator(**generator_settings(parser.parse_args())).generate(), end="")
+
+
+if __name__ == "__main__":
+    main()
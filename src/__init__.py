@@ -1 +1,2 @@
-# This file makes the src directory a Python package 
\ No newline at end of file
+# This file makes the src directory a Python package
+from src.program import Program, compile
@@ -0,0 +1,231 @@
+from src.lexer import Token
+from src.parser import (
+    BinOp, Number, Float, Boolean, String, StringInterpolation, UnaryOp, Variable,
+    ArrayLiteral, Index, Call, VarDecl, Assign, IndexAssign, CallStatement, Print, If, While,
+    For, Break, Continue, Compound, ClosedFormLoop
+)
+
+OPERATOR_SYMBOLS = {
+    'PLUS': '+', 'MINUS': '-', 'MULTIPLY': '*', 'DIVIDE': '/', 'MODULO': '%',
+    'EQUALS': '==', 'NOT_EQUALS': '!=', 'LESS': '<', 'GREATER': '>',
+    'LESS_EQUAL': '<=', 'GREATER_EQUAL': '>=', 'AND': '&&', 'OR': '||', 'NOT': '!',
+}
+
+
+def assigned_variables(node, names=None):
+    """Return the names of all variables declared or assigned in a statement."""
+    if names is None:
+        names = set()
+    if isinstance(node, VarDecl):
+        names.add(node.variable.value)
+    elif isinstance(node, Assign):
+        names.add(node.left.value)
+    elif isinstance(node, If):
+        assigned_variables(node.body, names)
+        if node.else_body:
+            assigned_variables(node.else_body, names)
+    elif isinstance(node, While):
+        assigned_variables(node.body, names)
+    elif isinstance(node, For):
+        names.add(node.variable.value)
+        assigned_variables(node.body, names)
+    elif isinstance(node, Compound):
+        for statement in node.statements:
+            assigned_variables(statement, names)
+    elif isinstance(node, ClosedFormLoop):
+        assigned_variables(node.loop, names)
+    return names
+
+
+def assignment_counts(node, counts=None):
+    """Return how many times each variable is declared or assigned in a statement."""
+    if counts is None:
+        counts = {}
+    if isinstance(node, VarDecl):
+        counts[node.variable.value] = counts.get(node.variable.value, 0) + 1
+    elif isinstance(node, Assign):
+        counts[node.left.value] = counts.get(node.left.value, 0) + 1
+    elif isinstance(node, If):
+        assignment_counts(node.body, counts)
+        if node.else_body:
+            assignment_counts(node.else_body, counts)
+    elif isinstance(node, While):
+        assignment_counts(node.body, counts)
+    elif isinstance(node, For):
+        counts[node.variable.value] = counts.get(node.variable.value, 0) + 1
+        assignment_counts(node.body, counts)
+    elif isinstance(node, Compound):
+        for statement in node.statements:
+            assignment_counts(statement, counts)
+    elif isinstance(node, ClosedFormLoop):
+        assignment_counts(node.loop, counts)
+    return counts
+
+
+def used_variables(node, names=None):
+    """Return the names of all variables read by an expression."""
+    if names is None:
+        names = set()
+    if isinstance(node, Variable):
+        names.add(node.value)
+    elif isinstance(node, BinOp):
+        used_variables(node.left, names)
+        used_variables(node.right, names)
+    elif isinstance(node, UnaryOp):
+        used_variables(node.expr, names)
+    elif isinstance(node, StringInterpolation):
+        for part in node.parts:
+            used_variables(part, names)
+    elif isinstance(node, ArrayLiteral):
+        for element in node.elements:
+            used_variables(element, names)
+    elif isinstance(node, Index):
+        used_variables(node.array, names)
+        used_variables(node.index, names)
+    elif isinstance(node, Call):
+        for arg in node.args:
+            used_variables(arg, names)
+    return names
+
+
+def body_statements(node):
+    """Return the statements of a loop or branch body as a list."""
+    if isinstance(node, Compound):
+        return node.statements
+    return [node]
+
+
+def has_loop_jump(node):
+    """Return True if a loop body breaks or continues the loop itself.
+
+    Break and continue statements inside loops nested in the body belong to
+    those loops and do not count.
+    """
+    if isinstance(node, (Break, Continue)):
+        return True
+    if isinstance(node, Compound):
+        return any(has_loop_jump(statement) for statement in node.statements)
+    if isinstance(node, If):
+        return has_loop_jump(node.body) or (
+            node.else_body is not None and has_loop_jump(node.else_body))
+    return False
+
+
+def induction_step(statement, induction):
+    """Return c for `i = i + c`, -c for `i = i - c`, or None.
+
+    c must be a non-zero integer constant.
+    """
+    if not (isinstance(statement, Assign) and statement.left.value == induction):
+        return None
+    value = statement.right
+    if not (isinstance(value, BinOp) and value.op.type in ('PLUS', 'MINUS')):
+        return None
+    if isinstance(value.left, Variable) and value.left.value == induction:
+        step = value.right
+    elif value.op.type == 'PLUS' and isinstance(value.right, Variable) and value.right.value == induction:
+        step = value.left
+    else:
+        return None
+    if not isinstance(step, Number) or step.value == 0:
+        return None
+    return step.value if value.op.type == 'PLUS' else -step.value
+
+
+def expression_source(node):
+    """Render an expression as source text, for optimizer reports."""
+    if isinstance(node, (Number, Float)):
+        return str(node.value)
+    if isinstance(node, Boolean):
+        return 'true' if node.value else 'false'
+    if isinstance(node, String):
+        return f'"{node.value}"'
+    if isinstance(node, Variable):
+        return node.value
+    if isinstance(node, UnaryOp):
+        return f"{OPERATOR_SYMBOLS[node.op.type]}{expression_source(node.expr)}"
+    if isinstance(node, StringInterpolation):
+        return '"' + ''.join(part.value if isinstance(part, String)
+                             else '${' + expression_source(part) + '}'
+                             for part in node.parts) + '"'
+    if isinstance(node, ArrayLiteral):
+        return '[' + ', '.join(expression_source(element) for element in node.elements) + ']'
+    if isinstance(node, Index):
+        return f"{expression_source(node.array)}[{expression_source(node.index)}]"
+    if isinstance(node, Call):
+        return f"{node.name}({', '.join(expression_source(arg) for arg in node.args)})"
+    operands = []
+    for operand in (node.left, node.right):
+        text = expression_source(operand)
+        operands.append(f"({text})" if isinstance(operand, BinOp) else text)
+    return f"{operands[0]} {OPERATOR_SYMBOLS[node.op.type]} {operands[1]}"
+
+
+def make_variable(name):
+    return Variable(Token('IDENTIFIER', name))
+
+
+def make_number(value):
+    return Number(Token('INTEGER', value))
+
+
+def map_expressions(node, fn):
+    """Replace every expression in a statement by fn(expression), in place."""
+    if isinstance(node, Compound):
+        for statement in node.statements:
+            map_expressions(statement, fn)
+    elif isinstance(node, VarDecl):
+        node.value = fn(node.value)
+    elif isinstance(node, Assign):
+        node.right = fn(node.right)
+    elif isinstance(node, IndexAssign):
+        node.index = fn(node.index)
+        node.value = fn(node.value)
+    elif isinstance(node, CallStatement):
+        node.call = fn(node.call)
+    elif isinstance(node, Print):
+        node.expr = fn(node.expr)
+    elif isinstance(node, If):
+        node.condition = fn(node.condition)
+        map_expressions(node.body, fn)
+        if node.else_body:
+            map_expressions(node.else_body, fn)
+    elif isinstance(node, While):
+        node.condition = fn(node.condition)
+        map_expressions(node.body, fn)
+    elif isinstance(node, For):
+        node.start = fn(node.start)
+        node.end = fn(node.end)
+        if node.step is not None:
+            node.step = fn(node.step)
+        map_expressions(node.body, fn)
+    # ClosedFormLoop only refers to variables by name and is left alone
+
+
+def rebuild(node, fn):
+    """Apply fn to the operands of an expression, copying it if any changed."""
+    if isinstance(node, BinOp):
+        left, right = fn(node.left), fn(node.right)
+        if left is not node.left or right is not node.right:
+            return BinOp(left, node.op, right)
+    elif isinstance(node, UnaryOp):
+        expr = fn(node.expr)
+        if expr is not node.expr:
+            return UnaryOp(node.op, expr)
+    elif isinstance(node, StringInterpolation):
+        parts = [fn(part) for part in node.parts]
+        if any(new is not old for new, old in zip(parts, node.parts)):
+            return StringInterpolation(parts)
+    elif isinstance(node, ArrayLiteral):
+        elements = [fn(element) for element in node.elements]
+        if any(new is not old for new, old in zip(elements, node.elements)):
+            return ArrayLiteral(elements)
+    elif isinstance(node, Index):
+        index = fn(node.index)
+        if index is not node.index:
+            return Index(node.array, index)
+    elif isinstance(node, Call):
+        args = [fn(arg) for arg in node.args]
+        if any(new is not old for new, old in zip(args, node.args)):
+            return Call(node.name, args)
+    return node
@@ -0,0 +1,106 @@
+"""Array values of the language.
+
+Arrays hold numbers in a compact typed buffer (array.array) instead of a
+list of Python objects: 'q' (64-bit integers) when every element is an
+integer or boolean, 'd' (doubles) when any element is a float. An array is
+a reference value, so variables assigned the same array see each other's
+element stores. Indexing, len, fill and sum run as single VM instructions,
+and fill and sum loop over the buffer in C.
+"""
+from array import array
+
+INT_CODE = 'q'
+FLOAT_CODE = 'd'
+
+# Builtin functions and the number of arguments each one takes
+BUILTIN_ARITY = {'array': 2, 'len': 1, 'fill': 2, 'sum': 1}
+
+
+class Array(array):
+    """A typed numeric array, printed like a list: [1, 2, 3].
+
+    + and * are not defined on arrays in the language, so the concatenation
+    and repetition of array.array raise instead, in every engine.
+    """
+    def __str__(self):
+        return "[" + ", ".join(map(str, self)) + "]"
+
+    def __repr__(self):
+        return str(self)
+
+    def __add__(self, other):
+        raise unsupported_operands('+', self, other)
+
+    def __radd__(self, other):
+        raise unsupported_operands('+', other, self)
+
+    def __mul__(self, other):
+        raise unsupported_operands('*', self, other)
+
+    def __rmul__(self, other):
+        raise unsupported_operands('*', other, self)
+
+
+def type_name(value):
+    if isinstance(value, array):
+        return 'array'
+    if type(value) is bool:
+        return 'boolean'
+    return {int: 'int', float: 'float'}.get(type(value), 'string')
+
+
+def unsupported_operands(symbol, left, right):
+    return Exception(f"unsupported operand type(s) for {symbol}: "
+                     f"'{type_name(left)}' and '{type_name(right)}'")
+
+
+def element_code(values):
+    """Typecode for an array holding values; raises for non-numbers."""
+    code = INT_CODE
+    for value in values:
+        if type(value) is float:
+            code = FLOAT_CODE
+        elif type(value) not in (int, bool):
+            raise Exception(f"Array elements must be numbers, got {type_name(value)}")
+    return code
+
+
+def build_array(values):
+    """The array literal [values...]."""
+    return Array(element_code(values), values)
+
+
+def new_array(size, value):
+    """array(size, value): size copies of value."""
+    if type(size) is not int or size < 0:
+        raise Exception(f"Array size must be a non-negative integer, got {size!r}")
+    code = element_code((value,))
+    return Array(code, array(code, (value,)) * size)
+
+
+def check_array(value, function):
+    if not isinstance(value, array):
+        raise Exception(f"{function}() expects an array, got {type_name(value)}")
+
+
+def array_length(values):
+    """len(values)."""
+    check_array(values, 'len')
+    return len(values)
+
+
+def fill(values, value):
+    """fill(values, value): set every element to value; returns the array."""
+    check_array(values, 'fill')
+    values[:] = array(values.typecode, (value,)) * len(values)
+    return values
+
+
+def array_sum(values):
+    """sum(values): exact for integers, like adding the elements one by one."""
+    check_array(values, 'sum')
+    return sum(values, 0 if values.typecode == INT_CODE else 0.0)
+
+
+# Builtin name -> function, for the interpreter
+BUILTINS = {'array': new_array, 'len': array_length, 'fill': fill, 'sum': array_sum}
@@ -0,0 +1,505 @@
+"""Run one compiled Program over many input records at once.
+
+The inputs are columns: one array per input variable, with one element per
+record (row). Instead of running the VM once per row, each basic block is run
+once for every row that has reached it, with each instruction applied to a
+NumPy array holding one value per row. A conditional jump splits the rows by
+their condition, and the rows waiting at the lowest block run next, so rows
+that take different branches meet again after an if, and a loop runs as long
+as any row is still iterating. For loops keep one range iterator per row on
+the stack, and FOR_RANGE splits the rows like a conditional jump.
+
+Values keep the semantics of the VM exactly: integers are int64 arrays only
+while they cannot overflow and become arrays of Python ints otherwise, and
+strings and mixed types are object arrays. A block that fails for some rows
+(a division by zero, a type error) and groups of fewer than MIN_GROUP_ROWS
+rows, such as the last rows still running a loop, are run on the VM one row
+at a time from the start of the block. Programs that use arrays run on the
+VM row by row from the start.
+
+Requires NumPy.
+"""
+import io
+import operator
+
+import numpy as np
+
+from src.bytecode import (
+    OpCode, VirtualMachine, KEEP_ON_JUMP, basic_blocks, jump_target, stack_effect, modulo_values
+)
+from src.rope import materialize
+from src.loop_idioms import counted_range
+
+# Groups smaller than this finish on the VM row by row
+MIN_GROUP_ROWS = 16
+
+# Arrays are mutable and shared between the variables that hold them, so
+# programs using them run on the VM row by row
+ARRAY_OPCODES = frozenset([
+    OpCode.BUILD_ARRAY, OpCode.NEW_ARRAY, OpCode.LOAD_INDEX, OpCode.STORE_INDEX,
+    OpCode.ARRAY_LENGTH, OpCode.ARRAY_FILL, OpCode.ARRAY_SUM,
+])
+
+INT64_LIMIT = 2 ** 63
+INT64_MIN = -2 ** 63
+
+# Integers up to this size convert to float exactly
+EXACT_FLOAT_LIMIT = 2 ** 53
+
+
+def as_column(values):
+    """Convert a sequence of values into a one-dimensional array.
+
+    Integers become int64 (or Python ints if they do not fit), floats
+    float64, booleans bool, and strings and mixed types object arrays.
+    """
+    if isinstance(values, np.ndarray):
+        if values.ndim != 1:
+            raise Exception("Input columns must be one-dimensional")
+        kind = values.dtype.kind
+        if kind == 'b':
+            return values
+        if kind == 'i':
+            return values.astype(np.int64)
+        if kind == 'u':
+            if len(values) and int(values.max()) >= INT64_LIMIT:
+                return object_column(values.tolist())
+            return values.astype(np.int64)
+        if kind == 'f':
+            return values.astype(np.float64)
+        return object_column(values.tolist())
+
+    values = list(values)
+    types = set(map(type, values))
+    if types == {bool}:
+        return np.array(values, dtype=bool)
+    if types == {float}:
+        return np.array(values, dtype=np.float64)
+    if types == {int}:
+        try:
+            return np.array(values, dtype=np.int64)
+        except OverflowError:
+            pass
+    return object_column(values)
+
+
+def object_column(values):
+    # fromiter keeps sequences such as arrays as single elements
+    return np.fromiter(values, dtype=object, count=len(values))
+
+
+def constant_column(value, size):
+    """A column holding the same constant in every row."""
+    if type(value) is int and not INT64_MIN <= value < INT64_LIMIT:
+        return np.full(size, value, dtype=object)
+    if type(value) in (int, float, bool):
+        return np.full(size, value)
+    return np.full(size, value, dtype=object)
+
+
+def python_value(value):
+    """Convert an element of a column to the value the VM would hold."""
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def store_rows(column, size, rows, values):
+    """Write values into the given rows of a column of size rows.
+
+    Returns the column, which is replaced by an object array when the values
+    have a different type than the rest of it. None is an empty column.
+    """
+    if len(rows) == size:
+        return values.copy()
+    if column is None:
+        column = np.full(size, None, dtype=object)
+    if column.dtype != values.dtype:
+        if column.dtype != object:
+            column = column.astype(object)
+        if values.dtype != object:
+            values = values.astype(object)
+    column[rows] = values
+    return column
+
+
+def objects(function, *arrays):
+    """Apply a Python function element by element, for exact semantics."""
+    arrays = [array if array.dtype == object else array.astype(object) for array in arrays]
+    return np.frompyfunc(function, len(arrays), 1)(*arrays)
+
+
+def numeric(values):
+    """values as an int64 or float64 array, or None if they are not numbers."""
+    kind = values.dtype.kind
+    if kind == 'b':
+        return values.astype(np.int64)
+    if kind in 'if':
+        return values
+    return None
+
+
+def int_bound(values):
+    """The largest absolute value in an int64 array."""
+    return max(-int(values.min()), int(values.max()))
+
+
+def both_int(left, right):
+    return left.dtype.kind == 'i' and right.dtype.kind == 'i'
+
+
+def truthy(values):
+    kind = values.dtype.kind
+    if kind == 'b':
+        return values
+    if kind in 'if':
+        return values != 0
+    return values.astype(bool)
+
+
+def to_string(values):
+    return object_column(list(map(str, values.tolist())))
+
+
+def concat(left, right):
+    # Strings are object arrays, which NumPy adds with Python's +
+    return np.add(left.astype(object, copy=False), right.astype(object, copy=False))
+
+
+def add(left, right, op):
+    """ADD and SUBTRACT."""
+    a, b = numeric(left), numeric(right)
+    if a is None or b is None:
+        return objects(op, left, right)
+    if both_int(a, b) and int_bound(a) + int_bound(b) >= INT64_LIMIT:
+        return objects(op, left, right)
+    return op(a, b)
+
+
+def multiply(left, right):
+    a, b = numeric(left), numeric(right)
+    if a is None or b is None:
+        return objects(operator.mul, left, right)
+    if both_int(a, b) and int_bound(a) * int_bound(b) >= INT64_LIMIT:
+        return objects(operator.mul, left, right)
+    return a * b
+
+
+def generic_divide(left, right):
+    if isinstance(left, int) and isinstance(right, int):
+        return left // right
+    return left / right
+
+
+def divide(left, right, opcode):
+    """DIVIDE, FLOOR_DIVIDE and TRUE_DIVIDE."""
+    function = {OpCode.DIVIDE: generic_divide,
+                OpCode.FLOOR_DIVIDE: operator.floordiv,
+                OpCode.TRUE_DIVIDE: operator.truediv}[opcode]
+    a, b = numeric(left), numeric(right)
+    if a is None or b is None:
+        return objects(function, left, right)
+    if (b == 0).any():
+        raise ZeroDivisionError("division by zero")
+    ints = both_int(a, b)
+    floor = ints if opcode == OpCode.DIVIDE else opcode == OpCode.FLOOR_DIVIDE
+    if floor:
+        if not ints or int(a.min()) == INT64_MIN:
+            return objects(function, left, right)
+        return a // b
+    if ints and max(int_bound(a), int_bound(b)) > EXACT_FLOAT_LIMIT:
+        return objects(function, left, right)
+    return a / b
+
+
+def modulo(left, right):
+    a, b = numeric(left), numeric(right)
+    if a is None or b is None or not both_int(a, b):
+        return objects(modulo_values, left, right)
+    if (b == 0).any():
+        raise ZeroDivisionError("integer modulo by zero")
+    # Like Python's %, NumPy's takes the sign of the divisor
+    return a % b
+
+
+def compare(left, right, op):
+    a, b = numeric(left), numeric(right)
+    if a is None or b is None:
+        return objects(op, left, right).astype(bool)
+    # int64 is compared with float64 by converting it, which is only exact
+    # for integers that fit in a float
+    for ints, other in ((a, b), (b, a)):
+        if ints.dtype.kind == 'i' and other.dtype.kind == 'f' and int_bound(ints) > EXACT_FLOAT_LIMIT:
+            return objects(op, left, right).astype(bool)
+    return op(a, b)
+
+
+def negate(values):
+    a = numeric(values)
+    if a is None or (a.dtype.kind == 'i' and int(a.min()) == INT64_MIN):
+        return objects(operator.neg, values)
+    return -a
+
+
+def positive(values):
+    a = numeric(values)
+    return objects(operator.pos, values) if a is None else a
+
+
+def choose(condition, when_true, when_false):
+    """Element-wise `when_true if condition else when_false`."""
+    if when_true.dtype != when_false.dtype:
+        when_true, when_false = when_true.astype(object), when_false.astype(object)
+    return np.where(condition, when_true, when_false)
+
+
+BINARY_OPERATIONS = {
+    OpCode.ADD: lambda left, right: add(left, right, operator.add),
+    OpCode.SUBTRACT: lambda left, right: add(left, right, operator.sub),
+    OpCode.MULTIPLY: multiply,
+    OpCode.DIVIDE: lambda left, right: divide(left, right, OpCode.DIVIDE),
+    OpCode.FLOOR_DIVIDE: lambda left, right: divide(left, right, OpCode.FLOOR_DIVIDE),
+    OpCode.TRUE_DIVIDE: lambda left, right: divide(left, right, OpCode.TRUE_DIVIDE),
+    OpCode.MODULO: modulo,
+    OpCode.CONCAT: concat,
+    OpCode.EQUALS: lambda left, right: compare(left, right, operator.eq),
+    OpCode.NOT_EQUALS: lambda left, right: compare(left, right, operator.ne),
+    OpCode.LESS_THAN: lambda left, right: compare(left, right, operator.lt),
+    OpCode.GREATER_THAN: lambda left, right: compare(left, right, operator.gt),
+    OpCode.LESS_EQUAL: lambda left, right: compare(left, right, operator.le),
+    OpCode.GREATER_EQUAL: lambda left, right: compare(left, right, operator.ge),
+    OpCode.AND: lambda left, right: choose(truthy(left), right, left),
+    OpCode.OR: lambda left, right: choose(truthy(left), left, right),
+}
+
+UNARY_OPERATIONS = {
+    OpCode.UNARY_PLUS: positive,
+    OpCode.UNARY_MINUS: negate,
+    OpCode.NOT: lambda values: ~truthy(values),
+    OpCode.TO_STRING: to_string,
+}
+
+
+def entry_depths(instructions, blocks):
+    """Stack depth on entry to each reachable basic block."""
+    depths = {0: 0}
+    worklist = [0]
+    while worklist:
+        start = worklist.pop()
+        depth = depths[start]
+        for index in range(start, blocks[start]):
+            instruction = instructions[index]
+            pops, pushes = stack_effect(instruction)
+            depth += pushes - pops
+            target = jump_target(instruction)
+            if target is not None and target not in depths:
+                depths[target] = depth + 1 if instruction.opcode in KEEP_ON_JUMP else depth
+                worklist.append(target)
+        end = blocks[start]
+        if end in blocks and end not in depths and instructions[end - 1].opcode not in (
+                OpCode.JUMP, OpCode.HALT):
+            depths[end] = depth
+            worklist.append(end)
+    return depths
+
+
+class BatchMachine:
+    """Executes a Program over all rows of a batch (see run_batch)."""
+    def __init__(self, program, inputs):
+        for name in program.inputs:
+            if name not in inputs:
+                raise Exception(f"Missing input '{name}'")
+        columns = {}
+        for name, values in inputs.items():
+            if name not in program.inputs:
+                raise Exception(f"Unknown input '{name}'")
+            columns[name] = as_column(values)
+        sizes = {len(column) for column in columns.values()}
+        if len(sizes) > 1:
+            raise Exception("Input columns must all have the same length")
+
+        self.program = program
+        self.instructions = program.bytecode['instructions']
+        self.constants = program.bytecode['constants']
+        self.verified = program.bytecode['verified']
+        self.blocks = basic_blocks(self.instructions)
+        self.depths = entry_depths(self.instructions, self.blocks)
+        self.size = sizes.pop() if sizes else 1
+
+        # One column per variable slot and per stack slot; None until written
+        variables = program.bytecode['variables']
+        self.columns = [None] * (max(variables.values(), default=-1) + 1)
+        for name, column in columns.items():
+            if name in variables:  # Inputs the program never reads may be dropped
+                self.columns[variables[name]] = column
+        self.stack_columns = [None] * program.bytecode['max_stack']
+
+        self.done = len(self.instructions)  # pc of rows that have halted
+        self.pcs = np.zeros(self.size, dtype=np.int64)
+        self.output = np.full(self.size, '', dtype=object)
+        self.errors = np.full(self.size, None, dtype=object)
+        self.rows_on_vm = 0
+        self.uses_arrays = any(instruction.opcode in ARRAY_OPCODES
+                               for instruction in self.instructions)
+
+    def run(self):
+        if self.uses_arrays:
+            self.run_rows(np.arange(self.size), 0, [])
+            return
+        while self.size:
+            start = int(self.pcs.min())
+            if start == self.done:
+                break
+            rows = np.flatnonzero(self.pcs == start)
+            stack = [self.stack_columns[depth][rows] for depth in range(self.depths[start])]
+            if len(rows) < MIN_GROUP_ROWS:
+                self.run_rows(rows, start, stack)
+                continue
+            try:
+                last, stack, stores, printed = self.run_block(start, rows, stack[:])
+            except Exception:
+                # Some rows fail in this block: the VM reports their errors
+                # and runs the other rows on
+                self.run_rows(rows, start, stack)
+                continue
+            for slot, values in stores.items():
+                self.columns[slot] = store_rows(self.columns[slot], self.size, rows, values)
+            for text in printed:
+                self.output[rows] += text
+            self.branch(start, last, rows, stack)
+
+    def load(self, slot, rows, stores):
+        if slot in stores:
+            return stores[slot]
+        column = self.columns[slot]
+        if column is None:
+            raise Exception("Variable used before assignment")
+        values = column if len(rows) == self.size else column[rows]
+        if not self.verified and values.dtype == object and any(value is None for value in values):
+            raise Exception("Variable used before assignment")
+        return values
+
+    def run_block(self, start, rows, stack):
+        """Run one basic block over the given rows and their stack columns.
+
+        Returns the last instruction, the stack columns left at its end, the
+        stores made (slot -> values) and the printed text, which are only
+        applied once the whole block has run.
+        """
+        stores = {}
+        printed = []
+        instructions = self.instructions
+        count = len(rows)
+        for index in range(start, self.blocks[start]):
+            instruction = instructions[index]
+            opcode = instruction.opcode
+            if opcode in BINARY_OPERATIONS:
+                right = stack.pop()
+                stack.append(BINARY_OPERATIONS[opcode](stack.pop(), right))
+            elif opcode in UNARY_OPERATIONS:
+                stack.append(UNARY_OPERATIONS[opcode](stack.pop()))
+            elif opcode == OpCode.LOAD_CONST:
+                stack.append(constant_column(self.constants[instruction.operand], count))
+            elif opcode == OpCode.LOAD_VAR:
+                stack.append(self.load(instruction.operand, rows, stores))
+            elif opcode == OpCode.STORE_VAR:
+                stores[instruction.operand] = stack.pop()
+            elif opcode == OpCode.POP:
+                stack.pop()
+            elif opcode == OpCode.PRINT:
+                printed.append(to_string(stack.pop()) + "\n")
+            elif opcode == OpCode.CLOSED_FORM_LOOP:
+                pass  # The loop that follows computes the same values
+            elif opcode == OpCode.GET_RANGE:
+                step, end = stack.pop(), stack.pop()
+                bounds = zip(stack.pop().tolist(), end.tolist(), step.tolist())
+                stack.append(object_column([iter(counted_range(*row)) for row in bounds]))
+            elif opcode not in (OpCode.JUMP, OpCode.JUMP_IF_FALSE, OpCode.JUMP_IF_FALSE_OR_POP,
+                                OpCode.JUMP_IF_TRUE_OR_POP, OpCode.FOR_RANGE, OpCode.HALT):
+                raise Exception(f"Unknown opcode: {opcode}")
+        return instruction, stack, stores, printed
+
+    def branch(self, start, last, rows, stack):
+        """Send the rows of a finished block on to the blocks they continue at."""
+        opcode = last.opcode
+        end = self.blocks[start]
+        if opcode == OpCode.HALT:
+            self.pcs[rows] = self.done
+        elif opcode == OpCode.JUMP:
+            self.move(rows, last.operand, stack)
+        elif opcode == OpCode.JUMP_IF_FALSE:
+            condition = truthy(stack.pop())
+            self.move(rows[~condition], last.operand, [values[~condition] for values in stack])
+            self.move(rows[condition], end, [values[condition] for values in stack])
+        elif opcode == OpCode.FOR_RANGE:
+            slot, target = last.operand
+            values = [next(iterator, None) for iterator in stack[-1]]
+            more = np.array([value is not None for value in values], dtype=bool)
+            if more.any():
+                taken = as_column([value for value in values if value is not None])
+                self.columns[slot] = store_rows(self.columns[slot], self.size, rows[more], taken)
+            self.move(rows[more], target, [column[more] for column in stack])
+            self.move(rows[~more], end, [column[~more] for column in stack[:-1]])
+        elif opcode in KEEP_ON_JUMP:
+            condition = truthy(stack[-1])
+            if opcode == OpCode.JUMP_IF_FALSE_OR_POP:
+                condition = ~condition
+            self.move(rows[condition], last.operand, [values[condition] for values in stack])
+            self.move(rows[~condition], end, [values[~condition] for values in stack[:-1]])
+        else:
+            self.move(rows, end, stack)
+
+    def move(self, rows, pc, stack):
+        if not len(rows):
+            return
+        self.pcs[rows] = pc
+        for depth, values in enumerate(stack):
+            self.stack_columns[depth] = store_rows(self.stack_columns[depth], self.size, rows, values)
+
+    def run_rows(self, rows, pc, stack):
+        """Run rows to the end on the VM, starting at pc with the given stack."""
+        self.rows_on_vm += len(rows)
+        for position, row in enumerate(rows.tolist()):
+            output = io.StringIO()
+            vm = VirtualMachine(self.program.bytecode, output=output)
+            for slot, column in enumerate(self.columns):
+                if column is not None:
+                    vm.variables[slot] = python_value(column[row])
+            for depth, values in enumerate(stack):
+                vm.stack[depth] = python_value(values[position])
+            vm.sp = len(stack)
+            vm.pc = pc
+            try:
+                vm.run()
+            except Exception as e:
+                self.errors[row] = str(e)
+            self.output[row] += output.getvalue()
+            single = np.array([row])
+            for slot, value in enumerate(vm.variables):
+                if value is not None or self.columns[slot] is not None:
+                    self.columns[slot] = store_rows(self.columns[slot], self.size, single,
+                                                    as_column([materialize(value)]))
+            self.pcs[row] = self.done
+
+    def results(self):
+        variables = {}
+        for name, slot in self.program.bytecode['variables'].items():
+            column = self.columns[slot]
+            variables[name] = np.full(self.size, None, dtype=object) if column is None else column
+        return {'variables': variables, 'output': self.output, 'errors': self.errors,
+                'rows_on_vm': self.rows_on_vm}
+
+
+def run_batch(program, inputs):
+    """Run a Program once per row of column-oriented inputs.
+
+    inputs maps every name in program.inputs to a sequence or NumPy array,
+    all of the same length. Returns a dict with 'variables', the final value
+    of each variable as one array per name; 'output', an object array with
+    the text each row printed; and 'errors', an object array holding the
+    runtime error message of each row that failed, or None; and
+    'rows_on_vm', the number of rows that were finished on the VM one at a
+    time. A row stops at its error like a single run does.
+    """
+    machine = BatchMachine(program, inputs)
+    with np.errstate(all='ignore'):  # Float overflow gives inf, as in Python
+        machine.run()
+    return machine.results()
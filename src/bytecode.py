@@ -1,3 +1,7 @@
+import hashlib
+import json
+import operator
+
 # Bytecode operation codes
 class OpCode:
     # Stack operations
@@ -13,6 +17,9 @@ class OpCode:
     DIVIDE = 13
     UNARY_PLUS = 14
     UNARY_MINUS = 15
+    FLOOR_DIVIDE = 27 # Division with operands statically known to be integers
+    TRUE_DIVIDE = 28  # Division with an operand statically known to be a float
+    MODULO = 29
     
     # Logical operations
     NOT = 16
@@ -21,7 +28,7 @@ class OpCode:
     
     # String operations
     CONCAT = 19       # Concatenate two strings
-    TO_STRING = 23    # Convert top of stack to string
+    TO_STRING = 26    # Convert top of stack to string
     
     # Comparison operations
     EQUALS = 20
@@ -34,18 +41,89 @@ class OpCode:
     # Control flow
     JUMP = 30         # Unconditional jump
     JUMP_IF_FALSE = 31 # Jump if top of stack is false
+    CLOSED_FORM_LOOP = 32 # Run a recognized counting loop in closed form
+    JUMP_IF_FALSE_OR_POP = 33 # Jump keeping top of stack if false, else pop it
+    JUMP_IF_TRUE_OR_POP = 34  # Jump keeping top of stack if true, else pop it
+    GET_RANGE = 35    # Pop start, end and step, push an iterator over the for loop's values
+    FOR_RANGE = 36    # Store the next value and jump back into the loop, or pop the iterator
     
     # I/O operations
     PRINT = 40
     
+    # Array operations
+    BUILD_ARRAY = 50  # Pop operand values and push an array of them
+    NEW_ARRAY = 51    # Pop a size and a value, push an array of size copies
+    LOAD_INDEX = 52   # Pop an index and an array, push the element
+    STORE_INDEX = 53  # Pop a value, an index and an array, store the element
+    ARRAY_LENGTH = 54
+    ARRAY_FILL = 55   # Pop a value and an array, set every element, push the array
+    ARRAY_SUM = 56
+    
     # Program structure
     HALT = 255        # End program execution
+    
+    # Specialized forms, only written in place by the VM when quickening
+    ADD_INT = 100
+    ADD_FLOAT = 101
+    ADD_STR = 102
+    SUBTRACT_INT = 103
+    SUBTRACT_FLOAT = 104
+    MULTIPLY_INT = 105
+    MULTIPLY_FLOAT = 106
+    DIVIDE_INT_INT = 107
+    DIVIDE_FLOAT = 108
+    EQUALS_INT = 109
+    NOT_EQUALS_INT = 110
+    LESS_THAN_INT = 111
+    GREATER_THAN_INT = 112
+    LESS_EQUAL_INT = 113
+    GREATER_EQUAL_INT = 114
+    MODULO_INT = 115
+
+
+OPCODE_NAMES = {value: name for name, value in vars(OpCode).items() if name.isupper()}
+
+# Builtin function name -> the instruction that calls it
+BUILTIN_OPCODES = {
+    'array': OpCode.NEW_ARRAY,
+    'len': OpCode.ARRAY_LENGTH,
+    'fill': OpCode.ARRAY_FILL,
+    'sum': OpCode.ARRAY_SUM,
+}
+
+# (generic opcode, left operand type, right operand type) -> specialized opcode
+SPECIALIZATIONS = {
+    (OpCode.ADD, int, int): OpCode.ADD_INT,
+    (OpCode.ADD, float, float): OpCode.ADD_FLOAT,
+    (OpCode.ADD, str, str): OpCode.ADD_STR,
+    (OpCode.SUBTRACT, int, int): OpCode.SUBTRACT_INT,
+    (OpCode.SUBTRACT, float, float): OpCode.SUBTRACT_FLOAT,
+    (OpCode.MULTIPLY, int, int): OpCode.MULTIPLY_INT,
+    (OpCode.MULTIPLY, float, float): OpCode.MULTIPLY_FLOAT,
+    (OpCode.DIVIDE, int, int): OpCode.DIVIDE_INT_INT,
+    (OpCode.DIVIDE, float, float): OpCode.DIVIDE_FLOAT,
+    (OpCode.EQUALS, int, int): OpCode.EQUALS_INT,
+    (OpCode.NOT_EQUALS, int, int): OpCode.NOT_EQUALS_INT,
+    (OpCode.LESS_THAN, int, int): OpCode.LESS_THAN_INT,
+    (OpCode.GREATER_THAN, int, int): OpCode.GREATER_THAN_INT,
+    (OpCode.LESS_EQUAL, int, int): OpCode.LESS_EQUAL_INT,
+    (OpCode.GREATER_EQUAL, int, int): OpCode.GREATER_EQUAL_INT,
+    (OpCode.MODULO, int, int): OpCode.MODULO_INT,
+}
+
+# Specialized opcode -> the generic opcode it was quickened from
+GENERIC_OPCODES = {specialized: key[0] for key, specialized in SPECIALIZATIONS.items()}
+
+# Executions of a generic instruction to skip before trying to specialize it
+# again after a failed attempt or a deoptimization
+QUICKEN_BACKOFF = 64
 
 
 class Instruction:
     def __init__(self, opcode, operand=None):
         self.opcode = opcode
         self.operand = operand
+        self.cache = 0  # Inline cache: quickening backoff counter
     
     def __repr__(self):
         if self.operand is not None:
@@ -53,18 +131,174 @@ class Instruction:
         return f"Instruction({self.opcode})"
 
 
+# Values each opcode pops and pushes when execution continues with the next
+# instruction
+STACK_EFFECTS = {
+    OpCode.LOAD_CONST: (0, 1),
+    OpCode.LOAD_VAR: (0, 1),
+    OpCode.STORE_VAR: (1, 0),
+    OpCode.POP: (1, 0),
+    OpCode.UNARY_PLUS: (1, 1),
+    OpCode.UNARY_MINUS: (1, 1),
+    OpCode.NOT: (1, 1),
+    OpCode.TO_STRING: (1, 1),
+    OpCode.JUMP: (0, 0),
+    OpCode.JUMP_IF_FALSE: (1, 0),
+    OpCode.JUMP_IF_FALSE_OR_POP: (1, 0),
+    OpCode.JUMP_IF_TRUE_OR_POP: (1, 0),
+    OpCode.CLOSED_FORM_LOOP: (0, 0),
+    OpCode.GET_RANGE: (3, 1),
+    OpCode.FOR_RANGE: (1, 0),
+    OpCode.PRINT: (1, 0),
+    OpCode.HALT: (0, 0),
+    OpCode.BUILD_ARRAY: (0, 1),  # Also pops as many values as its operand says
+    OpCode.NEW_ARRAY: (2, 1),
+    OpCode.LOAD_INDEX: (2, 1),
+    OpCode.STORE_INDEX: (3, 0),
+    OpCode.ARRAY_LENGTH: (1, 1),
+    OpCode.ARRAY_FILL: (2, 1),
+    OpCode.ARRAY_SUM: (1, 1),
+}
+for _opcode in (OpCode.ADD, OpCode.SUBTRACT, OpCode.MULTIPLY, OpCode.DIVIDE,
+                OpCode.FLOOR_DIVIDE, OpCode.TRUE_DIVIDE, OpCode.MODULO, OpCode.AND, OpCode.OR,
+                OpCode.CONCAT, OpCode.EQUALS, OpCode.NOT_EQUALS, OpCode.LESS_THAN,
+                OpCode.GREATER_THAN, OpCode.LESS_EQUAL, OpCode.GREATER_EQUAL,
+                *GENERIC_OPCODES):
+    STACK_EFFECTS[_opcode] = (2, 1)
+
+# Instructions after which execution never continues with the next one
+TERMINATORS = (OpCode.JUMP, OpCode.HALT)
+
+# Instructions whose operand is a jump target
+JUMPS = (OpCode.JUMP, OpCode.JUMP_IF_FALSE,
+         OpCode.JUMP_IF_FALSE_OR_POP, OpCode.JUMP_IF_TRUE_OR_POP)
+
+# Conditional jumps that leave the tested value (for FOR_RANGE, the iterator)
+# on the stack when they jump
+KEEP_ON_JUMP = (OpCode.JUMP_IF_FALSE_OR_POP, OpCode.JUMP_IF_TRUE_OR_POP, OpCode.FOR_RANGE)
+
+
+def stack_effect(instruction):
+    """Return the (pops, pushes) of an instruction."""
+    if instruction.opcode == OpCode.BUILD_ARRAY:
+        return instruction.operand, 1
+    return STACK_EFFECTS[instruction.opcode]
+
+
+def jump_target(instruction):
+    """Return the index an instruction may jump to, or None."""
+    if instruction.opcode in JUMPS:
+        return instruction.operand
+    if instruction.opcode in (OpCode.CLOSED_FORM_LOOP, OpCode.FOR_RANGE):
+        return instruction.operand[-1]
+    return None
+
+
+def basic_blocks(instructions):
+    """Split a program into basic blocks.
+
+    Returns a dict mapping the first instruction index of each block to the
+    index just past its last instruction.
+    """
+    leaders = {0}
+    for index, instruction in enumerate(instructions):
+        target = jump_target(instruction)
+        if target is not None:
+            leaders.add(target)
+            leaders.add(index + 1)
+        elif instruction.opcode in TERMINATORS:
+            leaders.add(index + 1)
+    starts = sorted(leader for leader in leaders if leader < len(instructions))
+    return dict(zip(starts, starts[1:] + [len(instructions)]))
+
+
+def variable_slots(bytecode):
+    """Number of variable slots a program needs.
+
+    Names whose values are never live at the same time may share a slot
+    (see liveness.pack_slots), so this can be less than the number of names.
+    """
+    return max(bytecode['variables'].values(), default=-1) + 1
+
+
+def block_successors(instructions, blocks):
+    """Map each basic block to the blocks control can pass to after it."""
+    successors = {}
+    for start, end in blocks.items():
+        last = instructions[end - 1]
+        targets = []
+        if jump_target(last) is not None:
+            targets.append(jump_target(last))
+        if last.opcode not in TERMINATORS and end < len(instructions):
+            targets.append(end)
+        successors[start] = targets
+    return successors
+
+
+def analyze_stack(instructions):
+    """Compute the maximum operand stack depth of a program.
+
+    Walks the basic blocks reachable from the entry and checks that no
+    instruction pops more values than are on the stack, that every block is
+    entered with the same depth on all paths, and that the stack is empty
+    when the program halts. Raises an exception on the first violation.
+    """
+    blocks = basic_blocks(instructions)
+    entry_depths = {0: 0}
+    worklist = [0]
+    max_depth = 0
+    
+    def enter(block, depth):
+        if block not in entry_depths:
+            entry_depths[block] = depth
+            worklist.append(block)
+        elif entry_depths[block] != depth:
+            raise Exception(f"Stack imbalance: block at {block} entered with "
+                            f"depth {entry_depths[block]} and {depth}")
+    
+    while worklist:
+        start = worklist.pop()
+        depth = entry_depths[start]
+        end = blocks[start]
+        for index in range(start, end):
+            instruction = instructions[index]
+            if instruction.opcode not in STACK_EFFECTS:
+                raise Exception(f"Unknown opcode at {index}: {instruction.opcode}")
+            pops, pushes = stack_effect(instruction)
+            if depth < pops:
+                raise Exception(f"Stack underflow at instruction {index}")
+            depth += pushes - pops
+            max_depth = max(max_depth, depth)
+            
+            if instruction.opcode == OpCode.HALT and depth != 0:
+                raise Exception(f"Stack imbalance: {depth} value(s) left at HALT")
+            target = jump_target(instruction)
+            if target is not None:
+                enter(target, depth + 1 if instruction.opcode in KEEP_ON_JUMP else depth)
+        
+        if instructions[end - 1].opcode not in TERMINATORS and end < len(instructions):
+            enter(end, depth)
+    
+    return max_depth
+
+
 class BytecodeCompiler:
-    def __init__(self):
+    def __init__(self, types=None):
+        self.types = types or {}  # Expression node to inferred type (see typeinfer)
         self.constants = []  # Constants pool (numbers, strings)
         self.instructions = []  # Bytecode instructions
         self.variables = {}  # Variable names to index mapping
+        self.constant_index = {}  # (type, value) to constants pool index
+        self.loops = []  # Break and continue jumps of each enclosing loop, innermost last
     
     def add_constant(self, value):
         """Add a constant to the constants pool and return its index."""
-        if value in self.constants:
-            return self.constants.index(value)
-        self.constants.append(value)
-        return len(self.constants) - 1
+        # Key on the type as well so that 1, 1.0 and true stay distinct
+        key = (type(value), value)
+        if key not in self.constant_index:
+            self.constant_index[key] = len(self.constants)
+            self.constants.append(value)
+        return self.constant_index[key]
     
     def get_variable_index(self, name):
         """Get variable index, creating it if needed."""
@@ -100,11 +334,12 @@ class BytecodeCompiler:
             first_part = True
             for part in node.parts:
                 # Compile the expression
-                self.compile(part)
+                yield part
                 
                 # If it's not a string, convert it to string
                 if not (isinstance(part, String) or
-                        isinstance(part, StringInterpolation)):
+                        isinstance(part, StringInterpolation) or
+                        self.types.get(part) == STRING):
                     self.emit(OpCode.TO_STRING)
                 
                 # If not the first part, concatenate with the existing result
@@ -118,7 +353,7 @@ class BytecodeCompiler:
     
     def compile_unaryop(self, node):
         # Compile the expression
-        self.compile(node.expr)
+        yield node.expr
         
         # Emit the unary operation
         if node.op.type == 'PLUS':
@@ -129,9 +364,13 @@ class BytecodeCompiler:
             self.emit(OpCode.NOT)
     
     def compile_binop(self, node):
+        if node.op.type in ('AND', 'OR'):
+            yield from self.compile_short_circuit(node)
+            return
+        
         # Compile left and right operands
-        self.compile(node.left)
-        self.compile(node.right)
+        yield node.left
+        yield node.right
         
         # Emit the operation instruction
         if node.op.type == 'PLUS':
@@ -141,7 +380,9 @@ class BytecodeCompiler:
         elif node.op.type == 'MULTIPLY':
             self.emit(OpCode.MULTIPLY)
         elif node.op.type == 'DIVIDE':
-            self.emit(OpCode.DIVIDE)
+            self.emit(self.division_opcode(node))
+        elif node.op.type == 'MODULO':
+            self.emit(OpCode.MODULO)
         elif node.op.type == 'EQUALS':
             self.emit(OpCode.EQUALS)
         elif node.op.type == 'NOT_EQUALS':
@@ -154,10 +395,42 @@ class BytecodeCompiler:
             self.emit(OpCode.LESS_EQUAL)
         elif node.op.type == 'GREATER_EQUAL':
             self.emit(OpCode.GREATER_EQUAL)
-        elif node.op.type == 'AND':
-            self.emit(OpCode.AND)
-        elif node.op.type == 'OR':
-            self.emit(OpCode.OR)
+    
+    def compile_short_circuit(self, node):
+        # The right operand is only evaluated when the left one does not
+        # decide the result; otherwise the left value is the result
+        yield node.left
+        if node.op.type == 'AND':
+            jump_idx = self.emit(OpCode.JUMP_IF_FALSE_OR_POP, 0)
+        else:
+            jump_idx = self.emit(OpCode.JUMP_IF_TRUE_OR_POP, 0)
+        yield node.right
+        self.instructions[jump_idx].operand = len(self.instructions)
+    
+    def division_opcode(self, node):
+        """Pick a typed division opcode when the operand types are known."""
+        left = self.types.get(node.left)
+        right = self.types.get(node.right)
+        if left in (INT, BOOLEAN) and right in (INT, BOOLEAN):
+            return OpCode.FLOOR_DIVIDE
+        if left in NUMERIC and right in NUMERIC:
+            return OpCode.TRUE_DIVIDE
+        return OpCode.DIVIDE
+    
+    def compile_array_literal(self, node):
+        for element in node.elements:
+            yield element
+        self.emit(OpCode.BUILD_ARRAY, len(node.elements))
+    
+    def compile_index(self, node):
+        yield node.array
+        yield node.index
+        self.emit(OpCode.LOAD_INDEX)
+    
+    def compile_call(self, node):
+        for arg in node.args:
+            yield arg
+        self.emit(BUILTIN_OPCODES[node.name])
     
     def compile_variable(self, node):
         var_idx = self.get_variable_index(node.value)
@@ -165,7 +438,7 @@ class BytecodeCompiler:
     
     def compile_vardecl(self, node):
         # Compile the initial value
-        self.compile(node.value)
+        yield node.value
         
         # Store it in the variable
         var_idx = self.get_variable_index(node.variable.value)
@@ -173,28 +446,39 @@ class BytecodeCompiler:
     
     def compile_assign(self, node):
         # Compile the value
-        self.compile(node.right)
+        yield node.right
         
         # Store it in the variable
         var_idx = self.get_variable_index(node.left.value)
         self.emit(OpCode.STORE_VAR, var_idx)
     
+    def compile_index_assign(self, node):
+        yield node.array
+        yield node.index
+        yield node.value
+        self.emit(OpCode.STORE_INDEX)
+    
+    def compile_call_statement(self, node):
+        # The result of the call is not used
+        yield node.call
+        self.emit(OpCode.POP)
+    
     def compile_print(self, node):
         # Compile the expression to print
-        self.compile(node.expr)
+        yield node.expr
         
         # Emit print instruction
         self.emit(OpCode.PRINT)
     
     def compile_if(self, node):
         # Compile condition
-        self.compile(node.condition)
+        yield node.condition
         
         # Emit conditional jump (to be patched)
         jump_if_false_idx = self.emit(OpCode.JUMP_IF_FALSE, 0)
         
         # Compile if-body
-        self.compile(node.body)
+        yield node.body
         
         if node.else_body:
             # Emit jump to skip else part 
@@ -205,7 +489,7 @@ class BytecodeCompiler:
             self.instructions[jump_if_false_idx].operand = jump_target
             
             # Compile else-body
-            self.compile(node.else_body)
+            yield node.else_body
             
             # Patch the unconditional jump to point after the else-body
             jump_target = len(self.instructions)
@@ -220,13 +504,15 @@ class BytecodeCompiler:
         loop_start = len(self.instructions)
         
         # Compile condition
-        self.compile(node.condition)
+        yield node.condition
         
         # Emit conditional jump (to be patched)
         jump_if_false_idx = self.emit(OpCode.JUMP_IF_FALSE, 0)
         
         # Compile loop body
-        self.compile(node.body)
+        self.loops.append({'iterator': False, 'breaks': [], 'continues': []})
+        yield node.body
+        loop = self.loops.pop()
         
         # Emit jump back to loop condition
         self.emit(OpCode.JUMP, loop_start)
@@ -234,203 +520,1060 @@ class BytecodeCompiler:
         # Patch the conditional jump to point after the loop
         jump_target = len(self.instructions)
         self.instructions[jump_if_false_idx].operand = jump_target
+        self.patch_loop_jumps(loop, loop_start, jump_target)
+    
+    def compile_for(self, node):
+        # The loop is entered at its FOR_RANGE, at the bottom, which assigns
+        # the variable and jumps back to the body: one instruction of loop
+        # overhead per iteration
+        var_idx = self.get_variable_index(node.variable.value)
+        yield node.start
+        yield node.end
+        if node.step is None:
+            self.emit(OpCode.LOAD_CONST, self.add_constant(1))
+        else:
+            yield node.step
+        self.emit(OpCode.GET_RANGE)
+        jump_idx = self.emit(OpCode.JUMP, 0)
+        
+        body_start = len(self.instructions)
+        self.loops.append({'iterator': True, 'breaks': [], 'continues': []})
+        yield node.body
+        loop = self.loops.pop()
+        
+        for_range_idx = len(self.instructions)
+        self.instructions[jump_idx].operand = for_range_idx
+        self.emit(OpCode.FOR_RANGE, (var_idx, body_start))
+        self.patch_loop_jumps(loop, for_range_idx, len(self.instructions))
+    
+    def patch_loop_jumps(self, loop, continue_target, break_target):
+        for jump_idx in loop['continues']:
+            self.instructions[jump_idx].operand = continue_target
+        for jump_idx in loop['breaks']:
+            self.instructions[jump_idx].operand = break_target
+    
+    def compile_break(self, node):
+        if not self.loops:
+            raise Exception("'break' outside a loop")
+        loop = self.loops[-1]
+        if loop['iterator']:
+            self.emit(OpCode.POP)  # The for loop's range iterator
+        # Patched to a direct jump past the loop once its end is known
+        loop['breaks'].append(self.emit(OpCode.JUMP, 0))
+    
+    def compile_continue(self, node):
+        if not self.loops:
+            raise Exception("'continue' outside a loop")
+        # Patched to the condition check (FOR_RANGE for a for loop)
+        self.loops[-1]['continues'].append(self.emit(OpCode.JUMP, 0))
+    
+    def closed_form_operand(self, operand):
+        """Encode an integer constant or invariant variable for the VM."""
+        if operand is None or isinstance(operand, int):
+            return ('const', operand)
+        return ('var', self.get_variable_index(operand))
+    
+    def compile_closed_form_loop(self, node):
+        # The closed form jumps past the original loop when it applies and
+        # falls through to it otherwise
+        closed_form_idx = self.emit(OpCode.CLOSED_FORM_LOOP, None)
+        yield node.loop
+        
+        accumulators = tuple(
+            (self.get_variable_index(name), op,
+             None if operand is None else self.closed_form_operand(operand))
+            for name, op, operand in node.accumulators
+        )
+        self.instructions[closed_form_idx].operand = (
+            self.get_variable_index(node.induction), node.step, node.relation,
+            self.closed_form_operand(node.bound), accumulators, len(self.instructions)
+        )
     
     def compile_compound(self, node):
         for statement in node.statements:
-            self.compile(statement)
+            yield statement
     
     def compile_noop(self, node):
         pass
     
     def compile(self, node):
-        """Compile an AST node to bytecode."""
+        """Compile an AST node to bytecode.
+
+        Handlers of nodes with children are generators that yield each child
+        and are resumed once it has been compiled. They are driven from an
+        explicit stack, so deeply nested programs do not exhaust the
+        recursion limit.
+        """
+        stack = [self.compile_handler(node)]
+        while stack:
+            try:
+                child = next(stack[-1])
+            except StopIteration:
+                stack.pop()
+                continue
+            stack.append(self.compile_handler(child))
+
+    def compile_handler(self, node):
+        """Return an iterator over the children a node's handler compiles."""
         node_type = type(node).__name__
         
         if node_type == 'Number':
-            self.compile_number(node)
+            handler = self.compile_number
         elif node_type == 'Float':
-            self.compile_float(node)
+            handler = self.compile_float
         elif node_type == 'Boolean':
-            self.compile_boolean(node)
+            handler = self.compile_boolean
         elif node_type == 'String':
-            self.compile_string(node)
+            handler = self.compile_string
         elif node_type == 'StringInterpolation':
-            self.compile_string_interpolation(node)
+            handler = self.compile_string_interpolation
         elif node_type == 'UnaryOp':
-            self.compile_unaryop(node)
+            handler = self.compile_unaryop
         elif node_type == 'BinOp':
-            self.compile_binop(node)
+            handler = self.compile_binop
         elif node_type == 'Variable':
-            self.compile_variable(node)
+            handler = self.compile_variable
+        elif node_type == 'ArrayLiteral':
+            handler = self.compile_array_literal
+        elif node_type == 'Index':
+            handler = self.compile_index
+        elif node_type == 'Call':
+            handler = self.compile_call
         elif node_type == 'VarDecl':
-            self.compile_vardecl(node)
+            handler = self.compile_vardecl
         elif node_type == 'Assign':
-            self.compile_assign(node)
+            handler = self.compile_assign
+        elif node_type == 'IndexAssign':
+            handler = self.compile_index_assign
+        elif node_type == 'CallStatement':
+            handler = self.compile_call_statement
         elif node_type == 'Print':
-            self.compile_print(node)
+            handler = self.compile_print
         elif node_type == 'If':
-            self.compile_if(node)
+            handler = self.compile_if
         elif node_type == 'While':
-            self.compile_while(node)
+            handler = self.compile_while
+        elif node_type == 'For':
+            handler = self.compile_for
+        elif node_type == 'Break':
+            handler = self.compile_break
+        elif node_type == 'Continue':
+            handler = self.compile_continue
+        elif node_type == 'ClosedFormLoop':
+            handler = self.compile_closed_form_loop
         elif node_type == 'Compound':
-            self.compile_compound(node)
+            handler = self.compile_compound
         elif node_type == 'NoOp':
-            self.compile_noop(node)
+            handler = self.compile_noop
         else:
             raise Exception(f"Unknown node type: {node_type}")
+        # Leaf handlers emit their code right away and return None
+        return handler(node) or iter(())
     
     def compile_ast(self, ast):
         """Compile an AST to bytecode."""
         self.compile(ast)
+        return self.finish()
+
+    def compile_stream(self, statements, inferencer=None):
+        """Compile top-level statements as they are produced.
+
+        statements is an iterable such as Parser.statements(). Each tree is
+        compiled and released before the next statement is taken, so the
+        AST of the whole program never exists at once. With a TypeInferencer,
+        types are inferred one statement at a time (its variable scope
+        carries over) and the type errors found are collected in
+        self.type_errors. The bytecode is the same as compile_ast produces
+        for the whole program.
+        """
+        self.type_errors = []
+        for statement in statements:
+            if inferencer is not None:
+                inferencer.visit(statement)
+                self.types = inferencer.types
+            self.compile(statement)
+            if inferencer is not None:
+                # Both are keyed by node, so they would keep every tree alive
+                self.type_errors.extend(inferencer.errors)
+                inferencer.types.clear()
+                inferencer.type_errors.clear()
+        return self.finish()
+
+    def finish(self):
+        """End the program and return the compiled bytecode."""
         self.emit(OpCode.HALT)
         return {
             'constants': self.constants,
             'instructions': self.instructions,
-            'variables': self.variables
+            'variables': self.variables,
+            'max_stack': analyze_stack(self.instructions)
         }
 
 
 from src.parser import String, StringInterpolation
+from src.typeinfer import INT, BOOLEAN, STRING, NUMERIC
+from src.loop_idioms import evaluate_closed_form, counted_range
+from src.rope import Rope, ROPE_MIN_LENGTH, materialize
+from src.arrays import Array, build_array, new_array, array_length, fill, array_sum
+from src import verifier
+
+
+def program_fingerprint(bytecode):
+    """Return a stable hash identifying a compiled program.
+
+    Compiling the same source always gives the same fingerprint, so it can be
+    used to refer to a program from another process.
+    """
+    # JSON keeps 1, 1.0 and true apart, which the constants pool relies on
+    encoded = json.dumps([
+        [[GENERIC_OPCODES.get(i.opcode, i.opcode), i.operand]
+         for i in bytecode['instructions']],
+        bytecode['constants'],
+        sorted(bytecode['variables'].items(), key=lambda item: item[1])
+    ])
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+def source_hash(source):
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+
+def as_tuples(value):
+    """Turn the nested lists JSON gives back into the tuples operands use."""
+    if isinstance(value, list):
+        return tuple(as_tuples(item) for item in value)
+    return value
+
+
+def save_bytecode(bytecode, path, source):
+    """Write a compiled program to disk, tagged with a hash of its source."""
+    with open(path, 'w') as f:
+        json.dump({
+            'source': source_hash(source),
+            'instructions': [[GENERIC_OPCODES.get(i.opcode, i.opcode), i.operand]
+                             for i in bytecode['instructions']],
+            'constants': bytecode['constants'],
+            'variables': bytecode['variables'],
+            'max_stack': bytecode['max_stack']
+        }, f)
+
+
+def load_bytecode(path, source):
+    """Load a program written by save_bytecode.
+
+    Returns None if there is no cached program for this source. A cached
+    program is verified before it is returned, so a corrupted or tampered
+    file raises an exception instead of misbehaving in the VM.
+    """
+    try:
+        with open(path, 'r') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(data, dict) or data.get('source') != source_hash(source):
+        return None
+
+    try:
+        bytecode = {
+            'constants': data['constants'],
+            'instructions': [Instruction(opcode, as_tuples(operand))
+                             for opcode, operand in data['instructions']],
+            'variables': data['variables'],
+            'max_stack': data['max_stack']
+        }
+    except (KeyError, TypeError, ValueError):
+        raise Exception(f"Verification failed: '{path}' is not a bytecode file")
+    bytecode['verified'] = verifier.verify(bytecode)
+    return bytecode
+
+
+def add_values(left, right):
+    """ADD, extending long strings with a Rope instead of copying them."""
+    if type(left) is str and type(right) is str and len(left) >= ROPE_MIN_LENGTH:
+        return Rope.concat(left, right)
+    return left + right
+
+
+def divide_values(left, right):
+    """DIVIDE: integer division for two integers, float division otherwise."""
+    if isinstance(left, int) and isinstance(right, int):
+        return left // right
+    return left / right
+
+
+def modulo_values(left, right):
+    """MODULO: the remainder, with the sign of the right operand as in Python."""
+    if isinstance(left, (str, Rope)):
+        # Python would format the string instead
+        raise Exception("unsupported operand type(s) for %: "
+                        f"'str' and '{type(materialize(right)).__name__}'")
+    return left % right
+
+
+# Generic operations by opcode, for the hooked run loop
+BINARY_OPERATIONS = {
+    OpCode.ADD: add_values,
+    OpCode.SUBTRACT: operator.sub,
+    OpCode.MULTIPLY: operator.mul,
+    OpCode.DIVIDE: divide_values,
+    OpCode.FLOOR_DIVIDE: operator.floordiv,
+    OpCode.TRUE_DIVIDE: operator.truediv,
+    OpCode.MODULO: modulo_values,
+    OpCode.CONCAT: add_values,
+    OpCode.EQUALS: operator.eq,
+    OpCode.NOT_EQUALS: operator.ne,
+    OpCode.LESS_THAN: operator.lt,
+    OpCode.GREATER_THAN: operator.gt,
+    OpCode.LESS_EQUAL: operator.le,
+    OpCode.GREATER_EQUAL: operator.ge,
+    OpCode.AND: lambda left, right: left and right,
+    OpCode.OR: lambda left, right: left or right,
+    OpCode.NEW_ARRAY: new_array,
+    OpCode.LOAD_INDEX: operator.getitem,
+    OpCode.ARRAY_FILL: fill,
+}
+
+UNARY_OPERATIONS = {
+    OpCode.UNARY_PLUS: operator.pos,
+    OpCode.UNARY_MINUS: operator.neg,
+    OpCode.NOT: operator.not_,
+    OpCode.TO_STRING: str,
+    OpCode.ARRAY_LENGTH: array_length,
+    OpCode.ARRAY_SUM: array_sum,
+}
+
+# Types of the iterators GET_RANGE pushes; ranges past the C long limit
+# have their own
+RANGE_ITERATORS = (type(iter(range(0))), type(iter(range(2 ** 64))))
+
 
 class VirtualMachine:
-    def __init__(self, bytecode):
+    def __init__(self, bytecode, quicken=False, output=None, hooks=None):
+        self.variables = []
+        self.stack = []
+        self.output = output  # File PRINT writes to; None means sys.stdout
+        
+        # Event callbacks (see src/hooks.py). With hooks, run() uses a
+        # separate loop that reports events, so the other loops pay nothing
+        self.hooks = hooks
+        
+        # Quickening rewrites generic arithmetic and comparison instructions
+        # in place into type-specialized forms after observing their operands
+        self.quicken = quicken
+        self.quickening_stats = {}
+        
+        self.load(bytecode)
+    
+    def load(self, bytecode):
+        """Start running bytecode, keeping the values of the variables.
+
+        Used to run a program piece by piece (see src/incremental.py): each
+        piece is compiled against the same constant pool and variable table,
+        which may have grown since the last one. The variable table and the
+        stack are extended to what the new code needs.
+        """
+        self.bytecode = bytecode
         self.constants = bytecode['constants']
         self.instructions = bytecode['instructions']
-        self.variables = [None] * len(bytecode['variables'])
-        self.stack = []
+        self.variables.extend([None] * (variable_slots(bytecode) - len(self.variables)))
+        max_stack = bytecode.get('max_stack')
+        if max_stack is None:
+            max_stack = analyze_stack(self.instructions)
+        self.stack.extend([None] * (max_stack - len(self.stack)))
+        self.sp = 0  # Stack pointer: index of the first free stack slot
         self.pc = 0  # Program counter
+        self.halted = False
+        self.started = False  # Whether the hooked loop has reported the start
+        self.fingerprint = None  # Computed on first snapshot
+        
+        # Verify each program once when it is first loaded. Malformed bytecode
+        # is rejected; programs whose variables are all definitely assigned
+        # (counting those that already hold a value) run on the loop without
+        # per-instruction checks.
+        if 'verified' not in bytecode:
+            loaded = {instruction.operand for instruction in self.instructions
+                      if instruction.opcode == OpCode.LOAD_VAR}
+            assigned = [name for name, index in bytecode['variables'].items()
+                        if index in loaded and self.variables[index] is not None]
+            bytecode['verified'] = verifier.verify(bytecode, assigned)
+        self.verified = bytecode['verified']
     
-    def push(self, value):
-        self.stack.append(value)
+    def snapshot(self):
+        """Capture the execution state at the current instruction boundary.
+
+        The result only holds JSON-compatible values and refers to the program
+        by its fingerprint, so it can be stored or sent to another process and
+        resumed there with VirtualMachine.restore(). Arrays are stored once
+        in 'arrays' and referred to as {'array': position}, so values that
+        share an array still share it after a restore. The iterator of a for
+        loop in progress is stored as {'range': [start, stop, step, position]}.
+        """
+        if self.fingerprint is None:
+            self.fingerprint = program_fingerprint(self.bytecode)
+        arrays = []
+        positions = {}  # id of an array -> its position in arrays
+        
+        def encode(value):
+            if type(value) in RANGE_ITERATORS:
+                _, (values,), position = value.__reduce__()
+                return {'range': [values.start, values.stop, values.step, position]}
+            if type(value) is not Array:
+                return materialize(value)
+            if id(value) not in positions:
+                positions[id(value)] = len(arrays)
+                arrays.append({'typecode': value.typecode, 'values': value.tolist()})
+            return {'array': positions[id(value)]}
+        
+        return {
+            'program': self.fingerprint,
+            'pc': self.pc,
+            'stack': [encode(value) for value in self.stack[:self.sp]],
+            'variables': [encode(value) for value in self.variables],
+            'arrays': arrays,
+            'halted': self.halted
+        }
     
-    def pop(self):
-        return self.stack.pop()
+    @classmethod
+    def restore(cls, bytecode, snapshot):
+        """Create a VM for bytecode that resumes from a snapshot."""
+        vm = cls(bytecode)
+        vm.fingerprint = program_fingerprint(bytecode)
+        if snapshot['program'] != vm.fingerprint:
+            raise Exception("Snapshot was taken from a different program")
+        if len(snapshot['variables']) != len(vm.variables):
+            raise Exception("Snapshot variable table does not match the program")
+        arrays = [Array(array['typecode'], array['values'])
+                  for array in snapshot.get('arrays', [])]
+        
+        def decode(value):
+            if type(value) is not dict:
+                return value
+            if 'range' in value:
+                start, stop, step, position = value['range']
+                iterator = iter(range(start, stop, step))
+                iterator.__setstate__(position)
+                return iterator
+            return arrays[value['array']]
+        
+        vm.pc = snapshot['pc']
+        vm.sp = len(snapshot['stack'])
+        vm.stack[:vm.sp] = [decode(value) for value in snapshot['stack']]
+        vm.variables = [decode(value) for value in snapshot['variables']]
+        vm.halted = snapshot['halted']
+        return vm
+    
+    def specialize(self, instruction, left, right):
+        """Try to rewrite a generic instruction for the operand types seen."""
+        if instruction.cache:
+            instruction.cache -= 1
+            return
+        
+        stats = self.quickening_stats.setdefault(
+            OPCODE_NAMES[instruction.opcode],
+            {'specialized': 0, 'failed': 0, 'deoptimized': 0})
+        specialized = SPECIALIZATIONS.get((instruction.opcode, type(left), type(right)))
+        if specialized is None:
+            stats['failed'] += 1
+            instruction.cache = QUICKEN_BACKOFF
+        else:
+            stats['specialized'] += 1
+            instruction.opcode = specialized
+    
+    def deoptimize(self, instruction):
+        """Revert a specialized instruction whose type guard failed.
+
+        The operands are still on the stack, so the generic form of the
+        instruction is executed in its place.
+        """
+        generic = GENERIC_OPCODES[instruction.opcode]
+        self.quickening_stats[OPCODE_NAMES[generic]]['deoptimized'] += 1
+        instruction.opcode = generic
+        instruction.cache = QUICKEN_BACKOFF
+        self.pc -= 1
     
-    def run(self):
+    def specialization_report(self):
+        """Return quickening statistics per generic opcode."""
+        report = {}
+        for name, stats in sorted(self.quickening_stats.items()):
+            attempts = stats['specialized'] + stats['failed']
+            report[name] = dict(stats)
+            report[name]['success_rate'] = stats['specialized'] / attempts if attempts else 0.0
+        return report
+    
+    def run_closed_form(self, descriptor):
+        """Execute CLOSED_FORM_LOOP, skipping the loop if it applies."""
+        induction, step, relation, bound, accumulators, end = descriptor
+        variables = self.variables
+        
+        def operand_value(operand):
+            kind, value = operand
+            return variables[value] if kind == 'var' else value
+        
+        result = evaluate_closed_form(
+            variables[induction], step, relation, operand_value(bound),
+            [(variables[index], op, None if operand is None else operand_value(operand))
+             for index, op, operand in accumulators])
+        if result is None:
+            return
+        
+        variables[induction], values = result
+        for (index, op, operand), value in zip(accumulators, values):
+            variables[index] = value
+        self.pc = end
+    
+    def run(self, max_steps=None):
+        """Run the program until it halts or the step budget runs out.
+
+        Returns True once the program has halted. When max_steps is given and
+        the budget is used up, execution stops at an instruction boundary and
+        False is returned; calling run() again resumes from there. The budget
+        is only charged on backward jumps, so each loop iteration costs the
+        number of instructions in the loop and straight-line code is free.
+
+        Every program is verified on load, so jumps stay inside it, it ends
+        with HALT or JUMP and its opcodes are known: the loop checks none of
+        these per instruction. Only programs whose variables may be read
+        before they are assigned check LOAD_VAR, which the loop decides once
+        with the checked flag.
+        """
+        if self.halted:
+            return True
+        if self.hooks is not None:
+            return self.run_hooked(max_steps)
+        
+        checked = not self.verified
+        # The stack is preallocated to the depth computed by the compiler and
+        # sp (the index of the first free slot) is kept in a local
+        instructions = self.instructions
+        constants = self.constants
+        variables = self.variables
+        stack = self.stack
+        sp = self.sp
+        output = self.output
+        
         while True:
-            # Fetch instruction
-            if self.pc >= len(self.instructions):
-                break
-                
-            instruction = self.instructions[self.pc]
+            instruction = instructions[self.pc]
             self.pc += 1
             
             # Execute instruction
-            if instruction.opcode == OpCode.LOAD_CONST:
-                self.push(self.constants[instruction.operand])
+            if OpCode.ADD_INT <= instruction.opcode <= OpCode.MODULO_INT:
+                # Quickened forms: guard the operand types, deoptimize on a miss
+                right = stack[sp - 1]
+                left = stack[sp - 2]
+                if instruction.opcode == OpCode.ADD_INT:
+                    if type(left) is int and type(right) is int:
+                        sp -= 1
+                        stack[sp - 1] = left + right
+                    else:
+                        self.deoptimize(instruction)
+                
+                elif instruction.opcode == OpCode.ADD_FLOAT:
+                    if type(left) is float and type(right) is float:
+                        sp -= 1
+                        stack[sp - 1] = left + right
+                    else:
+                        self.deoptimize(instruction)
+                
+                elif instruction.opcode == OpCode.ADD_STR:
+                    if type(left) is str and type(right) is str:
+                        sp -= 1
+                        if len(left) >= ROPE_MIN_LENGTH:
+                            stack[sp - 1] = Rope.concat(left, right)
+                        else:
+                            stack[sp - 1] = left + right
+                    else:
+                        self.deoptimize(instruction)
+                
+                elif instruction.opcode == OpCode.SUBTRACT_INT:
+                    if type(left) is int and type(right) is int:
+                        sp -= 1
+                        stack[sp - 1] = left - right
+                    else:
+                        self.deoptimize(instruction)
+                
+                elif instruction.opcode == OpCode.SUBTRACT_FLOAT:
+                    if type(left) is float and type(right) is float:
+                        sp -= 1
+                        stack[sp - 1] = left - right
+                    else:
+                        self.deoptimize(instruction)
+                
+                elif instruction.opcode == OpCode.MULTIPLY_INT:
+                    if type(left) is int and type(right) is int:
+                        sp -= 1
+                        stack[sp - 1] = left * right
+                    else:
+                        self.deoptimize(instruction)
+                
+                elif instruction.opcode == OpCode.MULTIPLY_FLOAT:
+                    if type(left) is float and type(right) is float:
+                        sp -= 1
+                        stack[sp - 1] = left * right
+                    else:
+                        self.deoptimize(instruction)
+                
+                elif instruction.opcode == OpCode.DIVIDE_INT_INT:
+                    if type(left) is int and type(right) is int:
+                        sp -= 1
+                        stack[sp - 1] = left // right
+                    else:
+                        self.deoptimize(instruction)
+                
+                elif instruction.opcode == OpCode.DIVIDE_FLOAT:
+                    if type(left) is float and type(right) is float:
+                        sp -= 1
+                        stack[sp - 1] = left / right
+                    else:
+                        self.deoptimize(instruction)
+                
+                elif instruction.opcode == OpCode.MODULO_INT:
+                    if type(left) is int and type(right) is int:
+                        sp -= 1
+                        stack[sp - 1] = left % right
+                    else:
+                        self.deoptimize(instruction)
+                
+                elif instruction.opcode == OpCode.EQUALS_INT:
+                    if type(left) is int and type(right) is int:
+                        sp -= 1
+                        stack[sp - 1] = left == right
+                    else:
+                        self.deoptimize(instruction)
+                
+                elif instruction.opcode == OpCode.NOT_EQUALS_INT:
+                    if type(left) is int and type(right) is int:
+                        sp -= 1
+                        stack[sp - 1] = left != right
+                    else:
+                        self.deoptimize(instruction)
+                
+                elif instruction.opcode == OpCode.LESS_THAN_INT:
+                    if type(left) is int and type(right) is int:
+                        sp -= 1
+                        stack[sp - 1] = left < right
+                    else:
+                        self.deoptimize(instruction)
+                
+                elif instruction.opcode == OpCode.GREATER_THAN_INT:
+                    if type(left) is int and type(right) is int:
+                        sp -= 1
+                        stack[sp - 1] = left > right
+                    else:
+                        self.deoptimize(instruction)
+                
+                elif instruction.opcode == OpCode.LESS_EQUAL_INT:
+                    if type(left) is int and type(right) is int:
+                        sp -= 1
+                        stack[sp - 1] = left <= right
+                    else:
+                        self.deoptimize(instruction)
+                
+                elif instruction.opcode == OpCode.GREATER_EQUAL_INT:
+                    if type(left) is int and type(right) is int:
+                        sp -= 1
+                        stack[sp - 1] = left >= right
+                    else:
+                        self.deoptimize(instruction)
+
+            
+            elif instruction.opcode == OpCode.LOAD_CONST:
+                stack[sp] = constants[instruction.operand]
+                sp += 1
             
             elif instruction.opcode == OpCode.LOAD_VAR:
-                value = self.variables[instruction.operand]
-                if value is None:
+                value = variables[instruction.operand]
+                if checked and value is None:
                     raise Exception(f"Variable at index {instruction.operand} not initialized")
-                self.push(value)
+                stack[sp] = value
+                sp += 1
             
             elif instruction.opcode == OpCode.STORE_VAR:
-                self.variables[instruction.operand] = self.pop()
+                sp -= 1
+                variables[instruction.operand] = stack[sp]
             
             elif instruction.opcode == OpCode.POP:
-                self.pop()
+                sp -= 1
             
             elif instruction.opcode == OpCode.UNARY_PLUS:
-                value = self.pop()
-                self.push(+value)
+                stack[sp - 1] = +stack[sp - 1]
                 
             elif instruction.opcode == OpCode.UNARY_MINUS:
-                value = self.pop()
-                self.push(-value)
+                stack[sp - 1] = -stack[sp - 1]
                 
             elif instruction.opcode == OpCode.NOT:
-                value = self.pop()
-                self.push(not value)
+                stack[sp - 1] = not stack[sp - 1]
             
             elif instruction.opcode == OpCode.ADD:
-                right = self.pop()
-                left = self.pop()
-                self.push(left + right)
+                sp -= 1
+                right = stack[sp]
+                left = stack[sp - 1]
+                if type(left) is str and type(right) is str and len(left) >= ROPE_MIN_LENGTH:
+                    # Appending to a long string: extend it without copying
+                    stack[sp - 1] = Rope.concat(left, right)
+                else:
+                    stack[sp - 1] = left + right
+                if self.quicken:
+                    self.specialize(instruction, left, right)
             
             elif instruction.opcode == OpCode.SUBTRACT:
-                right = self.pop()
-                left = self.pop()
-                self.push(left - right)
+                sp -= 1
+                right = stack[sp]
+                left = stack[sp - 1]
+                stack[sp - 1] = left - right
+                if self.quicken:
+                    self.specialize(instruction, left, right)
             
             elif instruction.opcode == OpCode.MULTIPLY:
-                right = self.pop()
-                left = self.pop()
-                self.push(left * right)
+                sp -= 1
+                right = stack[sp]
+                left = stack[sp - 1]
+                stack[sp - 1] = left * right
+                if self.quicken:
+                    self.specialize(instruction, left, right)
             
             elif instruction.opcode == OpCode.DIVIDE:
-                right = self.pop()
-                left = self.pop()
+                sp -= 1
+                right = stack[sp]
+                left = stack[sp - 1]
                 if isinstance(left, int) and isinstance(right, int):
-                    self.push(left // right)  # Integer division
+                    stack[sp - 1] = left // right  # Integer division
                 else:
-                    self.push(left / right)   # Float division
+                    stack[sp - 1] = left / right   # Float division
+                if self.quicken:
+                    self.specialize(instruction, left, right)
+            
+            elif instruction.opcode == OpCode.FLOOR_DIVIDE:
+                sp -= 1
+                stack[sp - 1] = stack[sp - 1] // stack[sp]
+            
+            elif instruction.opcode == OpCode.TRUE_DIVIDE:
+                sp -= 1
+                stack[sp - 1] = stack[sp - 1] / stack[sp]
+            
+            elif instruction.opcode == OpCode.MODULO:
+                sp -= 1
+                right = stack[sp]
+                left = stack[sp - 1]
+                if type(left) is str:
+                    modulo_values(left, right)  # Raises rather than formatting the string
+                stack[sp - 1] = left % right
+                if self.quicken:
+                    self.specialize(instruction, left, right)
                     
             elif instruction.opcode == OpCode.CONCAT:
-                right = self.pop()
-                left = self.pop()
-                self.push(left + right)
+                sp -= 1
+                right = stack[sp]
+                left = stack[sp - 1]
+                if type(left) is str and type(right) is str and len(left) >= ROPE_MIN_LENGTH:
+                    stack[sp - 1] = Rope.concat(left, right)
+                else:
+                    stack[sp - 1] = left + right
                 
             elif instruction.opcode == OpCode.TO_STRING:
-                value = self.pop()
-                self.push(str(value))
+                stack[sp - 1] = str(stack[sp - 1])
             
             elif instruction.opcode == OpCode.EQUALS:
-                right = self.pop()
-                left = self.pop()
-                self.push(left == right)
-                
+                sp -= 1
+                right = stack[sp]
+                left = stack[sp - 1]
+                stack[sp - 1] = left == right
+                if self.quicken:
+                    self.specialize(instruction, left, right)
+            
             elif instruction.opcode == OpCode.NOT_EQUALS:
-                right = self.pop()
-                left = self.pop()
-                self.push(left != right)
+                sp -= 1
+                right = stack[sp]
+                left = stack[sp - 1]
+                stack[sp - 1] = left != right
+                if self.quicken:
+                    self.specialize(instruction, left, right)
             
             elif instruction.opcode == OpCode.LESS_THAN:
-                right = self.pop()
-                left = self.pop()
-                self.push(left < right)
+                sp -= 1
+                right = stack[sp]
+                left = stack[sp - 1]
+                stack[sp - 1] = left < right
+                if self.quicken:
+                    self.specialize(instruction, left, right)
             
             elif instruction.opcode == OpCode.GREATER_THAN:
-                right = self.pop()
-                left = self.pop()
-                self.push(left > right)
-                
+                sp -= 1
+                right = stack[sp]
+                left = stack[sp - 1]
+                stack[sp - 1] = left > right
+                if self.quicken:
+                    self.specialize(instruction, left, right)
+            
             elif instruction.opcode == OpCode.LESS_EQUAL:
-                right = self.pop()
-                left = self.pop()
-                self.push(left <= right)
-                
+                sp -= 1
+                right = stack[sp]
+                left = stack[sp - 1]
+                stack[sp - 1] = left <= right
+                if self.quicken:
+                    self.specialize(instruction, left, right)
+            
             elif instruction.opcode == OpCode.GREATER_EQUAL:
-                right = self.pop()
-                left = self.pop()
-                self.push(left >= right)
+                sp -= 1
+                right = stack[sp]
+                left = stack[sp - 1]
+                stack[sp - 1] = left >= right
+                if self.quicken:
+                    self.specialize(instruction, left, right)
                 
             elif instruction.opcode == OpCode.AND:
-                right = self.pop()
-                left = self.pop()
-                self.push(left and right)
+                sp -= 1
+                stack[sp - 1] = stack[sp - 1] and stack[sp]
                 
             elif instruction.opcode == OpCode.OR:
-                right = self.pop()
-                left = self.pop()
-                self.push(left or right)
+                sp -= 1
+                stack[sp - 1] = stack[sp - 1] or stack[sp]
             
             elif instruction.opcode == OpCode.JUMP:
-                self.pc = instruction.operand
+                target = instruction.operand
+                if max_steps is not None and target < self.pc:
+                    # Backward jump: charge one loop iteration to the budget
+                    max_steps -= self.pc - target
+                    if max_steps <= 0:
+                        self.pc = target
+                        self.sp = sp
+                        return False
+                self.pc = target
             
             elif instruction.opcode == OpCode.JUMP_IF_FALSE:
-                condition = self.pop()
-                if not condition:
+                sp -= 1
+                if not stack[sp]:
+                    self.pc = instruction.operand
+            
+            elif instruction.opcode == OpCode.JUMP_IF_FALSE_OR_POP:
+                if stack[sp - 1]:
+                    sp -= 1
+                else:
+                    self.pc = instruction.operand
+            
+            elif instruction.opcode == OpCode.JUMP_IF_TRUE_OR_POP:
+                if stack[sp - 1]:
                     self.pc = instruction.operand
+                else:
+                    sp -= 1
+            
+            elif instruction.opcode == OpCode.FOR_RANGE:
+                value = next(stack[sp - 1], None)
+                if value is None:
+                    sp -= 1  # The loop is done: drop the iterator
+                else:
+                    variables[instruction.operand[0]] = value
+                    target = instruction.operand[1]
+                    if max_steps is not None:
+                        # Backward jump: charge one loop iteration to the budget
+                        max_steps -= self.pc - target
+                        if max_steps <= 0:
+                            self.pc = target
+                            self.sp = sp
+                            return False
+                    self.pc = target
+            
+            elif instruction.opcode == OpCode.LOAD_INDEX:
+                sp -= 1
+                stack[sp - 1] = stack[sp - 1][stack[sp]]
+            
+            elif instruction.opcode == OpCode.STORE_INDEX:
+                sp -= 3
+                stack[sp][stack[sp + 1]] = stack[sp + 2]
+            
+            elif instruction.opcode == OpCode.CLOSED_FORM_LOOP:
+                self.run_closed_form(instruction.operand)
             
             elif instruction.opcode == OpCode.PRINT:
-                value = self.pop()
-                print(value)
+                sp -= 1
+                print(stack[sp], file=output)
             
             elif instruction.opcode == OpCode.HALT:
                 break
             
+            elif instruction.opcode == OpCode.BUILD_ARRAY:
+                sp -= instruction.operand
+                stack[sp] = build_array(stack[sp:sp + instruction.operand])
+                sp += 1
+            
+            elif instruction.opcode == OpCode.NEW_ARRAY:
+                sp -= 1
+                stack[sp - 1] = new_array(stack[sp - 1], stack[sp])
+            
+            elif instruction.opcode == OpCode.ARRAY_LENGTH:
+                stack[sp - 1] = array_length(stack[sp - 1])
+            
+            elif instruction.opcode == OpCode.ARRAY_FILL:
+                sp -= 1
+                stack[sp - 1] = fill(stack[sp - 1], stack[sp])
+            
+            elif instruction.opcode == OpCode.ARRAY_SUM:
+                stack[sp - 1] = array_sum(stack[sp - 1])
+            
+            elif instruction.opcode == OpCode.GET_RANGE:
+                sp -= 2
+                stack[sp - 1] = iter(counted_range(stack[sp - 1], stack[sp], stack[sp + 1]))
+            
+            else:
+                raise Exception(f"Unknown opcode: {instruction.opcode}")
+        
+        self.sp = sp
+        self.halted = True
+        return True
+    
+    def run_hooked(self, max_steps=None):
+        """Run loop that reports execution events to self.hooks.
+
+        Only used when hooks are registered. Instructions run in their
+        generic form, without quickening, and with the checks of run().
+        Locations are instruction indices: a branch is reported at its
+        conditional jump (or FOR_RANGE) and a loop iteration at the target
+        of the backward jump that starts it.
+        """
+        callbacks = self.hooks.callbacks
+        on_instruction = callbacks['instruction']
+        on_store = callbacks['store']
+        on_print = callbacks['print']
+        on_branch = callbacks['branch']
+        on_loop = callbacks['loop_iteration']
+        
+        # Variables that share a slot (see liveness.pack_slots) are reported
+        # under all of their names
+        names = {}
+        for name, index in self.bytecode['variables'].items():
+            names[index] = f"{names[index]}, {name}" if index in names else name
+        
+        if not self.started:
+            self.started = True
+            for callback in callbacks['start']:
+                callback()
+        
+        instructions = self.instructions
+        constants = self.constants
+        variables = self.variables
+        stack = self.stack
+        sp = self.sp
+        output = self.output
+        
+        while self.pc < len(instructions):
+            pc = self.pc
+            instruction = instructions[pc]
+            opcode = GENERIC_OPCODES.get(instruction.opcode, instruction.opcode)
+            self.pc += 1
+            for callback in on_instruction:
+                callback(pc, OPCODE_NAMES.get(opcode, opcode))
+            
+            if opcode in BINARY_OPERATIONS:
+                sp -= 1
+                stack[sp - 1] = BINARY_OPERATIONS[opcode](stack[sp - 1], stack[sp])
+            
+            elif opcode in UNARY_OPERATIONS:
+                stack[sp - 1] = UNARY_OPERATIONS[opcode](stack[sp - 1])
+            
+            elif opcode == OpCode.LOAD_CONST:
+                stack[sp] = constants[instruction.operand]
+                sp += 1
+            
+            elif opcode == OpCode.LOAD_VAR:
+                value = variables[instruction.operand]
+                if value is None:
+                    raise Exception(f"Variable at index {instruction.operand} not initialized")
+                stack[sp] = value
+                sp += 1
+            
+            elif opcode == OpCode.STORE_VAR:
+                sp -= 1
+                variables[instruction.operand] = stack[sp]
+                for callback in on_store:
+                    callback(names[instruction.operand], materialize(stack[sp]))
+            
+            elif opcode == OpCode.POP:
+                sp -= 1
+            
+            elif opcode == OpCode.STORE_INDEX:
+                sp -= 3
+                stack[sp][stack[sp + 1]] = stack[sp + 2]
+            
+            elif opcode == OpCode.BUILD_ARRAY:
+                sp -= instruction.operand
+                stack[sp] = build_array(stack[sp:sp + instruction.operand])
+                sp += 1
+            
+            elif opcode == OpCode.JUMP:
+                target = instruction.operand
+                if target < self.pc:
+                    for callback in on_loop:
+                        callback(target)
+                    if max_steps is not None:
+                        # Backward jump: charge one loop iteration to the budget
+                        max_steps -= self.pc - target
+                        if max_steps <= 0:
+                            self.pc = target
+                            self.sp = sp
+                            return False
+                self.pc = target
+            
+            elif opcode in (OpCode.JUMP_IF_FALSE, OpCode.JUMP_IF_FALSE_OR_POP,
+                            OpCode.JUMP_IF_TRUE_OR_POP):
+                condition = bool(stack[sp - 1])
+                for callback in on_branch:
+                    callback(pc, condition)
+                if opcode == OpCode.JUMP_IF_FALSE:
+                    sp -= 1
+                    jump = not condition
+                else:
+                    jump = condition == (opcode == OpCode.JUMP_IF_TRUE_OR_POP)
+                    if not jump:
+                        sp -= 1
+                if jump:
+                    self.pc = instruction.operand
+            
+            elif opcode == OpCode.FOR_RANGE:
+                value = next(stack[sp - 1], None)
+                for callback in on_branch:
+                    callback(pc, value is not None)
+                if value is None:
+                    sp -= 1
+                else:
+                    index, target = instruction.operand
+                    variables[index] = value
+                    for callback in on_store:
+                        callback(names[index], value)
+                    for callback in on_loop:
+                        callback(target)
+                    if max_steps is not None:
+                        max_steps -= self.pc - target
+                        if max_steps <= 0:
+                            self.pc = target
+                            self.sp = sp
+                            return False
+                    self.pc = target
+            
+            elif opcode == OpCode.GET_RANGE:
+                sp -= 2
+                stack[sp - 1] = iter(counted_range(stack[sp - 1], stack[sp], stack[sp + 1]))
+            
+            elif opcode == OpCode.CLOSED_FORM_LOOP:
+                self.run_closed_form(instruction.operand)
+                if self.pc == instruction.operand[-1]:
+                    induction, step, relation, bound, accumulators, end = instruction.operand
+                    for index in [induction] + [index for index, _, _ in accumulators]:
+                        for callback in on_store:
+                            callback(names[index], variables[index])
+            
+            elif opcode == OpCode.PRINT:
+                sp -= 1
+                print(stack[sp], file=output)
+                for callback in on_print:
+                    callback(str(stack[sp]))
+            
+            elif opcode == OpCode.HALT:
+                break
+            
             else:
                 raise Exception(f"Unknown opcode: {instruction.opcode}")
         
-        return True 
\ No newline at end of file
+        self.sp = sp
+        self.halted = True
+        for callback in callbacks['halt']:
+            callback()
+        return True
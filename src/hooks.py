@@ -0,0 +1,265 @@
+"""Execution event hooks for the VM and the AST interpreter.
+
+Callers subscribe callbacks to events and pass the Hooks to a
+VirtualMachine, Program.run() or an Interpreter:
+
+    hooks = Hooks()
+    hooks.on('print', lambda text: log.append(text))
+    VirtualMachine(bytecode, hooks=hooks).run()
+
+Events and the arguments their callbacks receive:
+
+    start                       a program starts running
+    instruction(location, name) before each instruction (VM) or node (interpreter)
+    store(name, value)          a variable is written
+    print(text)                 a value is printed
+    branch(location, condition) a condition was tested; condition is True or False
+    loop_iteration(location)    a loop starts another iteration
+    halt                        the program has finished
+
+On the VM, locations are instruction indices; in the interpreter they are
+the AST nodes. Without hooks, the VM and the interpreter run their usual
+code, so unused hooks cost nothing.
+
+Counters and Latencies are ready-made collectors. Their metrics can be
+exported together with to_json() and to_prometheus(), for example to serve a
+Prometheus scrape from a long-running worker.
+"""
+import json
+import threading
+import time
+
+EVENTS = ('start', 'instruction', 'store', 'print', 'branch', 'loop_iteration', 'halt')
+
+# Upper bounds in seconds of the latency histogram buckets
+DEFAULT_BUCKETS = (1e-6, 1e-5, 1e-4, 1e-3, 0.01, 0.1, 1.0, 10.0)
+
+METRIC_PREFIX = 'sl_'
+
+
+class Hooks:
+    """Callbacks subscribed to execution events."""
+    def __init__(self):
+        self.callbacks = {event: [] for event in EVENTS}
+
+    def on(self, event, callback):
+        """Call callback on every event of this kind. Returns the callback."""
+        if event not in self.callbacks:
+            raise Exception(f"Unknown event '{event}'")
+        self.callbacks[event].append(callback)
+        return callback
+
+
+class Locations:
+    """Readable labels for event locations.
+
+    Instruction indices are used as they are; AST nodes are numbered per
+    node type in the order they are first seen, as in While#1.
+    """
+    def __init__(self):
+        self.labels = {}
+        self.counts = {}
+
+    def label(self, location):
+        if isinstance(location, int):
+            return str(location)
+        if location not in self.labels:
+            kind = type(location).__name__
+            self.counts[kind] = self.counts.get(kind, 0) + 1
+            self.labels[location] = f"{kind}#{self.counts[kind]}"
+        return self.labels[location]
+
+
+class Metric:
+    """A named metric with samples of (sample name, labels, value)."""
+    def __init__(self, name, kind, help_text):
+        self.name = METRIC_PREFIX + name
+        self.kind = kind
+        self.help = help_text
+        self.samples = []
+
+    def add(self, value, labels=None, suffix=''):
+        self.samples.append((self.name + suffix, labels or {}, value))
+
+
+class Counters:
+    """Counts instructions by opcode, stores by variable, prints, branches
+    by location and outcome, loop iterations by location and runs."""
+    def __init__(self, hooks=None):
+        self.lock = threading.Lock()
+        self.locations = Locations()
+        self.runs = 0
+        self.instructions = {}
+        self.stores = {}
+        self.prints = 0
+        self.branches = {}
+        self.loop_iterations = {}
+        if hooks is not None:
+            self.attach(hooks)
+
+    def attach(self, hooks):
+        hooks.on('halt', self.on_halt)
+        hooks.on('instruction', self.on_instruction)
+        hooks.on('store', self.on_store)
+        hooks.on('print', self.on_print)
+        hooks.on('branch', self.on_branch)
+        hooks.on('loop_iteration', self.on_loop_iteration)
+
+    def on_halt(self):
+        with self.lock:
+            self.runs += 1
+
+    def on_instruction(self, location, name):
+        with self.lock:
+            self.instructions[name] = self.instructions.get(name, 0) + 1
+
+    def on_store(self, name, value):
+        with self.lock:
+            self.stores[name] = self.stores.get(name, 0) + 1
+
+    def on_print(self, text):
+        with self.lock:
+            self.prints += 1
+
+    def on_branch(self, location, condition):
+        with self.lock:
+            key = (self.locations.label(location), condition)
+            self.branches[key] = self.branches.get(key, 0) + 1
+
+    def on_loop_iteration(self, location):
+        with self.lock:
+            label = self.locations.label(location)
+            self.loop_iterations[label] = self.loop_iterations.get(label, 0) + 1
+
+    def metrics(self):
+        with self.lock:
+            runs = Metric('runs_total', 'counter', "Programs run to completion.")
+            runs.add(self.runs)
+            instructions = Metric('instructions_total', 'counter',
+                                  "Instructions or AST nodes executed, by operation.")
+            for name, count in sorted(self.instructions.items()):
+                instructions.add(count, {'operation': name})
+            stores = Metric('stores_total', 'counter', "Variable writes, by variable.")
+            for name, count in sorted(self.stores.items()):
+                stores.add(count, {'variable': name})
+            prints = Metric('prints_total', 'counter', "Values printed.")
+            prints.add(self.prints)
+            branches = Metric('branches_total', 'counter',
+                              "Conditions tested, by location and outcome.")
+            for (location, condition), count in sorted(self.branches.items()):
+                branches.add(count, {'location': location, 'outcome': str(condition).lower()})
+            loops = Metric('loop_iterations_total', 'counter', "Loop iterations, by location.")
+            for location, count in sorted(self.loop_iterations.items()):
+                loops.add(count, {'location': location})
+            return [runs, instructions, stores, prints, branches, loops]
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count of observed values per label set."""
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.series = {}  # Sorted label items -> [bucket counts, sum, count]
+
+    def observe(self, value, labels=()):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * len(self.buckets), 0.0, 0]
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[0][index] += 1
+        series[1] += value
+        series[2] += 1
+
+    def metric(self, name, help_text):
+        metric = Metric(name, 'histogram', help_text)
+        for labels, (counts, total, count) in sorted(self.series.items()):
+            labels = dict(labels)
+            for bound, bucket_count in zip(self.buckets, counts):
+                metric.add(bucket_count, dict(labels, le=repr(bound)), '_bucket')
+            metric.add(count, dict(labels, le='+Inf'), '_bucket')
+            metric.add(total, labels, '_sum')
+            metric.add(count, labels, '_count')
+        return metric
+
+
+class Latencies:
+    """Histograms of the time each run takes, from start to halt, and of the
+    time between successive iterations of each loop."""
+    def __init__(self, hooks=None, buckets=DEFAULT_BUCKETS):
+        self.lock = threading.Lock()
+        self.locations = Locations()
+        self.runs = Histogram(buckets)
+        self.iterations = Histogram(buckets)
+        # Runs on different threads are timed separately
+        self.local = threading.local()
+        if hooks is not None:
+            self.attach(hooks)
+
+    def attach(self, hooks):
+        hooks.on('start', self.on_start)
+        hooks.on('loop_iteration', self.on_loop_iteration)
+        hooks.on('halt', self.on_halt)
+
+    def on_start(self):
+        self.local.started = time.perf_counter()
+        self.local.last_iteration = {}  # Loop location -> time its last iteration started
+
+    def on_loop_iteration(self, location):
+        now = time.perf_counter()
+        last_iteration = getattr(self.local, 'last_iteration', None)
+        if last_iteration is None:
+            return
+        last = last_iteration.get(location)
+        if last is not None:
+            with self.lock:
+                self.iterations.observe(now - last, (('location', self.locations.label(location)),))
+        last_iteration[location] = now
+
+    def on_halt(self):
+        now = time.perf_counter()
+        started = getattr(self.local, 'started', None)
+        if started is not None:
+            with self.lock:
+                self.runs.observe(now - started)
+        self.local.started = None
+        self.local.last_iteration = None
+
+    def metrics(self):
+        with self.lock:
+            return [self.runs.metric('run_seconds', "Time from the start of a program to its halt."),
+                    self.iterations.metric('loop_iteration_seconds',
+                                           "Time between successive iterations of a loop.")]
+
+
+def to_json(*collectors):
+    """Export the metrics of collectors as a JSON string."""
+    data = {}
+    for collector in collectors:
+        for metric in collector.metrics():
+            data[metric.name] = {
+                'type': metric.kind,
+                'help': metric.help,
+                'samples': [{'name': name, 'labels': labels, 'value': value}
+                            for name, labels, value in metric.samples]
+            }
+    return json.dumps(data, indent=2)
+
+
+def escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def to_prometheus(*collectors):
+    """Export the metrics of collectors in the Prometheus text format."""
+    lines = []
+    for collector in collectors:
+        for metric in collector.metrics():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples:
+                if labels:
+                    pairs = ",".join(f'{key}="{escape_label(str(label))}"'
+                                     for key, label in labels.items())
+                    name = f"{name}{{{pairs}}}"
+                lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,56 @@
+from src.bytecode import BytecodeCompiler, VirtualMachine
+from src.typeinfer import TypeInferencer
+
+
+class IncrementalRunner:
+    """Run a program one top-level statement at a time.
+
+    Each statement is type-checked, compiled and run as soon as it has been
+    parsed, so a program read from a pipe starts producing output before the
+    rest of it has arrived. All statements share one compiler and one
+    VirtualMachine: the constant pool, the variable table and the values of
+    the variables carry over from one statement to the next, while each
+    statement's instructions are dropped once it has run.
+    """
+    def __init__(self, quicken=False):
+        self.inferencer = TypeInferencer()
+        self.compiler = BytecodeCompiler()
+        self.vm = None
+        self.quicken = quicken
+        self.statements_run = 0
+
+    def run(self, statements):
+        """Run every statement of an iterable such as Parser.statements().
+
+        Stops at and returns the type errors of the first statement that has
+        any; returns an empty list once all statements have run.
+        """
+        for statement in statements:
+            errors = self.execute(statement)
+            if errors:
+                return errors
+        return []
+
+    def execute(self, statement):
+        """Compile and run one statement, or return its type errors."""
+        inferencer = self.inferencer
+        inferencer.visit(statement)
+        errors = inferencer.errors
+        if not errors:
+            self.compiler.types = inferencer.types
+            self.compiler.instructions = []
+            self.compiler.compile(statement)
+            bytecode = self.compiler.finish()
+        # Both are keyed by node, so they would keep every statement alive
+        inferencer.types.clear()
+        inferencer.type_errors.clear()
+        if errors:
+            return errors
+
+        if self.vm is None:
+            self.vm = VirtualMachine(bytecode, quicken=self.quicken)
+        else:
+            self.vm.load(bytecode)
+        self.vm.run()
+        self.statements_run += 1
+        return []
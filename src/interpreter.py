@@ -1,27 +1,136 @@
 from src.parser import (
     BinOp, Number, Float, Boolean, String, StringInterpolation, UnaryOp, Variable,
     VarDecl, Assign, Print, If, While,
-    Compound, NoOp
+    Compound, NoOp, ClosedFormLoop
 )
+from src.arrays import BUILTINS, build_array
+from src.loop_idioms import evaluate_closed_form, counted_range
+from src.rope import Rope, ROPE_MIN_LENGTH, materialize
+from types import GeneratorType
+
+
+class LoopJump:
+    """The result of a break or continue statement.
+
+    Compound and If statements return it as soon as one of their statements
+    does, so it reaches the loop it belongs to without unwinding the visitors
+    with an exception.
+    """
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return self.name.upper()
+
+BREAK = LoopJump('break')
+CONTINUE = LoopJump('continue')
+
 
 class NodeVisitor:
+    """Dispatch AST nodes to visit_<node type> methods.
+
+    A visit method either returns its result directly, or is a generator
+    that yields the child nodes it needs and receives each child's result
+    back from the yield (value = yield node.left). Generators are driven
+    from an explicit stack instead of recursing, so deeply nested programs
+    do not exhaust the recursion limit.
+    """
     def visit(self, node):
-        method_name = 'visit_' + type(node).__name__
-        visitor = getattr(self, method_name, self.generic_visit)
-        return visitor(node)
+        visitors = self.visitors()
+        node_type = type(node)
+        result = (visitors.get(node_type) or self.find_visitor(node_type))(self, node)
+        if type(result) is not GeneratorType:
+            return result
+
+        stack = [result]
+        push, pop = stack.append, stack.pop
+        send = result.send
+        value = None
+        while True:
+            try:
+                child = send(value)
+            except StopIteration as stop:
+                pop()
+                if not stack:
+                    return stop.value
+                value = stop.value
+                send = stack[-1].send
+                continue
+            node_type = type(child)
+            result = (visitors.get(node_type) or self.find_visitor(node_type))(self, child)
+            if type(result) is GeneratorType:
+                push(result)
+                send = result.send
+                value = None
+            else:
+                value = result
+
+    def visitors(self):
+        """The node type -> visit function cache of this visitor class."""
+        cls = type(self)
+        if 'visitor_cache' not in cls.__dict__:
+            cls.visitor_cache = {}
+        return cls.visitor_cache
+
+    def find_visitor(self, node_type):
+        cls = type(self)
+        visitor = getattr(cls, 'visit_' + node_type.__name__, cls.generic_visit)
+        self.visitors()[node_type] = visitor
+        return visitor
 
     def generic_visit(self, node):
         raise Exception(f'No visit_{type(node).__name__} method')
 
+def reporting_visitor(visit, callbacks):
+    """Wrap a visit function to report an 'instruction' event first."""
+    def visitor(self, node):
+        for callback in callbacks:
+            callback(node, type(node).__name__)
+        return visit(self, node)
+    return visitor
+
 class Interpreter(NodeVisitor):
-    def __init__(self):
+    def __init__(self, hooks=None):
         self.global_scope = {}
+        
+        # Event callbacks (see src/hooks.py). With hooks, nodes are dispatched
+        # through a table of this instance that reports events, using the
+        # hooked_<node type> methods where they exist; without, the class's
+        # own table is used and nothing is reported
+        self.hooks = hooks
+        self.hooked_visitors = {}
+
+    def visitors(self):
+        if self.hooks is None:
+            return super().visitors()
+        return self.hooked_visitors
+
+    def find_visitor(self, node_type):
+        if self.hooks is None:
+            return super().find_visitor(node_type)
+        cls = type(self)
+        name = node_type.__name__
+        visitor = getattr(cls, 'hooked_' + name, None) or getattr(cls, 'visit_' + name, cls.generic_visit)
+        if self.hooks.callbacks['instruction']:
+            visitor = reporting_visitor(visitor, self.hooks.callbacks['instruction'])
+        self.hooked_visitors[node_type] = visitor
+        return visitor
 
     def visit_BinOp(self, node):
-        left = self.visit(node.left)
-        right = self.visit(node.right)
+        left = yield node.left
+        
+        # && and || only evaluate their right side when the left side does
+        # not decide the result
+        if node.op.type == 'AND':
+            return left and (yield node.right)
+        elif node.op.type == 'OR':
+            return left or (yield node.right)
+        
+        right = yield node.right
 
         if node.op.type == 'PLUS':
+            if type(left) is str and type(right) is str and len(left) >= ROPE_MIN_LENGTH:
+                return Rope.concat(left, right)  # Extend long strings without copying
             return left + right
         elif node.op.type == 'MINUS':
             return left - right
@@ -33,6 +142,12 @@ class Interpreter(NodeVisitor):
                 return left // right  # Integer division
             else:
                 return left / right   # Float division
+        elif node.op.type == 'MODULO':
+            if isinstance(left, (str, Rope)):
+                # Python would format the string instead
+                raise Exception("unsupported operand type(s) for %: "
+                                f"'str' and '{type(materialize(right)).__name__}'")
+            return left % right
         elif node.op.type == 'EQUALS':
             return left == right
         elif node.op.type == 'NOT_EQUALS':
@@ -45,13 +160,9 @@ class Interpreter(NodeVisitor):
             return left <= right
         elif node.op.type == 'GREATER_EQUAL':
             return left >= right
-        elif node.op.type == 'AND':
-            return left and right
-        elif node.op.type == 'OR':
-            return left or right
 
     def visit_UnaryOp(self, node):
-        expr = self.visit(node.expr)
+        expr = yield node.expr
         
         if node.op.type == 'PLUS':
             return +expr
@@ -77,7 +188,7 @@ class Interpreter(NodeVisitor):
         result = ""
         for part in node.parts:
             # Convert each part to string and concatenate
-            part_value = self.visit(part)
+            part_value = yield part
             result += str(part_value)
         return result
 
@@ -87,40 +198,180 @@ class Interpreter(NodeVisitor):
             raise Exception(f"Variable '{var_name}' not defined")
         return self.global_scope[var_name]
 
+    def visit_ArrayLiteral(self, node):
+        values = []
+        for element in node.elements:
+            values.append((yield element))
+        return build_array(values)
+
+    def visit_Index(self, node):
+        array = yield node.array
+        index = yield node.index
+        return array[index]
+
+    def visit_Call(self, node):
+        args = []
+        for arg in node.args:
+            args.append((yield arg))
+        return BUILTINS[node.name](*args)
+
     def visit_VarDecl(self, node):
         var_name = node.variable.value
-        var_value = self.visit(node.value)
+        var_value = yield node.value
         self.global_scope[var_name] = var_value
 
     def visit_Assign(self, node):
         var_name = node.left.value
         if var_name not in self.global_scope:
             raise Exception(f"Cannot assign to undeclared variable '{var_name}'")
-        var_value = self.visit(node.right)
+        var_value = yield node.right
         self.global_scope[var_name] = var_value
 
+    def visit_IndexAssign(self, node):
+        array = yield node.array
+        index = yield node.index
+        array[index] = yield node.value
+
+    def visit_CallStatement(self, node):
+        yield node.call
+
     def visit_Print(self, node):
-        value = self.visit(node.expr)
+        value = yield node.expr
         print(value)
         return value
 
     def visit_If(self, node):
-        condition = self.visit(node.condition)
+        condition = yield node.condition
         if condition:
-            return self.visit(node.body)
+            return (yield node.body)
         elif node.else_body:
-            return self.visit(node.else_body)
+            return (yield node.else_body)
 
     def visit_While(self, node):
-        while self.visit(node.condition):
-            self.visit(node.body)
+        while (yield node.condition):
+            if (yield node.body) is BREAK:
+                break
+
+    def visit_For(self, node):
+        values = yield from self.for_range(node)
+        scope = self.global_scope
+        name = node.variable.value
+        # A native range loop: the body cannot change which values come next
+        for value in values:
+            scope[name] = value
+            if (yield node.body) is BREAK:
+                break
+
+    def for_range(self, node):
+        """Evaluate the bounds of a For node and return its range."""
+        start = yield node.start
+        end = yield node.end
+        step = 1 if node.step is None else (yield node.step)
+        return counted_range(start, end, step)
+
+    def visit_ClosedFormLoop(self, node):
+        if not self.closed_form(node):
+            # Not all integers: run the loop as written
+            return (yield node.loop)
+
+    def closed_form(self, node):
+        """Store the results of a ClosedFormLoop without running it, if possible."""
+        scope = self.global_scope
+        bound = node.bound if isinstance(node.bound, int) else scope.get(node.bound)
+        accumulators = [
+            (scope.get(name), op, operand if operand is None or isinstance(operand, int)
+             else scope.get(operand))
+            for name, op, operand in node.accumulators
+        ]
+        result = evaluate_closed_form(
+            scope.get(node.induction), node.step, node.relation, bound, accumulators)
+        if result is None:
+            return False
+        
+        scope[node.induction], values = result
+        for (name, op, operand), value in zip(node.accumulators, values):
+            scope[name] = value
+        return True
 
     def visit_Compound(self, node):
         for statement in node.statements:
-            self.visit(statement)
+            result = yield statement
+            if result is BREAK or result is CONTINUE:
+                return result
+
+    def visit_Break(self, node):
+        return BREAK
+
+    def visit_Continue(self, node):
+        return CONTINUE
 
     def visit_NoOp(self, node):
         pass
 
+    # Visit methods used with hooks, which report events around the usual work
+
+    def report(self, event, *args):
+        for callback in self.hooks.callbacks[event]:
+            callback(*args)
+
+    def hooked_VarDecl(self, node):
+        yield from self.visit_VarDecl(node)
+        name = node.variable.value
+        self.report('store', name, materialize(self.global_scope[name]))
+
+    def hooked_Assign(self, node):
+        yield from self.visit_Assign(node)
+        name = node.left.value
+        self.report('store', name, materialize(self.global_scope[name]))
+
+    def hooked_Print(self, node):
+        value = yield from self.visit_Print(node)
+        self.report('print', str(value))
+        return value
+
+    def hooked_If(self, node):
+        condition = yield node.condition
+        self.report('branch', node, bool(condition))
+        if condition:
+            return (yield node.body)
+        elif node.else_body:
+            return (yield node.else_body)
+
+    def hooked_While(self, node):
+        while True:
+            condition = yield node.condition
+            self.report('branch', node, bool(condition))
+            if not condition:
+                break
+            if (yield node.body) is BREAK:
+                break
+            # Reported on the way back to the condition, where the VM has
+            # its backward jump, so a loop left by a break counts the same
+            self.report('loop_iteration', node)
+
+    def hooked_For(self, node):
+        values = yield from self.for_range(node)
+        name = node.variable.value
+        for value in values:
+            self.report('branch', node, True)
+            self.global_scope[name] = value
+            self.report('store', name, value)
+            self.report('loop_iteration', node)
+            if (yield node.body) is BREAK:
+                break
+        else:
+            self.report('branch', node, False)
+
+    def hooked_ClosedFormLoop(self, node):
+        if not self.closed_form(node):
+            return (yield node.loop)
+        for name in [node.induction] + [name for name, op, operand in node.accumulators]:
+            self.report('store', name, self.global_scope[name])
+
     def interpret(self, tree):
-        return self.visit(tree) 
\ No newline at end of file
+        if self.hooks is None:
+            return self.visit(tree)
+        self.report('start')
+        result = self.visit(tree)
+        self.report('halt')
+        return result 
\ No newline at end of file
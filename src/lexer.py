@@ -64,8 +64,8 @@ class Lexer:
         
         while self.current_char and (self.current_char.isdigit() or self.current_char == '.'):
             if self.current_char == '.':
-                if has_dot:
-                    break  # Second dot, not part of the number
+                if has_dot or self.peek() == '.':
+                    break  # Second dot or a range (1..10), not part of the number
                 has_dot = True
             result += self.current_char
             self.advance()
@@ -158,6 +158,11 @@ class Lexer:
                 self.skip_comment()
                 continue
 
+            if self.current_char == '.' and self.peek() == '.':
+                self.advance()
+                self.advance()
+                return Token('RANGE')
+
             if self.current_char.isdigit() or self.current_char == '.':
                 number_value = self.number()
                 if isinstance(number_value, int):
@@ -178,6 +183,12 @@ class Lexer:
                     return Token('ELSE')
                 if identifier == 'while':
                     return Token('WHILE')
+                if identifier == 'for':
+                    return Token('FOR')
+                if identifier == 'break':
+                    return Token('BREAK')
+                if identifier == 'continue':
+                    return Token('CONTINUE')
                 if identifier == 'true':
                     return Token('BOOLEAN', True)
                 if identifier == 'false':
@@ -207,6 +218,10 @@ class Lexer:
                 self.advance()
                 return Token('DIVIDE')
 
+            if self.current_char == '%':
+                self.advance()
+                return Token('MODULO')
+
             if self.current_char == '(':
                 self.advance()
                 return Token('LPAREN')
@@ -227,6 +242,18 @@ class Lexer:
                 self.advance()
                 return Token('SEMICOLON')
 
+            if self.current_char == '[':
+                self.advance()
+                return Token('LBRACKET')
+
+            if self.current_char == ']':
+                self.advance()
+                return Token('RBRACKET')
+
+            if self.current_char == ',':
+                self.advance()
+                return Token('COMMA')
+
             if self.current_char == '<':
                 self.advance()
                 if self.current_char == '=':
@@ -267,4 +294,49 @@ class Lexer:
 
             raise Exception(f'Invalid character: {self.current_char}')
 
-        return Token('EOF') 
\ No newline at end of file
+        return Token('EOF') 
+
+# Most characters StreamLexer reads from its input at a time
+READ_SIZE = 65536
+
+
+class StreamLexer(Lexer):
+    """Lexer that reads its input from a file object as tokens are requested.
+
+    Input is read a line at a time, so tokens are available as soon as the
+    text they come from has arrived, which lets a program be run while it is
+    still being read (for example from a pipe). Text before the current
+    token is dropped from the buffer once it grows past READ_SIZE.
+    """
+    def __init__(self, stream):
+        self.stream = stream
+        self.at_end = False
+        super().__init__('')
+        self.fill(0)
+        self.current_char = self.text[0] if self.text else None
+
+    def fill(self, position):
+        """Read until the buffer holds position or the input ends."""
+        while position >= len(self.text) and not self.at_end:
+            chunk = self.stream.readline(READ_SIZE)
+            if chunk:
+                self.text += chunk
+            else:
+                self.at_end = True
+
+    def advance(self):
+        self.pos += 1
+        if self.pos >= len(self.text):
+            self.fill(self.pos)
+        self.current_char = self.text[self.pos] if self.pos < len(self.text) else None
+
+    def peek(self):
+        if self.pos + 1 >= len(self.text):
+            self.fill(self.pos + 1)
+        return super().peek()
+
+    def get_next_token(self):
+        if self.pos > READ_SIZE:
+            self.text = self.text[self.pos:]
+            self.pos = 0
+        return super().get_next_token()
@@ -0,0 +1,214 @@
+from src.bytecode import OpCode, Instruction, JUMPS, basic_blocks, block_successors
+
+# Instructions that push one value and cannot fail, with the number of values
+# they pop. Their result can be dropped when it is only popped again.
+PURE_OPCODES = {
+    OpCode.LOAD_CONST: 0,
+    OpCode.NOT: 1,
+    OpCode.TO_STRING: 1,
+    OpCode.EQUALS: 2,
+    OpCode.NOT_EQUALS: 2,
+}
+
+
+def variable_uses(instruction):
+    """Return the variable slots an instruction reads and may write."""
+    if instruction.opcode == OpCode.LOAD_VAR:
+        return (instruction.operand,), ()
+    if instruction.opcode == OpCode.STORE_VAR:
+        return (), (instruction.operand,)
+    if instruction.opcode == OpCode.FOR_RANGE:
+        return (), (instruction.operand[0],)
+    if instruction.opcode == OpCode.CLOSED_FORM_LOOP:
+        induction, step, relation, bound, accumulators, end = instruction.operand
+        writes = (induction,) + tuple(index for index, _, _ in accumulators)
+        operands = [bound] + [operand for _, _, operand in accumulators if operand is not None]
+        reads = writes + tuple(value for kind, value in operands if kind == 'var')
+        return reads, writes
+    return (), ()
+
+
+def live_before(instruction, live):
+    """Variables live before an instruction, given those live after it."""
+    reads, _ = variable_uses(instruction)
+    if instruction.opcode == OpCode.STORE_VAR:
+        # CLOSED_FORM_LOOP may fall back to the loop without writing and
+        # FOR_RANGE only writes on its jump, so only a plain store ends a
+        # live range here (see live_variables for FOR_RANGE)
+        live = live - {instruction.operand}
+    return live | set(reads)
+
+
+def live_variables(instructions, exit_live=()):
+    """Backward liveness analysis over the control flow graph.
+
+    Returns a list with the set of variable slots live after each
+    instruction, that is, read on some path before being stored again.
+    exit_live are the slots read after the program halts, such as the
+    variables Program.run() returns.
+    """
+    blocks = basic_blocks(instructions)
+    successors = block_successors(instructions, blocks)
+
+    def live_out(start):
+        last = instructions[blocks[start] - 1]
+        live = set(exit_live) if last.opcode == OpCode.HALT else set()
+        for successor in successors[start]:
+            if last.opcode == OpCode.FOR_RANGE and successor == last.operand[1]:
+                # The jump into the loop body writes the loop variable
+                live |= live_in[successor] - {last.operand[0]}
+            else:
+                live |= live_in[successor]
+        return live
+
+    live_in = {start: set() for start in blocks}
+    changed = True
+    while changed:
+        changed = False
+        # Visiting later blocks first lets most programs settle in one pass
+        for start in sorted(blocks, reverse=True):
+            live = live_out(start)
+            for pc in range(blocks[start] - 1, start - 1, -1):
+                live = live_before(instructions[pc], live)
+            if live != live_in[start]:
+                live_in[start] = live
+                changed = True
+
+    live_after = [set() for _ in instructions]
+    for start, end in blocks.items():
+        live = live_out(start)
+        for pc in range(end - 1, start - 1, -1):
+            live_after[pc] = live
+            live = live_before(instructions[pc], live)
+    return live_after
+
+
+def remove_instructions(instructions, removed):
+    """Drop the instructions at the given indices and fix up jump targets.
+
+    A jump to a removed instruction goes to the next one that is kept.
+    """
+    new_index = []
+    count = 0
+    for pc in range(len(instructions)):
+        new_index.append(count)
+        if pc not in removed:
+            count += 1
+
+    kept = []
+    for pc, instruction in enumerate(instructions):
+        if pc in removed:
+            continue
+        if instruction.opcode in JUMPS:
+            instruction = Instruction(instruction.opcode, new_index[instruction.operand])
+        elif instruction.opcode in (OpCode.CLOSED_FORM_LOOP, OpCode.FOR_RANGE):
+            operand = instruction.operand
+            instruction = Instruction(instruction.opcode, operand[:-1] + (new_index[operand[-1]],))
+        kept.append(instruction)
+    return kept
+
+
+def eliminate_dead_stores(instructions, exit_live=()):
+    """Turn stores of values that are never read into POPs.
+
+    exit_live are the slots whose final values are read after the program
+    halts (see live_variables). Returns the number of stores removed.
+    """
+    live_after = live_variables(instructions, exit_live)
+    count = 0
+    for pc, instruction in enumerate(instructions):
+        if instruction.opcode == OpCode.STORE_VAR and instruction.operand not in live_after[pc]:
+            instructions[pc] = Instruction(OpCode.POP)
+            count += 1
+    return count
+
+
+def remove_unused_values(instructions, loads_are_safe):
+    """Remove pure computations whose result is immediately popped.
+
+    LOAD_VAR only counts as pure when loads_are_safe, that is when every
+    variable is definitely assigned before it is read, since reading an
+    unassigned variable is a runtime error. Returns the new instruction
+    list and the number of instructions removed.
+    """
+    total = 0
+    while True:
+        leaders = set(basic_blocks(instructions))
+        removed = set()
+        for pc in range(1, len(instructions)):
+            # A POP that is a jump target may pop values pushed on other paths
+            if instructions[pc].opcode != OpCode.POP or pc in leaders or pc - 1 in removed:
+                continue
+            previous = instructions[pc - 1]
+            if previous.opcode == OpCode.LOAD_VAR and loads_are_safe:
+                pops = 0
+            elif previous.opcode in PURE_OPCODES:
+                pops = PURE_OPCODES[previous.opcode]
+            else:
+                continue
+
+            if pops == 0:
+                removed.update((pc - 1, pc))
+            elif pops == 1:
+                removed.add(pc - 1)
+            else:
+                # Pop both operands instead of combining them
+                instructions[pc - 1] = Instruction(OpCode.POP)
+                total += 1
+        if not removed:
+            return instructions, total
+        instructions = remove_instructions(instructions, removed)
+        total += len(removed)
+
+
+def pack_slots(bytecode, instructions):
+    """Let variables whose live ranges never overlap share a slot.
+
+    Returns the new instructions and the new name to slot mapping. Names
+    that no longer appear in the program are dropped.
+    """
+    live_after = live_variables(instructions)
+    interference = {}  # Slot -> slots it must not share with, in order of appearance
+    for instruction in instructions:
+        reads, writes = variable_uses(instruction)
+        for slot in reads + writes:
+            interference.setdefault(slot, set())
+    for pc, instruction in enumerate(instructions):
+        # A value written while another variable is live must not replace it
+        for slot in variable_uses(instruction)[1]:
+            for other in live_after[pc]:
+                if other != slot:
+                    interference[slot].add(other)
+                    interference[other].add(slot)
+    # Variables live on entry are read before any store, so they hold values
+    # given before the program starts (inputs, see program.compile)
+    entry = live_before(instructions[0], live_after[0]) if instructions else set()
+    for slot in entry:
+        interference[slot].update(entry - {slot})
+
+    new_slot = {}
+    for slot, conflicts in interference.items():
+        taken = {new_slot[other] for other in conflicts if other in new_slot}
+        new_slot[slot] = next(index for index in range(len(interference)) if index not in taken)
+
+    packed = []
+    for instruction in instructions:
+        operand = instruction.operand
+        if instruction.opcode in (OpCode.LOAD_VAR, OpCode.STORE_VAR):
+            operand = new_slot[operand]
+        elif instruction.opcode == OpCode.FOR_RANGE:
+            operand = (new_slot[operand[0]], operand[1])
+        elif instruction.opcode == OpCode.CLOSED_FORM_LOOP:
+            induction, step, relation, bound, accumulators, end = operand
+            if bound[0] == 'var':
+                bound = ('var', new_slot[bound[1]])
+            accumulators = tuple(
+                (new_slot[index], op, ('var', new_slot[value[1]])
+                 if value is not None and value[0] == 'var' else value)
+                for index, op, value in accumulators)
+            operand = (new_slot[induction], step, relation, bound, accumulators, end)
+        packed.append(Instruction(instruction.opcode, operand))
+
+    variables = {name: new_slot[slot] for name, slot in bytecode['variables'].items()
+                 if slot in new_slot}
+    return packed, variables
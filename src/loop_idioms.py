@@ -0,0 +1,177 @@
+import math
+
+from src.parser import (
+    BinOp, Number, Variable, Assign, NoOp, If, While, For, Compound, ClosedFormLoop
+)
+from src.analysis import assigned_variables, body_statements, induction_step
+
+# Relations allowed for each direction of the induction variable
+INCREASING = ('LESS', 'LESS_EQUAL')
+DECREASING = ('GREATER', 'GREATER_EQUAL')
+
+
+def trip_count(start, step, relation, bound):
+    """Number of iterations of `while (i relation bound) { ...; i = i + step; }`."""
+    if relation == 'LESS':
+        count = -((start - bound) // step)
+    elif relation == 'LESS_EQUAL':
+        count = (bound - start) // step + 1
+    elif relation == 'GREATER':
+        count = -((bound - start) // -step)
+    else:
+        count = (start - bound) // -step + 1
+    return max(0, count)
+
+
+def counted_range(start, end, step):
+    """The values the variable of a for loop takes, from start to end inclusive."""
+    for value in (start, end, step):
+        # bool is a subclass of int, but true..false is not a range
+        if type(value) is not int:
+            raise Exception(f"for loop bounds and step must be integers, got {value!r}")
+    if step == 0:
+        raise Exception("for loop step must not be 0")
+    return range(start, end + 1 if step > 0 else end - 1, step)
+
+
+def evaluate_closed_form(start, step, relation, bound, accumulators):
+    """Compute the effect of a ClosedFormLoop without iterating.
+
+    accumulators is a list of (value, op, operand) where operand is None for
+    the induction variable. Returns the final induction value and the new
+    accumulator values, or None if any value is not an integer, in which case
+    the original loop has to run.
+    """
+    values = [start, bound]
+    for value, op, operand in accumulators:
+        values.append(value)
+        if operand is not None:
+            values.append(operand)
+    # bool is a subclass of int but true + 1 must keep its own semantics
+    if any(type(value) is not int for value in values):
+        return None
+
+    count = trip_count(start, step, relation, bound)
+    results = []
+    for value, op, operand in accumulators:
+        if operand is None:
+            # The induction variable takes start, start + step, ...
+            if op == 'MULTIPLY':
+                if count:
+                    stop = start + step * count
+                    value *= math.prod(range(start, stop, step))
+            else:
+                total = count * start + step * count * (count - 1) // 2
+                value = value + total if op == 'PLUS' else value - total
+        elif op == 'MULTIPLY':
+            value *= operand ** count
+        elif op == 'PLUS':
+            value += operand * count
+        else:
+            value -= operand * count
+        results.append(value)
+    return start + step * count, results
+
+
+class LoopIdiomPass:
+    """Replace counting loops with simple accumulations by ClosedFormLoop.
+
+    Recognizes loops of the form
+
+        while (i <= n) { sum = sum + i; prod = prod * k; i = i + 1; }
+
+    where the bound and every operand other than i are loop-invariant and
+    the body only contains such assignments (so nothing is printed).
+    """
+    def __init__(self, log=None):
+        self.log = log if log is not None else []
+
+    def run(self, tree):
+        return self.transform(tree)
+
+    def transform(self, node):
+        if isinstance(node, Compound):
+            node.statements = [self.transform(statement) for statement in node.statements]
+        elif isinstance(node, If):
+            node.body = self.transform(node.body)
+            if node.else_body:
+                node.else_body = self.transform(node.else_body)
+        elif isinstance(node, While):
+            replacement = self.match(node)
+            if replacement is not None:
+                return replacement
+            node.body = self.transform(node.body)
+        elif isinstance(node, For):
+            node.body = self.transform(node.body)
+        return node
+
+    def match(self, node):
+        condition = node.condition
+        if not (isinstance(condition, BinOp) and isinstance(condition.left, Variable)):
+            return None
+        relation = condition.op.type
+        if relation not in INCREASING + DECREASING:
+            return None
+        induction = condition.left.value
+        assigned = assigned_variables(node.body)
+
+        bound = self.invariant_operand(condition.right, assigned)
+        if bound is None:
+            return None
+
+        statements = [s for s in body_statements(node.body) if not isinstance(s, NoOp)]
+        if not statements or not all(isinstance(s, Assign) for s in statements):
+            return None
+        targets = [s.left.value for s in statements]
+        if len(set(targets)) != len(targets) or targets[-1] != induction:
+            return None
+
+        # The induction variable is stepped by a constant at the end of the body
+        step = induction_step(statements[-1], induction)
+        if step is None:
+            return None
+        if (step > 0 and relation not in INCREASING) or (step < 0 and relation not in DECREASING):
+            return None
+
+        accumulators = []
+        for statement in statements[:-1]:
+            accumulator = self.accumulation(statement, induction, assigned)
+            if accumulator is None:
+                return None
+            accumulators.append(accumulator)
+
+        self.log.append(
+            f"closed-form loop over '{induction}' with {len(accumulators)} accumulator(s)")
+        return ClosedFormLoop(node, induction, step, relation, bound, accumulators)
+
+    def invariant_operand(self, node, assigned):
+        """Return an integer constant or the name of an invariant variable."""
+        if isinstance(node, Number):
+            return node.value
+        if isinstance(node, Variable) and node.value not in assigned:
+            return node.value
+        return None
+
+    def accumulation(self, statement, induction, assigned):
+        """Match `acc = acc op operand` and return (acc, op, operand)."""
+        name = statement.left.value
+        value = statement.right
+        if name == induction or not isinstance(value, BinOp):
+            return None
+        op = value.op.type
+        if op not in ('PLUS', 'MINUS', 'MULTIPLY'):
+            return None
+
+        if isinstance(value.left, Variable) and value.left.value == name:
+            operand = value.right
+        elif op != 'MINUS' and isinstance(value.right, Variable) and value.right.value == name:
+            operand = value.left
+        else:
+            return None
+
+        if isinstance(operand, Variable) and operand.value == induction:
+            return (name, op, None)
+        operand = self.invariant_operand(operand, assigned)
+        if operand is None:
+            return None
+        return (name, op, operand)
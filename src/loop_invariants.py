@@ -0,0 +1,299 @@
+import copy
+
+from src.lexer import Token
+from src.parser import (
+    BinOp, Number, Float, Boolean, String, StringInterpolation, UnaryOp, Variable,
+    ArrayLiteral, Index, Call, VarDecl, Assign, If, While, For, Compound
+)
+from src.analysis import (
+    assignment_counts, used_variables, induction_step, expression_source, map_expressions, rebuild,
+    make_variable, make_number, body_statements, has_loop_jump
+)
+from src.typeinfer import TypeInferencer, INT, STRING, NUMERIC
+
+# A reduced product has to be updated on every iteration, which costs about
+# as much as one multiplication in the VM, so it only pays off when the
+# product is evaluated several times per iteration or inside an inner loop
+MIN_REDUCED_USES = 3
+
+# Uses inside a nested loop count as this many uses
+NESTED_LOOP_USES = MIN_REDUCED_USES
+
+
+class LoopInvariantPass:
+    """Hoist loop-invariant expressions out of while loops and strength-reduce
+    induction variable multiplications.
+
+    A loop
+
+        while (i < n * 2) { a = a + i * 4; b = b + i * 4; c = c - i * 4; i = i + 1; }
+
+    becomes
+
+        if (i < n * 2) {
+            var $t0 = i * 4;
+            var $t1 = n * 2;
+            while (i < $t1) { a = a + $t0; ...; i = i + 1; $t0 = $t0 + 4; }
+        }
+
+    The guard keeps loops that never run from evaluating the temporaries.
+    Only expressions that cannot fail are moved: their variables are
+    declared before the loop, and their operand types (from typeinfer) are
+    known to support the operation. Code that may be skipped on some
+    iterations (branches, inner loop bodies, statements after a break or
+    continue) may never run at all, so string repetitions, whose cost
+    depends on runtime values, are not moved out of it. Temporaries are
+    named $t0, $t1, ..., which cannot clash with identifiers in programs.
+    """
+    def __init__(self, log=None):
+        self.log = log if log is not None else []
+        self.temporary_count = 0
+
+    def run(self, tree):
+        inferencer = TypeInferencer()
+        self.types = inferencer.infer(tree)
+        self.type_errors = inferencer.type_errors
+        return self.transform(tree, set())
+
+    def transform(self, node, declared):
+        """Optimize the loops in a statement.
+
+        declared is the set of variables that are declared on every path
+        reaching the statement; it is updated to the set after it.
+        """
+        if isinstance(node, Compound):
+            node.statements = [self.transform(statement, declared)
+                               for statement in node.statements]
+        elif isinstance(node, VarDecl):
+            declared.add(node.variable.value)
+        elif isinstance(node, Assign):
+            declared.add(node.left.value)
+        elif isinstance(node, If):
+            after_body = set(declared)
+            node.body = self.transform(node.body, after_body)
+            if node.else_body:
+                after_else = set(declared)
+                node.else_body = self.transform(node.else_body, after_else)
+                declared.update(after_body & after_else)
+        elif isinstance(node, While):
+            # Inner loops first, so their temporaries can move further out
+            node.body = self.transform(node.body, set(declared))
+            return self.optimize_loop(node, declared)
+        elif isinstance(node, For):
+            # Only the loops inside are optimized; the loop variable is not
+            # declared after a loop that never runs
+            node.body = self.transform(node.body, declared | {node.variable.value})
+        return node
+
+    def optimize_loop(self, node, declared):
+        assigned = assignment_counts(node.body)
+        guard = copy.deepcopy(node.condition)
+        self.hoisted = []  # (temporary name, expression) in evaluation order
+        self.temporaries = {}  # expression source -> temporary name
+
+        self.strength_reduce(node, assigned, declared)
+
+        def hoist(expression, every_iteration=True):
+            # Code that may not run on every iteration may not run at all,
+            # so nothing whose cost depends on runtime values moves out of it
+            if self.is_invariant(expression, assigned, declared) and (
+                    every_iteration or not self.repeats_string(expression)):
+                return self.temporary(expression)
+            return rebuild(expression, lambda operand: hoist(operand, every_iteration))
+
+        node.condition = hoist(node.condition)
+        self.hoist_statements(body_statements(node.body), hoist, True)
+
+        if not self.hoisted:
+            return node
+        guarded = Compound()
+        guarded.statements = [VarDecl(make_variable(name), expression)
+                              for name, expression in self.hoisted]
+        guarded.statements.append(node)
+        return If(guard, guarded)
+
+    def hoist_statements(self, statements, hoist, every_iteration):
+        """Apply hoist to the expressions of statements, telling it whether
+        each runs on every iteration of the loop being optimized."""
+        for statement in statements:
+            if isinstance(statement, If):
+                statement.condition = hoist(statement.condition, every_iteration)
+                self.hoist_statements(body_statements(statement.body), hoist, False)
+                if statement.else_body:
+                    self.hoist_statements(body_statements(statement.else_body), hoist, False)
+            elif isinstance(statement, While):
+                statement.condition = hoist(statement.condition, every_iteration)
+                self.hoist_statements(body_statements(statement.body), hoist, False)
+            elif isinstance(statement, For):
+                statement.start = hoist(statement.start, every_iteration)
+                statement.end = hoist(statement.end, every_iteration)
+                if statement.step is not None:
+                    statement.step = hoist(statement.step, every_iteration)
+                self.hoist_statements(body_statements(statement.body), hoist, False)
+            elif isinstance(statement, Compound):
+                self.hoist_statements(statement.statements, hoist, every_iteration)
+            else:
+                map_expressions(statement, lambda expression: hoist(expression, every_iteration))
+            if has_loop_jump(statement):
+                every_iteration = False  # The rest of the body may be skipped
+
+    def temporary(self, expression, description="hoisted '{source}' out of a while loop into {name}"):
+        """Return a variable holding expression, evaluated before the loop."""
+        source = expression_source(expression)
+        if source not in self.temporaries:
+            name = f"$t{self.temporary_count}"
+            self.temporary_count += 1
+            self.temporaries[source] = name
+            self.hoisted.append((name, expression))
+            self.log.append(description.format(source=source, name=name))
+        return make_variable(self.temporaries[source])
+
+    def is_invariant(self, node, assigned, declared):
+        """True for an operation whose value is the same on every iteration
+        and which can be evaluated before the loop without failing."""
+        if not isinstance(node, (BinOp, UnaryOp, StringInterpolation)):
+            return False  # Nothing to save by moving a constant or variable
+        names = used_variables(node)
+        if any(name in assigned or name not in declared for name in names):
+            return False
+        return not self.may_fail(node)
+
+    def repeats_string(self, node):
+        """True if node repeats a string, whose size is only known at runtime."""
+        if isinstance(node, StringInterpolation):
+            return any(self.repeats_string(part) for part in node.parts)
+        if isinstance(node, UnaryOp):
+            return self.repeats_string(node.expr)
+        if not isinstance(node, BinOp):
+            return False
+        if node.op.type == 'MULTIPLY' and STRING in (self.types.get(node.left),
+                                                     self.types.get(node.right)):
+            return True
+        return self.repeats_string(node.left) or self.repeats_string(node.right)
+
+    def may_fail(self, node):
+        if isinstance(node, (ArrayLiteral, Index, Call)):
+            # Array elements change without an assignment to the variable,
+            # and each array literal must create a new array
+            return True
+        if isinstance(node, Variable):
+            return self.types.get(node) is None
+        if isinstance(node, (Number, Float, Boolean, String)):
+            return False
+        if isinstance(node, StringInterpolation):
+            return any(self.may_fail(part) for part in node.parts)
+        if isinstance(node, UnaryOp):
+            if self.may_fail(node.expr):
+                return True
+            return node.op.type != 'NOT' and self.types.get(node.expr) not in NUMERIC
+
+        if self.may_fail(node.left) or self.may_fail(node.right):
+            return True
+        op = node.op.type
+        if op in ('EQUALS', 'NOT_EQUALS', 'AND', 'OR'):
+            return False
+        if self.types.get(node.left) is None or self.types.get(node.right) is None:
+            return True
+        if node in self.type_errors:
+            return True
+        if op in ('DIVIDE', 'MODULO'):
+            # Only division by a non-zero constant is certain to succeed
+            return not (isinstance(node.right, (Number, Float)) and node.right.value != 0)
+        return False
+
+    def strength_reduce(self, node, assigned, declared):
+        """Replace i * k by a running product updated after each i = i + c."""
+        if not isinstance(node.body, Compound):
+            return
+        statements = node.body.statements
+        steps = {}
+        for statement in statements:
+            if isinstance(statement, Assign) and assigned.get(statement.left.value) == 1:
+                step = induction_step(statement, statement.left.value)
+                if step is not None:
+                    steps[statement.left.value] = step
+
+        def product(expression):
+            """Return (induction variable, factor) for i * k, or None."""
+            if not (isinstance(expression, BinOp) and expression.op.type == 'MULTIPLY'):
+                return None
+            for variable, factor in ((expression.left, expression.right),
+                                     (expression.right, expression.left)):
+                if (isinstance(variable, Variable) and variable.value in steps
+                        and variable.value in declared and self.types.get(variable) == INT):
+                    if isinstance(factor, Number):
+                        return variable.value, factor.value
+                    if (isinstance(factor, Variable) and factor.value not in assigned
+                            and factor.value in declared and self.types.get(factor) == INT):
+                        return variable.value, factor.value
+            return None
+
+        # Count the uses of each product to decide which ones to reduce
+        uses = {}
+
+        def count(expression, weight):
+            key = product(expression)
+            if key is not None:
+                uses[key] = uses.get(key, 0) + weight
+            rebuild(expression, lambda operand: count(operand, weight))
+            return expression
+
+        def count_statement(statement, weight):
+            if isinstance(statement, While):
+                count(statement.condition, NESTED_LOOP_USES)
+                count_statement(statement.body, NESTED_LOOP_USES)
+            elif isinstance(statement, For):
+                for bound in (statement.start, statement.end, statement.step):
+                    if bound is not None:
+                        count(bound, weight)
+                count_statement(statement.body, NESTED_LOOP_USES)
+            elif isinstance(statement, Compound):
+                for inner in statement.statements:
+                    count_statement(inner, weight)
+            elif isinstance(statement, If):
+                count(statement.condition, weight)
+                count_statement(statement.body, weight)
+                if statement.else_body:
+                    count_statement(statement.else_body, weight)
+            else:
+                map_expressions(statement, lambda expression: count(expression, weight))
+
+        count(node.condition, 1)
+        count_statement(node.body, 1)
+        reduced = {key: None for key, total in uses.items() if total >= MIN_REDUCED_USES}
+        if not reduced:
+            return
+
+        for key in reduced:
+            induction, factor = key
+            factor_node = make_number(factor) if isinstance(factor, int) else make_variable(factor)
+            reduced[key] = self.temporary(
+                BinOp(make_variable(induction), Token('MULTIPLY'), factor_node),
+                "strength-reduced '{source}' into {name}, updated by addition "
+                f"after each step of '{induction}'").value
+
+        def replace(expression):
+            key = product(expression)
+            if key in reduced:
+                return make_variable(reduced[key])
+            return rebuild(expression, replace)
+
+        node.condition = replace(node.condition)
+        updated = []
+        for statement in statements:
+            map_expressions(statement, replace)
+            updated.append(statement)
+            if isinstance(statement, Assign):
+                for (induction, factor), name in reduced.items():
+                    if statement.left.value != induction:
+                        continue
+                    step = steps[induction]
+                    if isinstance(factor, int):
+                        increment = make_number(step * factor)
+                    else:
+                        increment = self.temporary(
+                            BinOp(make_number(step), Token('MULTIPLY'), make_variable(factor)))
+                    updated.append(Assign(make_variable(name),
+                                          BinOp(make_variable(name), Token('PLUS'), increment)))
+        node.body.statements = updated
+
@@ -1,19 +1,86 @@
 import sys
 import time
-from src.lexer import Lexer
+from src.lexer import Lexer, StreamLexer
 from src.parser import Parser
 from src.interpreter import Interpreter
-from src.bytecode import BytecodeCompiler, VirtualMachine
+from src.bytecode import BytecodeCompiler, VirtualMachine, save_bytecode, load_bytecode
+from src.tiered import TieredInterpreter
+from src.threaded import ThreadedVirtualMachine
+from src.incremental import IncrementalRunner
+from src.typeinfer import TypeInferencer
+from src.optimizer import optimize, optimize_bytecode
+from src.unroll import DEFAULT_UNROLL_FACTOR
+from src.output_cache import OutputCache, MODES, DEFAULT_DIRECTORY
+
+def run_streaming(filename):
+    """Run each top-level statement as soon as it has been read and parsed."""
+    try:
+        source = sys.stdin if filename == '-' else open(filename, 'r')
+    except FileNotFoundError:
+        print(f"Error: File '{filename}' not found")
+        sys.exit(1)
+    
+    # Flush every line so output appears while the input is still arriving
+    sys.stdout.reconfigure(line_buffering=True)
+    print("Running statements as they are read:")
+    start_time = time.time()
+    
+    runner = IncrementalRunner(quicken='--quicken' in sys.argv[3:])
+    try:
+        statements = Parser(StreamLexer(source)).statements()
+    except Exception as e:
+        print(f"Parsing error: {e}")
+        sys.exit(1)
+    while True:
+        try:
+            statement = next(statements, None)
+        except Exception as e:
+            print(f"Parsing error: {e}")
+            sys.exit(1)
+        if statement is None:
+            break
+        try:
+            errors = runner.execute(statement)
+        except Exception as e:
+            print(f"VM runtime error: {e}")
+            sys.exit(1)
+        if errors:
+            for error in errors:
+                print(error)
+            sys.exit(1)
+    
+    end_time = time.time()
+    print(f"\nStatements run: {runner.statements_run}")
+    print(f"Execution time: {end_time - start_time:.6f} seconds")
+
+def run_cached(text, mode):
+    """Print the program's output from the output cache, running it on a miss."""
+    print(f"Running with output cache ({mode} mode):")
+    cache = OutputCache(DEFAULT_DIRECTORY)
+    output, status, hit = cache.run(text, mode)
+    cache.flush()
+    sys.stdout.write(output)
+    stats = cache.report()
+    print(f"\nOutput {'replayed from cache' if hit else 'computed by running the program'}")
+    print(f"Cache: {stats['hits']} hits, {stats['misses']} misses, {stats['entries']} entries")
+    if status:
+        sys.exit(status)
 
 def main():
     if len(sys.argv) < 2:
-        print("Usage: python main.py <filename> [--interpret|--bytecode]")
+        print("Usage: python main.py <filename> [--interpret|--bytecode|--adaptive|--stream]")
         sys.exit(1)
 
     filename = sys.argv[1]
     # Default to bytecode execution
     mode = 'bytecode' if len(sys.argv) <= 2 else sys.argv[2].lstrip('-')
     
+    # --stream reads the program incrementally (from stdin when the
+    # filename is -) instead of loading it first
+    if mode == 'stream':
+        run_streaming(filename)
+        return
+    
     try:
         with open(filename, 'r') as f:
             text = f.read()
@@ -21,14 +88,39 @@ def main():
         print(f"Error: File '{filename}' not found")
         sys.exit(1)
 
+    # With --cache-output, a program that already ran in this mode under the
+    # same language version is not run again: its output is replayed
+    if '--cache-output' in sys.argv[3:] and mode in MODES:
+        run_cached(text, mode)
+        return
+
     lexer = Lexer(text)
     parser = Parser(lexer)
     
-    try:
-        ast = parser.parse()
-    except Exception as e:
-        print(f"Parsing error: {e}")
-        sys.exit(1)
+    # Without --optimize, bytecode mode compiles each top-level statement as
+    # it is parsed; the other modes and the tree optimizations need the AST
+    # of the whole program
+    stream = mode == 'bytecode' and '--optimize' not in sys.argv[3:]
+    
+    if not stream:
+        try:
+            ast = parser.parse()
+        except Exception as e:
+            print(f"Parsing error: {e}")
+            sys.exit(1)
+    
+    if '--optimize' in sys.argv[3:]:
+        optimizations = []
+        # --unroll=N sets how many body copies partially unrolled loops get
+        unroll_factor = DEFAULT_UNROLL_FACTOR
+        for arg in sys.argv[3:]:
+            if arg.startswith('--unroll='):
+                unroll_factor = int(arg.split('=', 1)[1])
+        ast = optimize(ast, optimizations, unroll_factor=unroll_factor)
+        if '--debug' in sys.argv[3:]:
+            print("Optimizations:")
+            for description in optimizations:
+                print(f"  {description}")
     
     if mode == 'interpret':
         print("Running with direct AST interpretation:")
@@ -44,17 +136,75 @@ def main():
         end_time = time.time()
         print(f"\nExecution time: {end_time - start_time:.6f} seconds")
         
+    elif mode == 'adaptive':
+        print("Running with adaptive tiered execution:")
+        start_time = time.time()
+        
+        interpreter = TieredInterpreter()
+        try:
+            interpreter.interpret(ast)
+        except Exception as e:
+            print(f"Runtime error: {e}")
+            sys.exit(1)
+            
+        end_time = time.time()
+        print(f"\nLoops promoted to bytecode: {len(interpreter.compiled_loops)}")
+        print(f"Execution time: {end_time - start_time:.6f} seconds")
+        
     elif mode == 'bytecode':
         print("Running with bytecode compilation and VM execution:")
         
         # Compilation phase
         start_compile = time.time()
-        compiler = BytecodeCompiler()
-        bytecode = compiler.compile_ast(ast)
+        # With --cache-bytecode the compiled program is kept next to the
+        # source and reused (after verification) while the source is unchanged
+        cache_path = filename + ('.opt.sbc' if '--optimize' in sys.argv[3:] else '.sbc')
+        use_cache = '--cache-bytecode' in sys.argv[3:]
+        bytecode = None
+        if use_cache:
+            try:
+                bytecode = load_bytecode(cache_path, text)
+            except Exception as e:
+                print(f"Ignoring bytecode cache: {e}")
+        if bytecode is None:
+            if stream:
+                compiler = BytecodeCompiler()
+                try:
+                    bytecode = compiler.compile_stream(parser.statements(), TypeInferencer())
+                except Exception as e:
+                    print(f"Parsing error: {e}")
+                    sys.exit(1)
+                type_errors = compiler.type_errors
+            else:
+                inferencer = TypeInferencer()
+                types = inferencer.infer(ast)
+                type_errors = inferencer.errors
+                if not type_errors:
+                    compiler = BytecodeCompiler(types=types)
+                    bytecode = compiler.compile_ast(ast)
+            if type_errors:
+                for error in type_errors:
+                    print(error)
+                sys.exit(1)
+            if '--optimize' in sys.argv[3:]:
+                bytecode_optimizations = []
+                bytecode = optimize_bytecode(bytecode, bytecode_optimizations)
+                if '--debug' in sys.argv[3:]:
+                    print("Bytecode optimizations:")
+                    for description in bytecode_optimizations:
+                        print(f"  {description}")
+            if use_cache:
+                save_bytecode(bytecode, cache_path, text)
         end_compile = time.time()
         
+        debug = '--debug' in sys.argv[3:]
+        quicken = '--quicken' in sys.argv[3:]
+        # --threaded runs the program as direct-threaded code, which does
+        # not quicken
+        threaded = '--threaded' in sys.argv[3:]
+        
         # Display bytecode if requested
-        if len(sys.argv) > 3 and sys.argv[3] == '--debug':
+        if debug:
             print("\nBytecode:")
             for i, instruction in enumerate(bytecode['instructions']):
                 print(f"{i}: {instruction}")
@@ -62,15 +212,22 @@ def main():
             for i, constant in enumerate(bytecode['constants']):
                 print(f"{i}: {constant}")
             print("\nVariables:")
-            var_by_idx = {v: k for k, v in bytecode['variables'].items()}
+            # Variables packed into a shared slot are listed together
+            var_by_idx = {}
+            for name, index in bytecode['variables'].items():
+                var_by_idx.setdefault(index, []).append(name)
             for i in range(len(var_by_idx)):
-                print(f"{i}: {var_by_idx.get(i)}")
+                print(f"{i}: {', '.join(var_by_idx.get(i, []))}")
+            print(f"\nMax stack depth: {bytecode['max_stack']}")
             print()
         
         # Execution phase
         start_exec = time.time()
-        vm = VirtualMachine(bytecode)
         try:
+            if threaded:
+                vm = ThreadedVirtualMachine(bytecode)
+            else:
+                vm = VirtualMachine(bytecode, quicken=quicken)
             vm.run()
         except Exception as e:
             print(f"VM runtime error: {e}")
@@ -85,10 +242,16 @@ def main():
         print(f"\nCompile time: {compile_time:.6f} seconds")
         print(f"Execution time: {exec_time:.6f} seconds")
         print(f"Total time: {total_time:.6f} seconds")
+        
+        if quicken and debug and not threaded:
+            print("\nQuickening:")
+            for name, stats in vm.specialization_report().items():
+                print(f"{name}: {stats['specialized']} specialized, {stats['failed']} failed, "
+                      f"{stats['deoptimized']} deoptimized")
     
     else:
         print(f"Unknown execution mode: {mode}")
-        print("Available modes: --interpret, --bytecode")
+        print("Available modes: --interpret, --bytecode, --adaptive, --stream")
         sys.exit(1)
 
 if __name__ == "__main__":
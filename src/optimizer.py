@@ -0,0 +1,67 @@
+from src.loop_idioms import LoopIdiomPass
+from src.loop_invariants import LoopInvariantPass
+from src.unroll import LoopUnrollPass, DEFAULT_UNROLL_FACTOR
+from src.bytecode import Instruction, analyze_stack, variable_slots
+from src.liveness import eliminate_dead_stores, remove_unused_values, pack_slots
+from src.verifier import check_definite_assignment
+
+
+def optimize(tree, log=None, unroll_factor=DEFAULT_UNROLL_FACTOR):
+    """Run the AST optimization passes over a parsed program.
+
+    Each pass appends a short description of what it changed to log.
+    unroll_factor is the number of body copies per iteration for loops too
+    long to unroll completely (1 disables partial unrolling).
+    """
+    if log is None:
+        log = []
+    tree = LoopIdiomPass(log).run(tree)
+    # Loops that were replaced as a whole are left alone by the later passes
+    tree = LoopUnrollPass(log, factor=unroll_factor).run(tree)
+    tree = LoopInvariantPass(log).run(tree)
+    return tree
+
+
+def optimize_bytecode(bytecode, log=None, keep_variables=False):
+    """Run the liveness based optimizations over a compiled program.
+
+    Removes stores whose values are never read and pure computations whose
+    results are unused, then packs variables with disjoint live ranges into
+    shared slots. Only printed output is preserved: the final values of
+    variables that are never read again are not, and a packed slot holds
+    whichever of its variables was stored last. With keep_variables, every
+    variable keeps a slot of its own holding its final value, for callers
+    that read the variables after the run. Returns a new program.
+    """
+    if log is None:
+        log = []
+    instructions = [Instruction(i.opcode, i.operand) for i in bytecode['instructions']]
+    loads_are_safe = check_definite_assignment(bytecode)
+    exit_live = set(bytecode['variables'].values()) if keep_variables else ()
+
+    dead_stores = unused_values = 0
+    while True:
+        stores = eliminate_dead_stores(instructions, exit_live)
+        instructions, values = remove_unused_values(instructions, loads_are_safe)
+        dead_stores += stores
+        unused_values += values
+        if not stores and not values:
+            break
+    if dead_stores:
+        log.append(f"removed {dead_stores} dead store(s)")
+    if unused_values:
+        log.append(f"removed {unused_values} instruction(s) computing unused values")
+
+    variables = bytecode['variables']
+    if not keep_variables:
+        instructions, variables = pack_slots(bytecode, instructions)
+    optimized = {
+        'constants': bytecode['constants'],
+        'instructions': instructions,
+        'variables': variables,
+        'max_stack': analyze_stack(instructions)
+    }
+    if variable_slots(optimized) < variable_slots(bytecode):
+        log.append(f"packed {variable_slots(bytecode)} variables into "
+                   f"{variable_slots(optimized)} slots")
+    return optimized
@@ -0,0 +1,350 @@
+"""Cache of program outputs, replayed instead of running the program again.
+
+Programs have no input, clock or randomness, so the output of a source run
+by a given version of the language is always the same. OutputCache keeps the
+printed output and exit status of runs in a size-bounded LRU, in memory or in
+a directory on disk, keyed by a hash of the source, the execution mode and
+the language version.
+
+Only programs made of DETERMINISTIC_OPCODES are cached. An instruction added
+later, such as one reading a clock, is not in that list, so programs using it
+are run every time until it is added. The opcode table is also part of the
+key, so adding or renumbering an instruction drops every cached output.
+
+The cache can be inspected and cleared from the command line:
+
+    python -m src.output_cache stats [--dir DIR]
+    python -m src.output_cache clear [--dir DIR]
+    python -m src.output_cache invalidate <file>... [--dir DIR]
+"""
+import contextlib
+import hashlib
+import io
+import json
+import os
+import sys
+import tempfile
+from collections import OrderedDict
+
+try:
+    import fcntl
+except ImportError:  # Not on Windows, where flushes are not serialized
+    fcntl = None
+
+from src.lexer import Lexer
+from src.parser import Parser
+from src.interpreter import Interpreter
+from src.tiered import TieredInterpreter
+from src.bytecode import BytecodeCompiler, VirtualMachine, OpCode, OPCODE_NAMES
+from src.typeinfer import TypeInferencer
+
+# Bump when a change may alter what an existing program prints
+LANGUAGE_VERSION = 1
+
+# Instructions whose effect depends only on the program's own values
+DETERMINISTIC_OPCODES = frozenset([
+    OpCode.LOAD_CONST, OpCode.LOAD_VAR, OpCode.STORE_VAR, OpCode.POP,
+    OpCode.ADD, OpCode.SUBTRACT, OpCode.MULTIPLY, OpCode.DIVIDE,
+    OpCode.UNARY_PLUS, OpCode.UNARY_MINUS, OpCode.FLOOR_DIVIDE, OpCode.TRUE_DIVIDE, OpCode.MODULO,
+    OpCode.NOT, OpCode.AND, OpCode.OR, OpCode.CONCAT, OpCode.TO_STRING,
+    OpCode.EQUALS, OpCode.NOT_EQUALS, OpCode.LESS_THAN, OpCode.GREATER_THAN,
+    OpCode.LESS_EQUAL, OpCode.GREATER_EQUAL,
+    OpCode.JUMP, OpCode.JUMP_IF_FALSE, OpCode.CLOSED_FORM_LOOP,
+    OpCode.JUMP_IF_FALSE_OR_POP, OpCode.JUMP_IF_TRUE_OR_POP,
+    OpCode.GET_RANGE, OpCode.FOR_RANGE,
+    OpCode.PRINT, OpCode.HALT,
+    OpCode.BUILD_ARRAY, OpCode.NEW_ARRAY, OpCode.LOAD_INDEX, OpCode.STORE_INDEX,
+    OpCode.ARRAY_LENGTH, OpCode.ARRAY_FILL, OpCode.ARRAY_SUM,
+])
+
+MODES = ('bytecode', 'interpret', 'adaptive')
+
+DEFAULT_DIRECTORY = '.output_cache'
+DEFAULT_MAX_ENTRIES = 1000
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+STATS_FILE = 'stats.json'
+STATS_LOCK = 'stats.lock'
+STAT_NAMES = ('hits', 'misses', 'stores', 'ineligible', 'evictions', 'invalidations')
+
+
+def language_version():
+    """Version string of the language that cache keys include."""
+    table = ",".join(f"{name}={value}" for value, name in sorted(OPCODE_NAMES.items()))
+    return f"{LANGUAGE_VERSION}:{hashlib.sha256(table.encode('utf-8')).hexdigest()[:16]}"
+
+
+# Computed once: it cannot change while the process runs
+VERSION = language_version()
+
+
+def cache_key(source, mode):
+    key = f"{VERSION}\0{mode}\0{source}"
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def uses_deterministic_opcodes(bytecode):
+    return all(instruction.opcode in DETERMINISTIC_OPCODES
+               for instruction in bytecode['instructions'])
+
+
+def execute(source, mode='bytecode'):
+    """Run a program as src/main.py does and capture what it prints.
+
+    Returns (output, exit status, deterministic). Errors are printed with the
+    same messages as main.py and give status 1. deterministic is False when
+    the program may print something else on another run. Standard output is
+    redirected while the program runs, so only one program may run at a
+    time.
+    """
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        try:
+            tree = Parser(Lexer(source)).parse()
+        except Exception as e:
+            print(f"Parsing error: {e}")
+            return output.getvalue(), 1, True
+
+        if mode == 'bytecode':
+            inferencer = TypeInferencer()
+            types = inferencer.infer(tree)
+            if inferencer.errors:
+                for error in inferencer.errors:
+                    print(error)
+                return output.getvalue(), 1, True
+            bytecode = BytecodeCompiler(types=types).compile_ast(tree)
+            deterministic = uses_deterministic_opcodes(bytecode)
+            try:
+                VirtualMachine(bytecode).run()
+            except Exception as e:
+                print(f"VM runtime error: {e}")
+                return output.getvalue(), 1, deterministic
+        else:
+            deterministic = uses_deterministic_opcodes(BytecodeCompiler().compile_ast(tree))
+            interpreter = Interpreter() if mode == 'interpret' else TieredInterpreter()
+            try:
+                interpreter.interpret(tree)
+            except Exception as e:
+                print(f"Runtime error: {e}")
+                return output.getvalue(), 1, deterministic
+    return output.getvalue(), 0, deterministic
+
+
+class OutputCache:
+    """LRU cache of (output, exit status) per source and execution mode.
+
+    With a directory, entries are files in it and survive the process, and
+    the statistics are kept in the same directory; otherwise the cache lives
+    in memory. Statistics are counted in memory and only written by
+    flush(), which adds them to those on disk, so concurrent processes do
+    not overwrite each other's counts. The least recently used entries are dropped once there are
+    more than max_entries or their outputs exceed max_bytes in total.
+    """
+    def __init__(self, directory=None, max_entries=DEFAULT_MAX_ENTRIES,
+                 max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> size in bytes, least recently used first
+        self.values = {}  # key -> (output, status), in memory only
+        self.total_bytes = 0
+        self.stats = dict.fromkeys(STAT_NAMES, 0)
+        self.unsaved = dict.fromkeys(STAT_NAMES, 0)  # Counted since the last flush()
+
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            files = []
+            for name in os.listdir(directory):
+                if name.endswith('.json') and name != STATS_FILE:
+                    path = os.path.join(directory, name)
+                    try:
+                        files.append((os.path.getmtime(path), name[:-5], os.path.getsize(path)))
+                    except FileNotFoundError:
+                        pass  # Evicted by another process meanwhile
+            for _, key, size in sorted(files):
+                self.entries[key] = size
+                self.total_bytes += size
+            self.stats = self.load_stats(warn=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.json')
+
+    def get(self, source, mode='bytecode'):
+        """Return the cached (output, status) of a run, or None."""
+        key = cache_key(source, mode)
+        entry = None
+        if key in self.entries:
+            if self.directory is None:
+                entry = self.values[key]
+            else:
+                try:
+                    with open(self.path(key)) as f:
+                        data = json.load(f)
+                    os.utime(self.path(key))
+                    entry = data['output'], data['status']
+                except (OSError, ValueError, KeyError, TypeError):
+                    # Damaged, or evicted by another process: a miss
+                    self.remove(key)
+        if entry is None:
+            self.count('misses')
+            return None
+        self.entries.move_to_end(key)
+        self.count('hits')
+        return entry
+
+    def put(self, source, mode, output, status):
+        key = cache_key(source, mode)
+        if key in self.entries:
+            self.remove(key)
+        if self.directory is None:
+            self.values[key] = (output, status)
+            size = len(output.encode('utf-8'))
+        else:
+            data = json.dumps({'output': output, 'status': status}).encode('utf-8')
+            self.write_file(self.path(key), data)
+            # Not a stat of the file, which another process may already have evicted
+            size = len(data)
+        self.entries[key] = size
+        self.total_bytes += size
+        self.count('stores')
+        while len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes:
+            self.remove(next(iter(self.entries)))
+            self.count('evictions')
+
+    def run(self, source, mode='bytecode'):
+        """Return (output, status, hit), running the program on a miss."""
+        entry = self.get(source, mode)
+        if entry is not None:
+            return entry[0], entry[1], True
+        output, status, deterministic = execute(source, mode)
+        if deterministic:
+            self.put(source, mode, output, status)
+        else:
+            self.count('ineligible')
+        return output, status, False
+
+    def remove(self, key):
+        self.total_bytes -= self.entries.pop(key)
+        self.values.pop(key, None)
+        if self.directory is not None:
+            try:
+                os.remove(self.path(key))
+            except OSError:
+                pass
+
+    def invalidate(self, source):
+        """Drop the cached outputs of a source in every mode."""
+        removed = 0
+        for mode in MODES:
+            key = cache_key(source, mode)
+            if key in self.entries:
+                self.remove(key)
+                removed += 1
+        self.count('invalidations', removed)
+        return removed
+
+    def clear(self):
+        """Drop every entry and reset the statistics."""
+        for key in list(self.entries):
+            self.remove(key)
+        self.stats = dict.fromkeys(STAT_NAMES, 0)
+        self.unsaved = dict.fromkeys(STAT_NAMES, 0)
+        if self.directory is not None:
+            with self.stats_lock():
+                self.save_stats(self.stats)
+
+    def count(self, name, amount=1):
+        self.stats[name] += amount
+        self.unsaved[name] += amount
+
+    def flush(self):
+        """Add the statistics counted since the last flush to those on disk."""
+        if self.directory is None or not any(self.unsaved.values()):
+            return
+        with self.stats_lock():
+            stats = self.load_stats()
+            for name, amount in self.unsaved.items():
+                stats[name] += amount
+            self.save_stats(stats)
+        self.stats = stats
+        self.unsaved = dict.fromkeys(STAT_NAMES, 0)
+
+    @contextlib.contextmanager
+    def stats_lock(self):
+        """Keep other processes from updating the statistics file meanwhile."""
+        with open(os.path.join(self.directory, STATS_LOCK), 'w') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)  # Released when the file is closed
+            yield
+
+    def load_stats(self, warn=False):
+        stats = dict.fromkeys(STAT_NAMES, 0)
+        path = os.path.join(self.directory, STATS_FILE)
+        try:
+            with open(path) as f:
+                stats.update(json.load(f))
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            # The file is replaced atomically, so it is damaged rather than half written
+            if warn:
+                print(f"Ignoring unreadable cache statistics in '{path}': {e}", file=sys.stderr)
+        return stats
+
+    def save_stats(self, stats):
+        self.write_file(os.path.join(self.directory, STATS_FILE),
+                        json.dumps(stats).encode('utf-8'))
+
+    def write_file(self, path, data):
+        """Replace the file at path with data, so readers never see half of it.
+
+        The data goes to a temporary file of this process first, so
+        processes writing the same path at once do not collide.
+        """
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as f:
+                f.write(data)
+            os.replace(temporary, path)
+        except OSError:
+            with contextlib.suppress(OSError):
+                os.remove(temporary)
+            raise
+
+    def report(self):
+        """Statistics, entry count and size of the cache."""
+        lookups = self.stats['hits'] + self.stats['misses']
+        return dict(self.stats, entries=len(self.entries), bytes=self.total_bytes,
+                    hit_rate=self.stats['hits'] / lookups if lookups else 0.0)
+
+
+def main():
+    args = sys.argv[1:]
+    directory = DEFAULT_DIRECTORY
+    if '--dir' in args:
+        index = args.index('--dir')
+        directory = args[index + 1]
+        del args[index:index + 2]
+    if not args or args[0] not in ('stats', 'clear', 'invalidate'):
+        print("Usage: python -m src.output_cache stats|clear|invalidate <file>... [--dir DIR]")
+        sys.exit(1)
+
+    cache = OutputCache(directory)
+    command = args[0]
+    if command == 'stats':
+        for name, value in cache.report().items():
+            print(f"{name}: {value:.2%}" if name == 'hit_rate' else f"{name}: {value}")
+    elif command == 'clear':
+        count = len(cache.entries)
+        cache.clear()
+        print(f"Removed {count} cached outputs")
+    else:
+        for filename in args[1:]:
+            with open(filename) as f:
+                removed = cache.invalidate(f.read())
+            print(f"{filename}: removed {removed} cached outputs")
+        cache.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 from src.lexer import Token, Lexer
+from src.arrays import BUILTIN_ARITY
 
 # AST Nodes
 class BinOp:
@@ -41,6 +42,21 @@ class Variable:
         self.token = token
         self.value = token.value
 
+class ArrayLiteral:
+    def __init__(self, elements):
+        self.elements = elements
+
+class Index:
+    def __init__(self, array, index):
+        self.array = array
+        self.index = index
+
+class Call:
+    """A call of a builtin function (see src/arrays.py)."""
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
 class VarDecl:
     def __init__(self, variable, value):
         self.variable = variable
@@ -51,6 +67,17 @@ class Assign:
         self.left = left
         self.right = right
 
+class IndexAssign:
+    def __init__(self, array, index, value):
+        self.array = array  # Variable
+        self.index = index
+        self.value = value
+
+class CallStatement:
+    """A builtin call whose result is not used, as in fill(a, 0);"""
+    def __init__(self, call):
+        self.call = call
+
 class Print:
     def __init__(self, expr):
         self.expr = expr
@@ -66,6 +93,25 @@ class While:
         self.condition = condition
         self.body = body
 
+class For:
+    """for (variable in start..end step step) body
+
+    Counts from start to end inclusive; the bounds and the step (1 when
+    None) are evaluated once, before the first iteration.
+    """
+    def __init__(self, variable, start, end, step, body):
+        self.variable = variable
+        self.start = start
+        self.end = end
+        self.step = step
+        self.body = body
+
+class Break:
+    pass
+
+class Continue:
+    pass
+
 class Compound:
     def __init__(self):
         self.statements = []
@@ -73,6 +119,31 @@ class Compound:
 class NoOp:
     pass
 
+# Nodes produced by the optimizer
+class ClosedFormLoop:
+    """A counting while loop replaced by closed-form arithmetic.
+
+    The loop steps the induction variable by a constant while it compares
+    against an invariant bound, and each accumulator is updated with
+    acc = acc op operand, where operand is the induction variable (None) or
+    an invariant integer constant or variable name. The original loop is
+    kept and runs instead whenever the values are not all integers.
+    """
+    def __init__(self, loop, induction, step, relation, bound, accumulators):
+        self.loop = loop
+        self.induction = induction  # Variable name
+        self.step = step  # Non-zero integer
+        self.relation = relation  # Token type of the loop condition
+        self.bound = bound  # Integer constant or variable name
+        self.accumulators = accumulators  # List of (name, op token type, operand)
+
+# Binding strength of binary operators; all of them associate to the left
+BINARY_PRECEDENCE = {
+    'MULTIPLY': 2, 'DIVIDE': 2, 'MODULO': 2,
+    'PLUS': 1, 'MINUS': 1, 'EQUALS': 1, 'NOT_EQUALS': 1, 'LESS': 1, 'GREATER': 1,
+    'LESS_EQUAL': 1, 'GREATER_EQUAL': 1, 'AND': 1, 'OR': 1,
+}
+
 class Parser:
     def __init__(self, lexer):
         self.lexer = lexer
@@ -87,6 +158,12 @@ class Parser:
         else:
             self.error(f"Expected {token_type}, got {self.current_token.type}")
 
+    def eat_word(self, word):
+        """Eat an identifier that is a keyword only where it is expected, like 'in'."""
+        if self.current_token.type != 'IDENTIFIER' or self.current_token.value != word:
+            self.error(f"Expected '{word}', got {self.current_token.type}")
+        self.eat('IDENTIFIER')
+
     def parse_interpolation(self, expr_text):
         # Create a new lexer and parser for the interpolated expression
         interpolation_lexer = Lexer(expr_text)
@@ -94,7 +171,8 @@ class Parser:
         # Parse the expression
         return interpolation_parser.expr()
 
-    def factor(self):
+    def operand(self):
+        """Parse a literal, variable, array element, builtin call or string interpolation."""
         token = self.current_token
         if token.type == 'INTEGER':
             self.eat('INTEGER')
@@ -122,121 +200,219 @@ class Parser:
             
             self.eat('STRING_INTERPOLATION')
             return StringInterpolation(parts)
+        elif token.type == 'LBRACKET':
+            return ArrayLiteral(self.expression_list('LBRACKET', 'RBRACKET'))
         elif token.type == 'IDENTIFIER':
             self.eat('IDENTIFIER')
-            return Variable(token)
-        elif token.type == 'LPAREN':
-            self.eat('LPAREN')
-            node = self.expr()
-            self.eat('RPAREN')
+            if self.current_token.type == 'LPAREN':
+                return self.call(token.value)
+            node = Variable(token)
+            if self.current_token.type == 'LBRACKET':
+                self.eat('LBRACKET')
+                node = Index(node, self.expr())
+                self.eat('RBRACKET')
             return node
-        elif token.type in ('PLUS', 'MINUS', 'NOT'):
-            self.eat(token.type)
-            return UnaryOp(token, self.factor())
         self.error()
 
-    def term(self):
-        node = self.factor()
-
-        while self.current_token.type in ('MULTIPLY', 'DIVIDE'):
-            token = self.current_token
-            if token.type == 'MULTIPLY':
-                self.eat('MULTIPLY')
-            elif token.type == 'DIVIDE':
-                self.eat('DIVIDE')
-            node = BinOp(left=node, op=token, right=self.factor())
-
-        return node
+    def expression_list(self, opening, closing):
+        """Parse comma separated expressions between opening and closing tokens."""
+        self.eat(opening)
+        expressions = []
+        if self.current_token.type != closing:
+            expressions.append(self.expr())
+            while self.current_token.type == 'COMMA':
+                self.eat('COMMA')
+                expressions.append(self.expr())
+        self.eat(closing)
+        return expressions
+
+    def call(self, name):
+        """Parse the arguments of a builtin call; the name was already read."""
+        if name not in BUILTIN_ARITY:
+            self.error(f"Unknown function '{name}'")
+        args = self.expression_list('LPAREN', 'RPAREN')
+        if len(args) != BUILTIN_ARITY[name]:
+            self.error(f"{name}() takes {BUILTIN_ARITY[name]} argument(s), got {len(args)}")
+        return Call(name, args)
 
     def expr(self):
-        node = self.term()
+        """Parse an expression.
+
+        Operators are resolved with explicit operand and operator stacks
+        (shunting-yard) rather than one call per nesting level, so deeply
+        parenthesized expressions and long operator chains parse in linear
+        time without hitting the recursion limit. Unary operators bind to the
+        operand that follows them, * and / bind tighter than the remaining
+        binary operators, and binary operators associate to the left.
+        """
+        operands = []
+        operators = []  # BINARY_PRECEDENCE tokens, unary operator tokens and '(' markers
+        open_parens = 0
+
+        while True:
+            # Expecting an operand, possibly after unary operators and '('
+            token = self.current_token
+            if token.type in ('PLUS', 'MINUS', 'NOT'):
+                self.eat(token.type)
+                operators.append(('unary', token))
+                continue
+            if token.type == 'LPAREN':
+                self.eat('LPAREN')
+                operators.append(('paren', None))
+                open_parens += 1
+                continue
+            operands.append(self.operand())
+
+            while True:
+                # A complete operand: it is the argument of any unary operators before it
+                while operators and operators[-1][0] == 'unary':
+                    operands.append(UnaryOp(operators.pop()[1], operands.pop()))
+
+                token = self.current_token
+                if token.type == 'RPAREN' and open_parens:
+                    self.eat('RPAREN')
+                    self.reduce(operands, operators, 0)
+                    operators.pop()  # The matching '('
+                    open_parens -= 1
+                    continue
+                break
 
-        while self.current_token.type in ('PLUS', 'MINUS', 'EQUALS', 'NOT_EQUALS', 'LESS', 'GREATER', 'LESS_EQUAL', 'GREATER_EQUAL', 'AND', 'OR'):
             token = self.current_token
-            if token.type == 'PLUS':
-                self.eat('PLUS')
-            elif token.type == 'MINUS':
-                self.eat('MINUS')
-            elif token.type == 'EQUALS':
-                self.eat('EQUALS')
-            elif token.type == 'NOT_EQUALS':
-                self.eat('NOT_EQUALS')
-            elif token.type == 'LESS':
-                self.eat('LESS')
-            elif token.type == 'GREATER':
-                self.eat('GREATER')
-            elif token.type == 'LESS_EQUAL':
-                self.eat('LESS_EQUAL')
-            elif token.type == 'GREATER_EQUAL':
-                self.eat('GREATER_EQUAL')
-            elif token.type == 'AND':
-                self.eat('AND')
-            elif token.type == 'OR':
-                self.eat('OR')
-            node = BinOp(left=node, op=token, right=self.term())
+            if token.type not in BINARY_PRECEDENCE:
+                break
+            self.eat(token.type)
+            self.reduce(operands, operators, BINARY_PRECEDENCE[token.type])
+            operators.append(('binary', token))
 
-        return node
+        if open_parens:
+            self.eat('RPAREN')
+        self.reduce(operands, operators, 0)
+        return operands[0]
+
+    def reduce(self, operands, operators, precedence):
+        """Apply the stacked binary operators that bind at least as tightly as precedence."""
+        while (operators and operators[-1][0] == 'binary'
+               and BINARY_PRECEDENCE[operators[-1][1].type] >= precedence):
+            op = operators.pop()[1]
+            right = operands.pop()
+            operands.append(BinOp(left=operands.pop(), op=op, right=right))
 
     def statement(self):
-        if self.current_token.type == 'VAR':
-            self.eat('VAR')
-            var_node = Variable(self.current_token)
-            self.eat('IDENTIFIER')
-            self.eat('ASSIGN')
-            value_node = self.expr()
-            self.eat('SEMICOLON')
-            return VarDecl(var_node, value_node)
-        elif self.current_token.type == 'IDENTIFIER':
-            var_node = Variable(self.current_token)
-            self.eat('IDENTIFIER')
-            self.eat('ASSIGN')
-            value_node = self.expr()
-            self.eat('SEMICOLON')
-            return Assign(var_node, value_node)
-        elif self.current_token.type == 'PRINT':
-            self.eat('PRINT')
-            expr_node = self.expr()
-            self.eat('SEMICOLON')
-            return Print(expr_node)
-        elif self.current_token.type == 'IF':
-            self.eat('IF')
-            self.eat('LPAREN')
-            condition = self.expr()
-            self.eat('RPAREN')
-            
-            # Handle if body
-            if self.current_token.type == 'LBRACE':
-                body = self.compound_statement()
-            else:
-                body = self.statement()
-                
-            # Handle else part if present
-            else_body = None
-            if self.current_token.type == 'ELSE':
-                self.eat('ELSE')
-                if self.current_token.type == 'LBRACE':
-                    else_body = self.compound_statement()
+        """Parse one statement.
+
+        The bodies of if and while statements and the statements of a block
+        are parsed in the same loop, with the enclosing statements waiting on
+        an explicit stack of frames, so nesting depth is limited by memory
+        rather than the recursion limit. A frame is a list: ['if', condition],
+        ['else', condition, body], ['while', condition],
+        ['for', variable, start, end, step] or ['block', Compound].
+        """
+        frames = []
+        while True:
+            token = self.current_token
+            node = None
+            if token.type == 'VAR':
+                self.eat('VAR')
+                var_node = Variable(self.current_token)
+                self.eat('IDENTIFIER')
+                self.eat('ASSIGN')
+                value_node = self.expr()
+                self.eat('SEMICOLON')
+                node = VarDecl(var_node, value_node)
+            elif token.type == 'IDENTIFIER':
+                var_node = Variable(self.current_token)
+                self.eat('IDENTIFIER')
+                if self.current_token.type == 'LPAREN':
+                    node = CallStatement(self.call(token.value))
+                    self.eat('SEMICOLON')
+                elif self.current_token.type == 'LBRACKET':
+                    self.eat('LBRACKET')
+                    index_node = self.expr()
+                    self.eat('RBRACKET')
+                    self.eat('ASSIGN')
+                    value_node = self.expr()
+                    self.eat('SEMICOLON')
+                    node = IndexAssign(var_node, index_node, value_node)
                 else:
-                    else_body = self.statement()
-                
-            return If(condition, body, else_body)
-        elif self.current_token.type == 'WHILE':
-            self.eat('WHILE')
-            self.eat('LPAREN')
-            condition = self.expr()
-            self.eat('RPAREN')
-            
-            # Handle while body
-            if self.current_token.type == 'LBRACE':
-                body = self.compound_statement()
+                    self.eat('ASSIGN')
+                    value_node = self.expr()
+                    self.eat('SEMICOLON')
+                    node = Assign(var_node, value_node)
+            elif token.type in ('BREAK', 'CONTINUE'):
+                # A loop body is parsed in the same call, so its frame is here
+                if not any(frame[0] in ('while', 'for') for frame in frames):
+                    self.error(f"'{token.type.lower()}' outside a loop")
+                self.eat(token.type)
+                self.eat('SEMICOLON')
+                node = Break() if token.type == 'BREAK' else Continue()
+            elif token.type == 'PRINT':
+                self.eat('PRINT')
+                expr_node = self.expr()
+                self.eat('SEMICOLON')
+                node = Print(expr_node)
+            elif token.type in ('IF', 'WHILE'):
+                # The body is the next statement, in braces or not
+                self.eat(token.type)
+                self.eat('LPAREN')
+                condition = self.expr()
+                self.eat('RPAREN')
+                frames.append([token.type.lower(), condition])
+            elif token.type == 'FOR':
+                self.eat('FOR')
+                self.eat('LPAREN')
+                var_node = Variable(self.current_token)
+                self.eat('IDENTIFIER')
+                self.eat_word('in')
+                start = self.expr()
+                self.eat('RANGE')
+                end = self.expr()
+                step = None
+                if self.current_token.type == 'IDENTIFIER' and self.current_token.value == 'step':
+                    self.eat('IDENTIFIER')
+                    step = self.expr()
+                self.eat('RPAREN')
+                frames.append(['for', var_node, start, end, step])
+            elif token.type == 'LBRACE':
+                self.eat('LBRACE')
+                frames.append(['block', Compound()])
             else:
-                body = self.statement()
-                
-            return While(condition, body)
-        elif self.current_token.type == 'LBRACE':
-            return self.compound_statement()
-        else:
-            return self.empty()
+                # An empty statement consumes nothing, so anything but the end
+                # of a block, an else or the end of input could never be parsed
+                allowed = ('RBRACE', 'EOF', 'ELSE') if frames and frames[-1][0] == 'if' else ('RBRACE', 'EOF')
+                if token.type not in allowed:
+                    self.error()
+                node = self.empty()
+
+            # Hand the finished statement to the frames waiting for it
+            while node is not None and frames:
+                frame = frames[-1]
+                if frame[0] == 'if':
+                    if self.current_token.type == 'ELSE':
+                        self.eat('ELSE')
+                        frames[-1] = ['else', frame[1], node]
+                        node = None
+                    else:
+                        frames.pop()
+                        node = If(frame[1], node)
+                elif frame[0] == 'else':
+                    frames.pop()
+                    node = If(frame[1], frame[2], node)
+                elif frame[0] == 'while':
+                    frames.pop()
+                    node = While(frame[1], node)
+                elif frame[0] == 'for':
+                    frames.pop()
+                    node = For(frame[1], frame[2], frame[3], frame[4], node)
+                else:
+                    frame[1].statements.append(node)
+                    if self.current_token.type in ('RBRACE', 'EOF'):
+                        self.eat('RBRACE')
+                        frames.pop()
+                        node = frame[1]
+                    else:
+                        node = None
+            if node is not None:
+                return node
 
     def statement_list(self):
         node = Compound()
@@ -248,10 +424,9 @@ class Parser:
         return node
 
     def compound_statement(self):
-        self.eat('LBRACE')
-        nodes = self.statement_list()
-        self.eat('RBRACE')
-        return nodes
+        if self.current_token.type != 'LBRACE':
+            self.error(f"Expected LBRACE, got {self.current_token.type}")
+        return self.statement()
 
     def empty(self):
         return NoOp()
@@ -266,6 +441,22 @@ class Parser:
             self.error()
         return node
 
+    def statements(self):
+        """Yield the top-level statements of the program one at a time.
+
+        Accepts the same programs as parse(), but lets a caller compile each
+        statement and drop its tree before the next one is parsed.
+        """
+        if self.current_token.type == 'LBRACE':
+            yield self.compound_statement()
+        else:
+            yield self.statement()
+            while self.current_token.type not in ('RBRACE', 'EOF'):
+                yield self.statement()
+
+        if self.current_token.type != 'EOF':
+            self.error()
+
     def parse(self):
         node = self.program()
         return node 
\ No newline at end of file
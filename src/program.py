@@ -0,0 +1,101 @@
+from types import MappingProxyType
+
+from src.lexer import Lexer
+from src.parser import Parser
+from src.bytecode import BytecodeCompiler, VirtualMachine, program_fingerprint
+from src.typeinfer import TypeInferencer
+from src.optimizer import optimize as optimize_tree, optimize_bytecode
+from src.rope import materialize
+from src import verifier
+
+
+class Program:
+    """A compiled program that can be run any number of times.
+
+    Programs are immutable and hashable: instructions is a tuple of
+    (opcode, operand) pairs, constants a tuple, names the variable names in
+    slot order and inputs the names of the variables a caller supplies to
+    each run. Two programs compiled from the same source compare equal.
+    Each run gets its own VirtualMachine with a fresh stack and variable
+    table on top of the shared code, so any number of threads can run the
+    same Program at the same time.
+
+    Create programs with compile().
+    """
+    def __init__(self, bytecode, inputs):
+        variables = dict(bytecode['variables'])
+        # The VM only reads the code, and finds it already verified
+        code = MappingProxyType({
+            'constants': tuple(bytecode['constants']),
+            'instructions': tuple(bytecode['instructions']),
+            'variables': MappingProxyType(variables),
+            'max_stack': bytecode['max_stack'],
+            'verified': verifier.verify(bytecode, inputs),
+        })
+        object.__setattr__(self, 'bytecode', code)
+        object.__setattr__(self, 'instructions', tuple(
+            (instruction.opcode, instruction.operand) for instruction in code['instructions']))
+        object.__setattr__(self, 'constants', code['constants'])
+        object.__setattr__(self, 'names', tuple(sorted(variables, key=variables.get)))
+        object.__setattr__(self, 'inputs', tuple(inputs))
+        object.__setattr__(self, 'fingerprint', program_fingerprint(bytecode))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Program objects are immutable")
+
+    def __eq__(self, other):
+        return (isinstance(other, Program) and self.fingerprint == other.fingerprint
+                and self.inputs == other.inputs)
+
+    def __hash__(self):
+        return hash((self.fingerprint, self.inputs))
+
+    def __repr__(self):
+        return f"Program({len(self.instructions)} instructions, {self.fingerprint[:12]})"
+
+    def run(self, inputs=None, output=None, hooks=None):
+        """Run the program and return the final value of each variable.
+
+        inputs maps every name in self.inputs to its value. PRINT writes to
+        output, a text file object (sys.stdout by default). hooks is a
+        src.hooks.Hooks whose callbacks are called on the events of the run.
+        """
+        inputs = inputs or {}
+        for name in self.inputs:
+            if name not in inputs:
+                raise Exception(f"Missing input '{name}'")
+        variables = self.bytecode['variables']
+        vm = VirtualMachine(self.bytecode, output=output, hooks=hooks)
+        for name, value in inputs.items():
+            if name not in self.inputs:
+                raise Exception(f"Unknown input '{name}'")
+            if name in variables:  # Inputs the program never reads may be dropped
+                vm.variables[variables[name]] = value
+        vm.run()
+        return {name: materialize(vm.variables[index]) for name, index in variables.items()}
+
+
+def compile(source, inputs=(), optimize=False):
+    """Compile source code into a Program.
+
+    inputs names the variables the program reads without declaring them;
+    their values are passed to each Program.run(). With optimize, the AST
+    and bytecode optimizations of --optimize are applied. Raises an
+    exception for syntax and type errors.
+    """
+    tree = Parser(Lexer(source)).parse()
+    if optimize:
+        tree = optimize_tree(tree)
+    inferencer = TypeInferencer()
+    types = inferencer.infer(tree)
+    if inferencer.errors:
+        raise Exception("\n".join(inferencer.errors))
+
+    compiler = BytecodeCompiler(types=types)
+    for name in inputs:
+        compiler.get_variable_index(name)
+    bytecode = compiler.compile_ast(tree)
+    if optimize:
+        # run() returns the final value of every variable
+        bytecode = optimize_bytecode(bytecode, keep_variables=True)
+    return Program(bytecode, inputs)
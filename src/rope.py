@@ -0,0 +1,130 @@
+"""String values built by repeated appending.
+
+`s = s + "x"` on a Python string copies the whole string every time, so a
+loop building a long string takes quadratic time. Once a string is
+ROPE_MIN_LENGTH characters long, the VM and the interpreter extend it with a
+Rope instead: a list of pieces that each append adds to, which is joined into
+a single string only when the value is printed, compared or converted. Ropes
+behave exactly like the strings they stand for.
+"""
+
+# Strings at least this long are extended with a Rope instead of copied
+ROPE_MIN_LENGTH = 256
+
+
+class Rope:
+    """An immutable string stored as the first count entries of pieces.
+
+    Appending adds to the end of pieces and returns a new Rope one piece
+    longer, so ropes derived from each other share one list. If a rope was
+    already extended, appending to it again copies its own pieces first.
+    """
+    __slots__ = ('pieces', 'count', 'length', 'text')
+
+    def __init__(self, pieces, count, length):
+        self.pieces = pieces
+        self.count = count
+        self.length = length
+        self.text = None  # The joined string, once it has been needed
+
+    @classmethod
+    def concat(cls, left, right):
+        """left + right for two strings."""
+        return cls([left, right], 2, len(left) + len(right))
+
+    def __str__(self):
+        if self.text is None:
+            self.text = "".join(self.pieces[:self.count])
+            # Later appends start from the joined string
+            self.pieces = [self.text]
+            self.count = 1
+        return self.text
+
+    def __repr__(self):
+        return repr(str(self))
+
+    def __add__(self, other):
+        if type(other) is Rope:
+            other = str(other)
+        elif type(other) is not str:
+            return str(self) + other  # Fails exactly as for a string
+        pieces = self.pieces
+        if len(pieces) != self.count:
+            pieces = pieces[:self.count]
+        pieces.append(other)
+        return Rope(pieces, self.count + 1, self.length + len(other))
+
+    def __radd__(self, other):
+        return other + str(self)
+
+    def __len__(self):
+        return self.length
+
+    def __bool__(self):
+        return self.length > 0
+
+    def __hash__(self):
+        return hash(str(self))
+
+    def __eq__(self, other):
+        return str(self) == other
+
+    def __ne__(self, other):
+        return str(self) != other
+
+    def __lt__(self, other):
+        return str(self) < other
+
+    def __gt__(self, other):
+        return str(self) > other
+
+    def __le__(self, other):
+        return str(self) <= other
+
+    def __ge__(self, other):
+        return str(self) >= other
+
+    # Other operators give the result, or the error, of the string
+
+    def __mul__(self, other):
+        return str(self) * other
+
+    def __rmul__(self, other):
+        return other * str(self)
+
+    def __sub__(self, other):
+        return str(self) - other
+
+    def __rsub__(self, other):
+        return other - str(self)
+
+    def __truediv__(self, other):
+        return str(self) / other
+
+    def __rtruediv__(self, other):
+        return other / str(self)
+
+    def __floordiv__(self, other):
+        return str(self) // other
+
+    def __rfloordiv__(self, other):
+        return other // str(self)
+
+    def __mod__(self, other):
+        # % formats a Python string, which the language does not do
+        raise Exception("unsupported operand type(s) for %: "
+                        f"'str' and '{type(materialize(other)).__name__}'")
+
+    def __rmod__(self, other):
+        return other % str(self)
+
+    def __neg__(self):
+        return -str(self)
+
+    def __pos__(self):
+        return +str(self)
+
+
+def materialize(value):
+    """The plain value of a variable, turning ropes into strings."""
+    return str(value) if type(value) is Rope else value
@@ -0,0 +1,33 @@
+import asyncio
+
+# Default number of loop steps a VM may run before yielding to the event loop
+DEFAULT_SLICE = 1000
+
+
+async def run_async(vm, slice_steps=DEFAULT_SLICE, max_steps=None):
+    """Run a VirtualMachine cooperatively on the current event loop.
+
+    The VM runs in slices of slice_steps and yields to the event loop between
+    slices, so many programs can share one thread fairly. If max_steps is
+    given, an exception is raised once the program has used up that many
+    steps without halting.
+    """
+    used = 0
+    while not vm.run(max_steps=slice_steps):
+        used += slice_steps
+        if max_steps is not None and used >= max_steps:
+            raise Exception(f"Step budget of {max_steps} exceeded")
+        await asyncio.sleep(0)
+    return vm
+
+
+async def run_all(vms, slice_steps=DEFAULT_SLICE, max_steps=None):
+    """Interleave several VirtualMachines on the current event loop.
+
+    Returns one result per VM in the same order: the VM itself when it
+    halted, or the exception it raised.
+    """
+    return await asyncio.gather(
+        *(run_async(vm, slice_steps, max_steps) for vm in vms),
+        return_exceptions=True
+    )
@@ -0,0 +1,286 @@
+from src.bytecode import (
+    OpCode, VirtualMachine, GENERIC_OPCODES, OPCODE_NAMES, BINARY_OPERATIONS, UNARY_OPERATIONS,
+    modulo_values
+)
+from src.loop_idioms import counted_range
+from src.rope import Rope, ROPE_MIN_LENGTH
+from src.arrays import build_array
+
+
+class Halt(Exception):
+    """Raised by the HALT instruction to leave the threaded run loop."""
+
+
+class ThreadedVirtualMachine(VirtualMachine):
+    """Run bytecode as direct-threaded code.
+
+    The program is translated once, on the first run, into a list of Python
+    closures, one per instruction. Each is bound to its operand, to the
+    index of the instruction after it and to the machine's stack and
+    variables, does the instruction's work and returns the index of the
+    next instruction to run. The run loop is then just `pc = code[pc]()`:
+    no opcode is decoded per instruction, and a LOAD_VAR only checks that
+    its variable is set if the verifier could not prove it.
+
+    Programs always run to completion: there is no step budget, and hooks
+    and quickening are not supported. A machine restored from a snapshot
+    (see VirtualMachine.restore) resumes from it.
+    """
+    def __init__(self, bytecode, output=None):
+        super().__init__(bytecode, output=output)
+        self.code = None
+
+    def run(self, max_steps=None):
+        if max_steps is not None:
+            raise Exception("Threaded code has no step budget: run the program to completion")
+        if self.halted:
+            return True
+        if self.code is None:
+            self.code = self.translate()
+
+        code = self.code
+        pc = self.pc
+        try:
+            while True:
+                pc = code[pc]()
+        except Halt:
+            pass
+        self.sp = len(self.stack)
+        self.halted = True
+        return True
+
+    def translate(self):
+        """Return the closure for each instruction, followed by one that halts."""
+        # Grown and shrunk with append and pop instead of an sp, starting from
+        # the values of a restored snapshot
+        self.stack = self.stack[:self.sp]
+        code = [self.translate_instruction(pc, instruction)
+                for pc, instruction in enumerate(self.instructions)]
+        code.append(self.translate_instruction(len(code), None))
+        return code
+
+    def translate_instruction(self, pc, instruction):
+        """Decode one instruction and bind its work into a closure."""
+        stack = self.stack
+        push = stack.append
+        pop = stack.pop
+        variables = self.variables
+        output = self.output
+        next_pc = pc + 1
+
+        if instruction is None:
+            opcode, operand = OpCode.HALT, None
+        else:
+            # A program run before with quickening has specialized forms
+            opcode = GENERIC_OPCODES.get(instruction.opcode, instruction.opcode)
+            operand = instruction.operand
+
+        if opcode == OpCode.LOAD_CONST:
+            value = self.constants[operand]
+
+            def load_const():
+                push(value)
+                return next_pc
+            return load_const
+
+        if opcode == OpCode.LOAD_VAR:
+            if self.verified:
+                def load_var():
+                    push(variables[operand])
+                    return next_pc
+                return load_var
+
+            def load_var_checked():
+                value = variables[operand]
+                if value is None:
+                    raise Exception(f"Variable at index {operand} not initialized")
+                push(value)
+                return next_pc
+            return load_var_checked
+
+        if opcode == OpCode.STORE_VAR:
+            def store_var():
+                variables[operand] = pop()
+                return next_pc
+            return store_var
+
+        if opcode == OpCode.POP:
+            def pop_value():
+                pop()
+                return next_pc
+            return pop_value
+
+        # The most frequent operations are written out; the others call the
+        # functions the hooked run loop uses
+        if opcode == OpCode.ADD:
+            def add():
+                right = pop()
+                left = stack[-1]
+                if type(left) is str and type(right) is str and len(left) >= ROPE_MIN_LENGTH:
+                    stack[-1] = Rope.concat(left, right)
+                else:
+                    stack[-1] = left + right
+                return next_pc
+            return add
+
+        if opcode == OpCode.SUBTRACT:
+            def subtract():
+                right = pop()
+                stack[-1] = stack[-1] - right
+                return next_pc
+            return subtract
+
+        if opcode == OpCode.MULTIPLY:
+            def multiply():
+                right = pop()
+                stack[-1] = stack[-1] * right
+                return next_pc
+            return multiply
+
+        if opcode == OpCode.MODULO:
+            def modulo():
+                right = pop()
+                left = stack[-1]
+                if type(left) is str:
+                    modulo_values(left, right)  # Raises rather than formatting the string
+                stack[-1] = left % right
+                return next_pc
+            return modulo
+
+        if opcode == OpCode.EQUALS:
+            def equals():
+                right = pop()
+                stack[-1] = stack[-1] == right
+                return next_pc
+            return equals
+
+        if opcode == OpCode.LESS_THAN:
+            def less_than():
+                right = pop()
+                stack[-1] = stack[-1] < right
+                return next_pc
+            return less_than
+
+        if opcode == OpCode.GREATER_THAN:
+            def greater_than():
+                right = pop()
+                stack[-1] = stack[-1] > right
+                return next_pc
+            return greater_than
+
+        if opcode == OpCode.LESS_EQUAL:
+            def less_equal():
+                right = pop()
+                stack[-1] = stack[-1] <= right
+                return next_pc
+            return less_equal
+
+        if opcode == OpCode.GREATER_EQUAL:
+            def greater_equal():
+                right = pop()
+                stack[-1] = stack[-1] >= right
+                return next_pc
+            return greater_equal
+
+        if opcode in BINARY_OPERATIONS:
+            operation = BINARY_OPERATIONS[opcode]
+
+            def binary():
+                right = pop()
+                stack[-1] = operation(stack[-1], right)
+                return next_pc
+            return binary
+
+        if opcode in UNARY_OPERATIONS:
+            operation = UNARY_OPERATIONS[opcode]
+
+            def unary():
+                stack[-1] = operation(stack[-1])
+                return next_pc
+            return unary
+
+        if opcode == OpCode.JUMP:
+            def jump():
+                return operand
+            return jump
+
+        if opcode == OpCode.JUMP_IF_FALSE:
+            def jump_if_false():
+                return next_pc if pop() else operand
+            return jump_if_false
+
+        if opcode == OpCode.JUMP_IF_FALSE_OR_POP:
+            def jump_if_false_or_pop():
+                if stack[-1]:
+                    pop()
+                    return next_pc
+                return operand
+            return jump_if_false_or_pop
+
+        if opcode == OpCode.JUMP_IF_TRUE_OR_POP:
+            def jump_if_true_or_pop():
+                if stack[-1]:
+                    return operand
+                pop()
+                return next_pc
+            return jump_if_true_or_pop
+
+        if opcode == OpCode.GET_RANGE:
+            def get_range():
+                step = pop()
+                end = pop()
+                stack[-1] = iter(counted_range(stack[-1], end, step))
+                return next_pc
+            return get_range
+
+        if opcode == OpCode.FOR_RANGE:
+            index, body_start = operand
+
+            def for_range():
+                value = next(stack[-1], None)
+                if value is None:
+                    pop()  # The loop is done: drop the iterator
+                    return next_pc
+                variables[index] = value
+                return body_start
+            return for_range
+
+        if opcode == OpCode.CLOSED_FORM_LOOP:
+            def closed_form_loop():
+                # run_closed_form moves pc past the loop when the closed form applies
+                self.pc = next_pc
+                self.run_closed_form(operand)
+                return self.pc
+            return closed_form_loop
+
+        if opcode == OpCode.PRINT:
+            def print_value():
+                print(pop(), file=output)
+                return next_pc
+            return print_value
+
+        if opcode == OpCode.BUILD_ARRAY:
+            count = operand
+
+            def build():
+                values = stack[len(stack) - count:]
+                del stack[len(stack) - count:]
+                push(build_array(values))
+                return next_pc
+            return build
+
+        if opcode == OpCode.STORE_INDEX:
+            def store_index():
+                value = pop()
+                index = pop()
+                pop()[index] = value
+                return next_pc
+            return store_index
+
+        if opcode == OpCode.HALT:
+            def halt():
+                self.pc = pc
+                raise Halt()
+            return halt
+
+        raise Exception(f"Unknown opcode: {OPCODE_NAMES.get(opcode, opcode)}")
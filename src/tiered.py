@@ -0,0 +1,65 @@
+from src.interpreter import Interpreter, BREAK
+from src.bytecode import BytecodeCompiler, VirtualMachine
+from src import verifier
+
+# Iterations of a single while loop before it is promoted to bytecode
+DEFAULT_THRESHOLD = 100
+
+
+class TieredInterpreter(Interpreter):
+    """AST interpreter that promotes hot while loops to the bytecode VM.
+
+    Programs start in the tree-walking interpreter, which has no compile
+    cost. Every While node counts its iterations (across all the times it is
+    entered), and once a loop crosses the threshold it is compiled on its own
+    and the remaining iterations run on the VM with the same variables.
+    """
+    def __init__(self, threshold=DEFAULT_THRESHOLD):
+        super().__init__()
+        self.threshold = threshold
+        self.loop_counts = {}  # While node -> iterations run in the interpreter
+        self.compiled_loops = {}  # While node -> bytecode
+
+    def visit_While(self, node):
+        if node in self.compiled_loops:
+            self.run_compiled(node)
+            return
+
+        count = self.loop_counts.get(node, 0)
+        while (yield node.condition):
+            if (yield node.body) is BREAK:
+                break
+            count += 1
+            if count >= self.threshold:
+                # The loop is hot: finish it on the VM, starting with the
+                # condition check of the next iteration
+                self.loop_counts[node] = count
+                self.compiled_loops[node] = self.compile_loop(node)
+                self.run_compiled(node)
+                return
+        self.loop_counts[node] = count
+
+    def compile_loop(self, node):
+        """Compile a loop and verify it with the variables already bound.
+
+        The VM would verify it on load, before it is given the values of the
+        variables, and find every variable read before the loop assigns it
+        unassigned. Variables are never unbound, so the result also holds
+        each time the loop is entered again.
+        """
+        bytecode = BytecodeCompiler().compile_ast(node)
+        bound = [name for name in bytecode['variables'] if name in self.global_scope]
+        bytecode['verified'] = verifier.verify(bytecode, bound)
+        return bytecode
+
+    def run_compiled(self, node):
+        bytecode = self.compiled_loops[node]
+        vm = VirtualMachine(bytecode)
+
+        # Hand the current variable values to the VM and take them back after
+        for name, index in bytecode['variables'].items():
+            vm.variables[index] = self.global_scope.get(name)
+        vm.run()
+        for name, index in bytecode['variables'].items():
+            if vm.variables[index] is not None:
+                self.global_scope[name] = vm.variables[index]
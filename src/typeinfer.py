@@ -0,0 +1,313 @@
+from src.interpreter import NodeVisitor
+
+# Value types of the language. None stands for a type that is not known
+# statically (for example a variable assigned different types on two paths).
+INT = 'int'
+FLOAT = 'float'
+STRING = 'string'
+BOOLEAN = 'boolean'
+
+NUMERIC = (INT, FLOAT, BOOLEAN)
+
+# Array types and the type of their elements
+INT_ARRAY = 'int[]'
+FLOAT_ARRAY = 'float[]'
+ELEMENT_TYPES = {INT_ARRAY: INT, FLOAT_ARRAY: FLOAT}
+
+OPERATOR_SYMBOLS = {
+    'PLUS': '+', 'MINUS': '-', 'MULTIPLY': '*', 'DIVIDE': '/', 'MODULO': '%',
+    'LESS': '<', 'GREATER': '>', 'LESS_EQUAL': '<=', 'GREATER_EQUAL': '>=',
+}
+
+
+def merge_scopes(first, second):
+    """Join the variable types of two control flow paths."""
+    merged = {}
+    for name in set(first) | set(second):
+        # A variable missing on one path is undeclared there, so any value
+        # read after the join comes from the other path
+        if name not in first:
+            merged[name] = second[name]
+        elif name not in second or first[name] == second[name]:
+            merged[name] = first[name]
+        else:
+            merged[name] = None
+    return merged
+
+
+class TypeInferencer(NodeVisitor):
+    """Flow-sensitive type inference over the AST.
+
+    Assigns a type to every expression node (available in self.types) and
+    tracks the type of each variable along the program's control flow.
+    Operations that are certain to fail at runtime, such as subtracting a
+    string from a number, are collected in self.errors.
+    """
+    def __init__(self):
+        self.types = {}  # expression node -> type or None
+        self.scope = {}  # variable name -> type or None
+        self.type_errors = {}  # node -> message, from the latest visit
+        self.loop_exits = []  # Scopes at the break and continue statements of each enclosing loop
+
+    @property
+    def errors(self):
+        return list(self.type_errors.values())
+
+    def infer(self, tree):
+        self.visit(tree)
+        return self.types
+
+    def record(self, node, node_type):
+        self.types[node] = node_type
+        return node_type
+
+    def error(self, node, message):
+        self.type_errors[node] = f"Type error: {message}"
+
+    def visit_Number(self, node):
+        return self.record(node, INT)
+
+    def visit_Float(self, node):
+        return self.record(node, FLOAT)
+
+    def visit_Boolean(self, node):
+        return self.record(node, BOOLEAN)
+
+    def visit_String(self, node):
+        return self.record(node, STRING)
+
+    def visit_StringInterpolation(self, node):
+        for part in node.parts:
+            yield part
+        return self.record(node, STRING)
+
+    def visit_Variable(self, node):
+        return self.record(node, self.scope.get(node.value))
+
+    def visit_UnaryOp(self, node):
+        operand = yield node.expr
+        self.type_errors.pop(node, None)
+
+        if node.op.type == 'NOT':
+            return self.record(node, BOOLEAN)
+        if operand == STRING:
+            self.error(node, f"bad operand type for unary {OPERATOR_SYMBOLS[node.op.type]}: 'string'")
+            return self.record(node, None)
+        if operand == BOOLEAN:
+            return self.record(node, INT)
+        return self.record(node, operand)
+
+    def visit_BinOp(self, node):
+        left = yield node.left
+        right = yield node.right
+        self.type_errors.pop(node, None)
+        op = node.op.type
+
+        if op in ('EQUALS', 'NOT_EQUALS'):
+            return self.record(node, BOOLEAN)
+        if op in ('AND', 'OR'):
+            # && and || yield one of their operands
+            return self.record(node, left if left == right else None)
+        if left is None or right is None:
+            if op in ('LESS', 'GREATER', 'LESS_EQUAL', 'GREATER_EQUAL'):
+                return self.record(node, BOOLEAN)
+            return self.record(node, None)
+
+        if left in NUMERIC and right in NUMERIC:
+            if op in ('LESS', 'GREATER', 'LESS_EQUAL', 'GREATER_EQUAL'):
+                return self.record(node, BOOLEAN)
+            return self.record(node, FLOAT if FLOAT in (left, right) else INT)
+
+        if left == STRING and right == STRING:
+            if op == 'PLUS':
+                return self.record(node, STRING)
+            if op in ('LESS', 'GREATER', 'LESS_EQUAL', 'GREATER_EQUAL'):
+                return self.record(node, BOOLEAN)
+        elif (op == 'MULTIPLY' and STRING in (left, right) and FLOAT not in (left, right)
+              and left not in ELEMENT_TYPES and right not in ELEMENT_TYPES):
+            # Repeating a string by a whole number
+            return self.record(node, STRING)
+
+        self.error(node, f"unsupported operand types for {OPERATOR_SYMBOLS[op]}: "
+                         f"'{left}' and '{right}'")
+        return self.record(node, None)
+
+    def visit_ArrayLiteral(self, node):
+        element_types = []
+        for element in node.elements:
+            element_types.append((yield element))
+        self.type_errors.pop(node, None)
+        for element_type in element_types:
+            if element_type is not None and element_type not in NUMERIC:
+                self.error(node, f"array elements must be numbers, not '{element_type}'")
+                return self.record(node, None)
+        if FLOAT in element_types:
+            return self.record(node, FLOAT_ARRAY)
+        if None in element_types:
+            return self.record(node, None)
+        return self.record(node, INT_ARRAY)
+
+    def check_array(self, node, array_type, what):
+        """Report a value of known type that is not an array."""
+        if array_type is not None and array_type not in ELEMENT_TYPES:
+            self.error(node, f"{what} expects an array, not '{array_type}'")
+            return False
+        return True
+
+    def check_index(self, node, array_type, index_type):
+        if not self.check_array(node, array_type, "indexing"):
+            return False
+        if index_type is not None and index_type not in (INT, BOOLEAN):
+            self.error(node, f"array index must be an int, not '{index_type}'")
+            return False
+        return True
+
+    def visit_Index(self, node):
+        array_type = yield node.array
+        index_type = yield node.index
+        self.type_errors.pop(node, None)
+        if not self.check_index(node, array_type, index_type):
+            return self.record(node, None)
+        return self.record(node, ELEMENT_TYPES.get(array_type))
+
+    def visit_Call(self, node):
+        arg_types = []
+        for arg in node.args:
+            arg_types.append((yield arg))
+        self.type_errors.pop(node, None)
+
+        if node.name == 'array':
+            size_type, value_type = arg_types
+            if size_type is not None and size_type not in (INT, BOOLEAN):
+                self.error(node, f"array() size must be an int, not '{size_type}'")
+                return self.record(node, None)
+            if value_type is not None and value_type not in NUMERIC:
+                self.error(node, f"array elements must be numbers, not '{value_type}'")
+                return self.record(node, None)
+            if value_type is None:
+                return self.record(node, None)
+            return self.record(node, FLOAT_ARRAY if value_type == FLOAT else INT_ARRAY)
+
+        array_type = arg_types[0]
+        if not self.check_array(node, array_type, f"{node.name}()"):
+            return self.record(node, None)
+        if node.name == 'len':
+            return self.record(node, INT)
+        if node.name == 'sum':
+            return self.record(node, ELEMENT_TYPES.get(array_type))
+        # fill(array, value)
+        self.check_element(node, array_type, arg_types[1])
+        return self.record(node, array_type)
+
+    def check_element(self, node, array_type, value_type):
+        """Report a value that cannot be stored in an array of array_type."""
+        if value_type is None:
+            return
+        if value_type not in NUMERIC or (array_type == INT_ARRAY and value_type == FLOAT):
+            self.error(node, f"cannot store '{value_type}' in '{array_type or 'array'}'")
+
+    def visit_VarDecl(self, node):
+        self.scope[node.variable.value] = yield node.value
+
+    def visit_Assign(self, node):
+        self.scope[node.left.value] = yield node.right
+
+    def visit_IndexAssign(self, node):
+        array_type = yield node.array
+        index_type = yield node.index
+        value_type = yield node.value
+        self.type_errors.pop(node, None)
+        if self.check_index(node, array_type, index_type):
+            self.check_element(node, array_type, value_type)
+
+    def visit_CallStatement(self, node):
+        yield node.call
+
+    def visit_Print(self, node):
+        yield node.expr
+
+    def visit_If(self, node):
+        yield node.condition
+        before = dict(self.scope)
+
+        yield node.body
+        after_body = self.scope
+
+        self.scope = dict(before)
+        if node.else_body:
+            yield node.else_body
+        self.scope = merge_scopes(after_body, self.scope)
+
+    def visit_While(self, node):
+        # Widen the loop entry types until they stop changing; the last pass
+        # leaves the types and errors for the fixed point in place
+        entry = dict(self.scope)
+        while True:
+            self.scope = dict(entry)
+            yield node.condition
+            breaks = yield from self.loop_body(node)
+            widened = merge_scopes(entry, self.scope)
+            if widened == entry:
+                break
+            entry = widened
+
+        # The loop exits after evaluating its condition at the entry state,
+        # or at a break
+        self.scope = self.merge_breaks(entry, breaks)
+
+    def visit_For(self, node):
+        bound_types = [(yield node.start), (yield node.end)]
+        if node.step is not None:
+            bound_types.append((yield node.step))
+        self.type_errors.pop(node, None)
+        for bound_type in bound_types:
+            if bound_type is not None and bound_type != INT:
+                self.error(node, f"for loop bounds and step must be ints, not '{bound_type}'")
+                break
+
+        # As for a while loop, with the loop variable an int in the body
+        entry = dict(self.scope)
+        while True:
+            self.scope = dict(entry)
+            self.scope[node.variable.value] = INT
+            breaks = yield from self.loop_body(node)
+            widened = merge_scopes(entry, self.scope)
+            if widened == entry:
+                break
+            entry = widened
+        self.scope = self.merge_breaks(entry, breaks)
+
+    def loop_body(self, node):
+        """Visit a loop body, leaving the scope for the next iteration.
+
+        A continue starts the next iteration with its own scope, so those are
+        joined in. Returns the scopes at the loop's break statements.
+        """
+        breaks, continues = [], []
+        self.loop_exits.append((breaks, continues))
+        yield node.body
+        self.loop_exits.pop()
+        for scope in continues:
+            self.scope = merge_scopes(self.scope, scope)
+        return breaks
+
+    def merge_breaks(self, scope, breaks):
+        for exit_scope in breaks:
+            scope = merge_scopes(scope, exit_scope)
+        return scope
+
+    def visit_Break(self, node):
+        self.loop_exits[-1][0].append(dict(self.scope))
+
+    def visit_Continue(self, node):
+        self.loop_exits[-1][1].append(dict(self.scope))
+
+    def visit_ClosedFormLoop(self, node):
+        yield node.loop
+
+    def visit_Compound(self, node):
+        for statement in node.statements:
+            yield statement
+
+    def visit_NoOp(self, node):
+        pass
@@ -0,0 +1,279 @@
+import copy
+import operator
+
+from src.lexer import Token
+from src.parser import (
+    BinOp, Number, Boolean, UnaryOp, Variable, VarDecl, Assign, If, While, For, Compound,
+    NoOp, ClosedFormLoop
+)
+from src.analysis import (
+    assigned_variables, assignment_counts, used_variables, body_statements, induction_step,
+    has_loop_jump, map_expressions, rebuild, make_variable, make_number
+)
+from src.loop_idioms import INCREASING, DECREASING, trip_count
+from src.bytecode import BytecodeCompiler
+
+# Loops with at most this many iterations are unrolled completely
+MAX_FULL_UNROLL = 16
+
+# Copies of the body per iteration of a partially unrolled loop
+DEFAULT_UNROLL_FACTOR = 4
+
+# Largest number of bytecode instructions unrolling may turn a loop body into
+UNROLL_BUDGET = 256
+
+ARITHMETIC = {
+    'PLUS': operator.add, 'MINUS': operator.sub, 'MULTIPLY': operator.mul,
+}
+COMPARISONS = {
+    'EQUALS': operator.eq, 'NOT_EQUALS': operator.ne,
+    'LESS': operator.lt, 'GREATER': operator.gt,
+    'LESS_EQUAL': operator.le, 'GREATER_EQUAL': operator.ge,
+}
+
+
+def make_boolean(value):
+    return Boolean(Token('BOOLEAN', value))
+
+
+def substitute(expression, constants):
+    """Replace variables with a known integer value by that value."""
+    if isinstance(expression, Variable) and expression.value in constants:
+        return make_number(constants[expression.value])
+    return rebuild(expression, lambda operand: substitute(operand, constants))
+
+
+def fold(expression):
+    """Evaluate operations on integer and boolean constants."""
+    expression = rebuild(expression, fold)
+    if isinstance(expression, UnaryOp) and isinstance(expression.expr, (Number, Boolean)):
+        value = expression.expr.value
+        if expression.op.type == 'NOT':
+            return make_boolean(not value)
+        if isinstance(expression.expr, Number):
+            return make_number(value if expression.op.type == 'PLUS' else -value)
+    elif isinstance(expression, BinOp):
+        left, right, op = expression.left, expression.right, expression.op.type
+        if op in ('AND', 'OR') and isinstance(left, (Number, Boolean)):
+            # && yields its left operand if that is false, || if it is true
+            return left if bool(left.value) == (op == 'OR') else right
+        if isinstance(left, Number) and isinstance(right, Number):
+            if op in ARITHMETIC:
+                return make_number(ARITHMETIC[op](left.value, right.value))
+            if op == 'DIVIDE' and right.value != 0:
+                return make_number(left.value // right.value)
+            if op == 'MODULO' and right.value != 0:
+                return make_number(left.value % right.value)
+            if op in COMPARISONS:
+                return make_boolean(COMPARISONS[op](left.value, right.value))
+    return expression
+
+
+def fold_statement(node, constants):
+    """Substitute constants into a statement and fold its expressions.
+
+    An if whose condition becomes constant is replaced by the branch taken.
+    """
+    if isinstance(node, Compound):
+        node.statements = [fold_statement(statement, constants) for statement in node.statements]
+    elif isinstance(node, If):
+        node.condition = fold(substitute(node.condition, constants))
+        if isinstance(node.condition, (Number, Boolean)):
+            taken = node.body if node.condition.value else node.else_body
+            return fold_statement(taken, constants) if taken else NoOp()
+        node.body = fold_statement(node.body, constants)
+        if node.else_body:
+            node.else_body = fold_statement(node.else_body, constants)
+    elif isinstance(node, While):
+        node.condition = fold(substitute(node.condition, constants))
+        node.body = fold_statement(node.body, constants)
+    else:
+        map_expressions(node, lambda expression: fold(substitute(expression, constants)))
+    return node
+
+
+def contains_closed_form(node):
+    if isinstance(node, ClosedFormLoop):
+        return True
+    if isinstance(node, Compound):
+        return any(contains_closed_form(statement) for statement in node.statements)
+    if isinstance(node, If):
+        return contains_closed_form(node.body) or (
+            node.else_body is not None and contains_closed_form(node.else_body))
+    if isinstance(node, (While, For)):
+        return contains_closed_form(node.body)
+    return False
+
+
+def compiled_size(node):
+    """Number of bytecode instructions a statement compiles to."""
+    return len(BytecodeCompiler().compile_ast(node)['instructions']) - 1  # Without HALT
+
+
+class LoopUnrollPass:
+    """Unroll while loops whose trip count is known at compile time.
+
+    Integer constants are propagated through the program to find loops like
+
+        var count = 3;
+        while (count > 0) { print count; count = count - 1; }
+
+    where the induction variable starts at a known value, is stepped by a
+    constant once per iteration and compared against a known bound. Loops
+    with up to MAX_FULL_UNROLL iterations become straight-line code with the
+    induction variable replaced by its value in each copy, so conditions on
+    it fold away. Longer loops run factor copies of the body per iteration,
+    followed by the leftover iterations. Unrolled code is limited to budget
+    instructions.
+    """
+    def __init__(self, log=None, factor=DEFAULT_UNROLL_FACTOR, budget=UNROLL_BUDGET):
+        self.log = log if log is not None else []
+        self.factor = factor
+        self.budget = budget
+
+    def run(self, tree):
+        return self.transform(tree, {})
+
+    def transform(self, node, constants):
+        """Unroll the loops in a statement.
+
+        constants maps the variables known to hold an integer constant before
+        the statement to their values; it is updated to hold after it.
+        """
+        if isinstance(node, Compound):
+            node.statements = [self.transform(statement, constants)
+                               for statement in node.statements]
+        elif isinstance(node, (VarDecl, Assign)):
+            if isinstance(node, VarDecl):
+                name, value = node.variable.value, node.value
+            else:
+                name, value = node.left.value, node.right
+            value = fold(substitute(value, constants))
+            if isinstance(value, Number):
+                constants[name] = value.value
+            else:
+                constants.pop(name, None)
+        elif isinstance(node, If):
+            node.body = self.transform(node.body, dict(constants))
+            if node.else_body:
+                node.else_body = self.transform(node.else_body, dict(constants))
+            self.forget(node, constants)
+        elif isinstance(node, While):
+            # Inner loops first; only values the loop never changes are known inside
+            assigned = assigned_variables(node.body)
+            node.body = self.transform(node.body, {name: value for name, value in constants.items()
+                                                   if name not in assigned})
+            return self.unroll(node, constants)
+        elif isinstance(node, For):
+            # The bounds are evaluated once, before the loop changes anything
+            node.start = fold(substitute(node.start, constants))
+            node.end = fold(substitute(node.end, constants))
+            if node.step is not None:
+                node.step = fold(substitute(node.step, constants))
+            assigned = assigned_variables(node)
+            node.body = self.transform(node.body, {name: value for name, value in constants.items()
+                                                   if name not in assigned})
+            self.forget(node, constants)
+        elif isinstance(node, ClosedFormLoop):
+            self.forget(node, constants)
+        return node
+
+    def forget(self, node, constants):
+        for name in assigned_variables(node):
+            constants.pop(name, None)
+
+    def unroll(self, node, constants):
+        loop = self.analyze(node, constants)
+        entry = dict(constants)
+        self.forget(node, constants)
+        if loop is None:
+            return node
+        induction, start, step, bound, trip = loop
+        final = start + trip * step
+        constants[induction] = final
+
+        statements = body_statements(node.body)
+        body_size = compiled_size(node.body)
+        before = compiled_size(node)
+
+        if trip == 0:
+            self.log.append(f"removed while loop over '{induction}' that never runs")
+            return NoOp()
+
+        if trip <= MAX_FULL_UNROLL and trip * body_size <= self.budget:
+            unrolled = Compound()
+            unrolled.statements = self.copies(statements, induction, start, step, trip)
+            # Inner loops may have constant bounds in the copies
+            unrolled = self.transform(unrolled, entry)
+            constants.clear()
+            constants.update(entry)
+            after = compiled_size(unrolled) / trip
+            self.log.append(f"fully unrolled while loop over '{induction}' ({trip} iterations): "
+                            f"{before} -> {after:.1f} instructions per iteration")
+            return unrolled
+
+        if self.factor > 1 and trip >= 2 * self.factor and self.factor * body_size <= self.budget:
+            groups = trip // self.factor
+            body = Compound()
+            body.statements = [copy.deepcopy(statement)
+                               for _ in range(self.factor) for statement in statements]
+            # A group runs while its last iteration would still run
+            condition = BinOp(make_variable(induction), node.condition.op,
+                              make_number(bound - (self.factor - 1) * step))
+            main = While(condition, body)
+            unrolled = Compound()
+            unrolled.statements = [main] + self.copies(
+                statements, induction, start + groups * self.factor * step, step,
+                trip - groups * self.factor)
+            after = compiled_size(main) / self.factor
+            self.log.append(f"unrolled while loop over '{induction}' by {self.factor} "
+                            f"({trip} iterations): {before} -> {after:.1f} instructions per iteration")
+            return unrolled
+
+        return node
+
+    def analyze(self, node, constants):
+        """Return (induction, start, step, bound, trip count) or None."""
+        condition = node.condition
+        if not (isinstance(condition, BinOp) and isinstance(condition.left, Variable)):
+            return None
+        relation = condition.op.type
+        induction = condition.left.value
+        if relation not in INCREASING + DECREASING or induction not in constants:
+            return None
+        if contains_closed_form(node.body):
+            return None  # It refers to the induction variable by name
+        if has_loop_jump(node.body):
+            return None  # The trip count is only an upper bound
+
+        counts = assignment_counts(node.body)
+        if counts.get(induction) != 1 or used_variables(condition.right) & set(counts):
+            return None
+        bound = fold(substitute(condition.right, constants))
+        if not isinstance(bound, Number):
+            return None
+
+        steps = [induction_step(statement, induction) for statement in body_statements(node.body)]
+        steps = [step for step in steps if step is not None]
+        if len(steps) != 1:
+            return None
+        step = steps[0]
+        if (step > 0 and relation not in INCREASING) or (step < 0 and relation not in DECREASING):
+            return None
+
+        start = constants[induction]
+        return induction, start, step, bound.value, trip_count(start, step, relation, bound.value)
+
+    def copies(self, statements, induction, start, step, count):
+        """Straight-line code for count iterations starting at induction == start."""
+        unrolled = []
+        value = start
+        for _ in range(count):
+            for statement in statements:
+                if induction_step(statement, induction) is not None:
+                    value += step
+                else:
+                    unrolled.append(fold_statement(copy.deepcopy(statement), {induction: value}))
+        if count:
+            unrolled.append(Assign(make_variable(induction), make_number(value)))
+        return unrolled
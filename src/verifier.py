@@ -0,0 +1,122 @@
+from src.bytecode import (
+    OpCode, STACK_EFFECTS, TERMINATORS, JUMPS, basic_blocks, block_successors, analyze_stack,
+    variable_slots
+)
+
+
+def check_operands(bytecode):
+    """Check that every operand refers to something that exists."""
+    instructions = bytecode['instructions']
+    num_constants = len(bytecode['constants'])
+    num_variables = variable_slots(bytecode)
+
+    def check_index(index, limit, what, pc):
+        if not isinstance(index, int) or isinstance(index, bool) or not 0 <= index < limit:
+            raise Exception(f"Verification failed: instruction {pc} has invalid {what} {index!r}")
+
+    for pc, instruction in enumerate(instructions):
+        opcode = instruction.opcode
+        if opcode not in STACK_EFFECTS:
+            raise Exception(f"Verification failed: unknown opcode {opcode!r} at {pc}")
+        if opcode == OpCode.LOAD_CONST:
+            check_index(instruction.operand, num_constants, "constant index", pc)
+        elif opcode in (OpCode.LOAD_VAR, OpCode.STORE_VAR):
+            check_index(instruction.operand, num_variables, "variable index", pc)
+        elif opcode in JUMPS:
+            check_index(instruction.operand, len(instructions), "jump target", pc)
+        elif opcode == OpCode.BUILD_ARRAY:
+            count = instruction.operand
+            if not isinstance(count, int) or isinstance(count, bool) or count < 0:
+                raise Exception(f"Verification failed: instruction {pc} has invalid "
+                                f"element count {count!r}")
+        elif opcode == OpCode.FOR_RANGE:
+            if not isinstance(instruction.operand, tuple) or len(instruction.operand) != 2:
+                raise Exception(f"Verification failed: malformed for loop operand at {pc}")
+            check_index(instruction.operand[0], num_variables, "variable index", pc)
+            check_index(instruction.operand[1], len(instructions), "jump target", pc)
+        elif opcode == OpCode.CLOSED_FORM_LOOP:
+            if not isinstance(instruction.operand, tuple) or len(instruction.operand) != 6:
+                raise Exception(f"Verification failed: malformed loop descriptor at {pc}")
+            induction, step, relation, bound, accumulators, end = instruction.operand
+            check_index(induction, num_variables, "variable index", pc)
+            check_index(end, len(instructions), "jump target", pc)
+            operands = [bound] + [operand for _, _, operand in accumulators if operand is not None]
+            for kind, value in operands:
+                if kind == 'var':
+                    check_index(value, num_variables, "variable index", pc)
+            for index, _, _ in accumulators:
+                check_index(index, num_variables, "variable index", pc)
+
+
+def check_definite_assignment(bytecode, inputs=()):
+    """Return True if every variable is assigned on all paths before it is read.
+
+    inputs are the names of variables bound before the program starts.
+    """
+    instructions = bytecode['instructions']
+    blocks = basic_blocks(instructions)
+    initial = frozenset(bytecode['variables'][name] for name in inputs
+                        if name in bytecode['variables'])
+
+    successors = block_successors(instructions, blocks)
+
+    # Forward "must be assigned" dataflow: a block starts with the variables
+    # assigned on every path reaching it
+    entry_sets = {0: initial}
+    worklist = [0]
+    while worklist:
+        start = worklist.pop()
+        assigned = set(entry_sets[start])
+        for pc in range(start, blocks[start]):
+            if instructions[pc].opcode == OpCode.STORE_VAR:
+                assigned.add(instructions[pc].operand)
+        last = instructions[blocks[start] - 1]
+        for successor in successors[start]:
+            reaching = assigned
+            if last.opcode == OpCode.FOR_RANGE and successor == last.operand[1]:
+                # FOR_RANGE assigns the loop variable when it jumps into the body
+                reaching = assigned | {last.operand[0]}
+            if successor not in entry_sets:
+                entry_sets[successor] = frozenset(reaching)
+                worklist.append(successor)
+            else:
+                narrowed = entry_sets[successor] & reaching
+                if narrowed != entry_sets[successor]:
+                    entry_sets[successor] = narrowed
+                    worklist.append(successor)
+
+    for start, assigned in entry_sets.items():
+        assigned = set(assigned)
+        for pc in range(start, blocks[start]):
+            instruction = instructions[pc]
+            if instruction.opcode == OpCode.LOAD_VAR and instruction.operand not in assigned:
+                return False
+            if instruction.opcode == OpCode.STORE_VAR:
+                assigned.add(instruction.operand)
+    return True
+
+
+def verify(bytecode, inputs=()):
+    """Verify a compiled program before it is run.
+
+    Checks opcodes, constant and variable indices, jump targets, stack
+    balance and that execution cannot run past the last instruction, and
+    raises an exception if any of these is violated. Returns True if every
+    variable is also definitely assigned before it is read, in which case
+    the program may run on the VM loop without per-instruction checks, and
+    False if some read has to stay checked at runtime.
+    """
+    instructions = bytecode['instructions']
+    if not instructions or instructions[-1].opcode not in TERMINATORS:
+        raise Exception("Verification failed: program does not end with HALT or JUMP")
+
+    check_operands(bytecode)
+    try:
+        max_stack = analyze_stack(instructions)
+    except Exception as e:
+        raise Exception(f"Verification failed: {e}")
+    if bytecode.get('max_stack', max_stack) < max_stack:
+        raise Exception(f"Verification failed: declared stack depth {bytecode['max_stack']} "
+                        f"is less than the required {max_stack}")
+
+    return check_definite_assignment(bytecode, inputs)